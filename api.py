@@ -0,0 +1,148 @@
+import asyncio
+import functools
+import logic
+from catalog import SchemaCatalog, parse_catalog_sql
+from parser import parse_query_sql
+from ir import lower_query
+from sanity_checker import sanity_check
+from canonical import canonically_equivalent
+from falsifier import DEFAULT_BUDGET as FALSIFY_BUDGET, falsify
+from intervals import decide as decide_intervals
+from modes import INPUT_MODES, JOIN_MODES, NULL_MODES, STRING_MODES
+from metrics import Recorder, has_hooks
+from main import extract_counterexample
+
+# library API: check one pair and get a Result back, e.g.
+#   from api import check_equivalence
+#   result = check_equivalence(ddl, "SELECT ...", "SELECT ...", timeout=5, null_mode="flags")
+#   if not result.equivalent: print(result.verdict, result.counterexample)
+# nothing is printed and nothing exits: invalid or unsupported input raises one of the errors in
+# exceptions.py (all subclasses of EquivalenceError). Every call encodes and solves in its own
+# z3.Context and keeps its state in its own Encoder, so calls can run concurrently in threads,
+# e.g. from a ThreadPoolExecutor or with check_equivalence_async. z3 releases the GIL while it
+# solves, so the solver phases do run in parallel. As in main.py, z3 is only imported once a pair
+# gets to the encoder.
+
+# keyword options of check_equivalence and their defaults
+OPTIONS = {
+    "timeout": None,                 # seconds per solver call, None for no limit ("unknown" when it runs out)
+    "null_mode": "uf",               # modes.NULL_MODES
+    "join_mode": "uf",               # modes.JOIN_MODES
+    "input_mode": "separate",        # modes.INPUT_MODES
+    "string_mode": "strings",        # modes.STRING_MODES
+    "logic": "auto",                 # "auto", "none" or an SMT-LIB logic, see logic.py
+    "fast_path": True,               # try the canonical form comparison and the interval pre-solver first
+    "falsify_budget": FALSIFY_BUDGET,  # seconds for the sqlite falsifier, 0 turns it off
+    "stats": False,                  # attach the metrics report (see metrics.py) as Result.stats
+}
+
+
+class Result:
+    __slots__ = ("verdict", "counterexample", "fast_path", "logic", "message", "stats")
+
+    def __init__(self, verdict, counterexample=None, fast_path=None, logic=None, message=None, stats=None):
+        self.verdict = verdict                # "equivalent" | "counterexample" | "unknown"
+        self.counterexample = counterexample  # as in main.extract_counterexample or falsifier.falsify
+        self.fast_path = fast_path            # "canonical" | "intervals" | "falsifier" | None when the solver decided
+        self.logic = logic                    # the logic the solver ran in ("general" for none)
+        self.message = message                # why the solver gave up, for "unknown"
+        self.stats = stats                    # metrics report with stats=True
+
+    @property
+    def equivalent(self):
+        return self.verdict == "equivalent"
+
+    # the verdict dict main.verify returns for the same pair
+    def as_dict(self):
+        result = {"verdict": self.verdict}
+        for key in self.__slots__[1:]:
+            if getattr(self, key) is not None:
+                result[key] = getattr(self, key)
+        return result
+
+    def __repr__(self):
+        return f"Result({self.verdict}" + (f", fast_path={self.fast_path})" if self.fast_path else ")")
+
+
+# schema: the CREATE TABLE statements as a string, or a catalog.SchemaCatalog (parsed once and
+# shared between calls); sql1/sql2: the two queries. options: see OPTIONS
+def check_equivalence(schema, sql1, sql2, **options):
+    unknown = set(options) - set(OPTIONS)
+    if unknown:
+        raise TypeError(f"check_equivalence() got unexpected options: {', '.join(sorted(unknown))}")
+    options = {**OPTIONS, **options}
+    if options["null_mode"] not in NULL_MODES:
+        raise ValueError(f"null_mode must be one of {NULL_MODES}, not {options['null_mode']!r}")
+    if options["join_mode"] not in JOIN_MODES:
+        raise ValueError(f"join_mode must be one of {JOIN_MODES}, not {options['join_mode']!r}")
+    if options["input_mode"] not in INPUT_MODES:
+        raise ValueError(f"input_mode must be one of {INPUT_MODES}, not {options['input_mode']!r}")
+    if options["string_mode"] not in STRING_MODES:
+        raise ValueError(f"string_mode must be one of {STRING_MODES}, not {options['string_mode']!r}")
+
+    rec = Recorder()
+    result = check_recorded(rec, schema, sql1, sql2, options)
+    if options["stats"] or has_hooks():
+        report = rec.emit(result.verdict)
+        if options["stats"]:
+            result.stats = report
+    return result
+
+
+def check_recorded(rec, schema, sql1, sql2, options):
+    with rec.phase("parse"):
+        if not isinstance(schema, SchemaCatalog):
+            schema = parse_catalog_sql(schema)
+        q1_ast, q2_ast = parse_query_sql(sql1, "q1"), parse_query_sql(sql2, "q2")
+    with rec.phase("lower"):
+        q1, q2 = lower_query(q1_ast), lower_query(q2_ast)
+    with rec.phase("sanity"):
+        sanity_check(schema, q1, q2)
+
+    if options["fast_path"]:
+        with rec.phase("canonical"):
+            equivalent = canonically_equivalent(schema, q1_ast, q2_ast, q1.alias_map, q2.alias_map)
+        if equivalent:
+            return Result("equivalent", fast_path="canonical")
+        with rec.phase("intervals"):
+            verdict = decide_intervals(schema, q1, q2)
+        if verdict is not None:
+            return Result(verdict["verdict"], verdict.get("counterexample"), fast_path="intervals")
+    with rec.phase("falsify"):
+        cex = falsify(schema, q1_ast, q2_ast, q1, q2, options["falsify_budget"])
+    if cex is not None:
+        return Result("counterexample", cex, fast_path="falsifier")
+
+    with rec.phase("encode"):
+        import z3
+        from encoder import Encoder
+        enc = Encoder(schema, null_mode=options["null_mode"], join_mode=options["join_mode"],
+                      logic=options["logic"], ctx=z3.Context(), input_mode=options["input_mode"],
+                      string_mode=options["string_mode"])
+        s = enc.encode(q1, q2)
+    if options["stats"] or has_hooks():
+        rec.record_formula(s.assertions())
+        rec.extra["pruning"] = enc.pruning
+    timeout = options["timeout"]
+    if timeout is not None:
+        s.set("timeout", int(timeout * 1000))
+    with rec.phase("solve"):
+        check, s, info = logic.check(s, enc.solver_logic, timeout)
+    rec.record_solver(s)
+    rec.extra["logic"] = info
+
+    solved_in = info["logic"] or "general"
+    if check == z3.sat:
+        with rec.phase("model"):
+            cex = extract_counterexample(schema, s.model(), enc.declared, enc.string_ranks)
+        return Result("counterexample", cex, logic=solved_in)
+    if check == z3.unsat:
+        return Result("equivalent", logic=solved_in)
+    return Result("unknown", logic=solved_in, message=s.reason_unknown())
+
+
+# check_equivalence in a thread of `executor` (the event loop's default executor if None), e.g.
+#   results = await asyncio.gather(*(check_equivalence_async(ddl, q, rewrite) for rewrite in rewrites))
+async def check_equivalence_async(schema, sql1, sql2, executor=None, **options):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, functools.partial(check_equivalence, schema, sql1, sql2, **options))
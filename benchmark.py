@@ -0,0 +1,568 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from catalog import parse_catalog_sql
+from parser import parse_query_sql
+from ir import lower_query
+from sanity_checker import sanity_check
+from canonical import canonically_equivalent
+from falsifier import falsify
+from intervals import decide as decide_intervals
+import encoder
+import logic
+import modes
+from encoder import encode
+from exceptions import EquivalenceError
+from main import null_functions
+from z3 import *
+
+# benchmark suite: times every phase of the pipeline (parse, lower, sanity_check, canonical fast
+# path, interval pre-solver, falsifier, encode, solve) on
+#   - the pairs in test/ with the verdicts expected in note.txt ("known" suite)
+#   - synthetic pairs that scale along one dimension at a time ("synthetic" suite): predicate
+#     depth, number of joins (mixing INNER/LEFT/RIGHT/FULL), columns per table, column types and
+#     nullability
+# results are written as JSON, and can be compared against a baseline written by an earlier run:
+#   python benchmark.py --write-baseline bench-baseline.json
+#   python benchmark.py --baseline bench-baseline.json      # exits 1 if a case regressed
+# --null-encoding / --join-encoding / --logic pick the encoder's modes and the solver logic;
+# --compare-null-encodings, --compare-join-encodings and --compare-logics run the suite once per
+# mode and print the encode+solve times side by side
+# --cold-start times fresh `python main.py` processes instead: import time and time to verdict for
+# pairs sanity_check rejects (which should never load z3) and for a pair the solver decides
+
+BENCHMARK_VERSION = 1
+
+# (schema, query 1, query 2, expected verdict), from note.txt
+KNOWN_PAIRS = [
+    ("test/create-table.sql", "test/query1.sql", "test/query2.sql", "counterexample"),
+    ("test/create-table2.sql", "test/query3.sql", "test/query4.sql", "equivalent"),
+    ("test/create-table.sql", "test/join/inner_join.sql", "test/join/inner_join2.sql", "equivalent"),
+    ("test/create-table.sql", "test/join/left_join.sql", "test/join/left_join2.sql", "counterexample"),
+    ("test/create-table.sql", "test/join/left_join3.sql", "test/join/right_join2.sql", "equivalent"),
+    ("test/create-table.sql", "test/join/full_join.sql", "test/join/full_join2.sql", "equivalent"),
+    ("test/create-table.sql", "test/join/inner_join3.sql", "test/join/full_join3.sql", "equivalent"),
+    ("test/create-table.sql", "test/null/null1.sql", "test/null/null2.sql", "equivalent"),
+    ("test/create-table.sql", "test/null/null3.sql", "test/null/null4.sql", "equivalent"),
+    # Students.id is nullable in create-table.sql: a student with a NULL id is returned by null5
+    # and filtered out by null6 (found by the falsifier)
+    ("test/create-table.sql", "test/null/null5.sql", "test/null/null6.sql", "counterexample"),
+    ("test/null/create-table3.sql", "test/null/null7.sql", "test/null/null8.sql", "equivalent"),
+    ("test/join/create-table-abc.sql", "test/join/selectors1.sql", "test/join/selectors2.sql", "counterexample"),
+    ("test/join/create-table-abc.sql", "test/join/selectors3.sql", "test/join/selectors4.sql", "counterexample"),
+]
+
+DEFAULT_MODES = {"null_mode": "uf", "join_mode": "uf", "input_mode": "separate", "string_mode": "strings",
+                 "logic": "auto"}
+
+PHASES = ["parse", "lower", "sanity", "canonical", "intervals", "falsify", "encode", "solve"]
+
+
+# ---------------------------------------------------------------------------------------------
+# running a case
+
+# runs the pipeline once on a pair and returns {"verdict", "phases": {phase: seconds}}, plus the
+# number of distinct AST nodes of the formula ("nodes") when it got to the solver
+def run_case(schema_sql, q1_sql, q2_sql, fast_path=True):
+    phases = {}
+    clock = time.perf_counter()
+
+    def lap(phase):
+        nonlocal clock
+        now = time.perf_counter()
+        phases[phase] = now - clock
+        clock = now
+
+    try:
+        schema = parse_catalog_sql(schema_sql)
+        q1_ast, q2_ast = parse_query_sql(q1_sql, "q1"), parse_query_sql(q2_sql, "q2")
+        lap("parse")
+        q1, q2 = lower_query(q1_ast), lower_query(q2_ast)
+        lap("lower")
+        sanity_check(schema, q1, q2)
+        lap("sanity")
+        if fast_path:
+            equivalent = canonically_equivalent(schema, q1_ast, q2_ast, q1.alias_map, q2.alias_map)
+            lap("canonical")
+            if equivalent:
+                return {"verdict": "equivalent", "fast_path": True, "phases": phases}
+            verdict = decide_intervals(schema, q1, q2)
+            lap("intervals")
+            if verdict is not None:
+                return {"verdict": verdict["verdict"], "fast_path": True, "phases": phases}
+            cex = falsify(schema, q1_ast, q2_ast, q1, q2)
+            lap("falsify")
+            if cex is not None:
+                return {"verdict": "counterexample", "fast_path": True, "phases": phases}
+        s = encode(schema, q1, q2, null_functions(), schema.not_null)
+        lap("encode")
+        result, _, info = logic.check(s, encoder.current.solver_logic)
+        lap("solve")
+    except EquivalenceError as e:
+        return {"verdict": "error", "message": str(e), "phases": phases}
+
+    solved = {"logic": info["logic"] or "general", "nodes": encoder.current.pruning["after"]["nodes"], "phases": phases}
+    if result == sat:
+        return {"verdict": "counterexample", **solved}
+    if result == unsat:
+        return {"verdict": "equivalent", **solved}
+    return {"verdict": "unknown", **solved}
+
+
+# runs a case `repeat` times and keeps the median time of every phase
+def measure(case, repeat, fast_path=True):
+    runs = [run_case(case["schema"], case["q1"], case["q2"], fast_path) for _ in range(repeat)]
+    phases = {p: statistics.median(r["phases"].get(p, 0.0) for r in runs) for p in PHASES}
+    result = {
+        "verdict": runs[0]["verdict"],
+        "expected": case.get("expected"),
+        "phases": {p: round(t, 6) for p, t in phases.items()},
+        "total": round(sum(phases.values()), 6),
+    }
+    if runs[0].get("fast_path"):
+        result["fast_path"] = True
+    for key in ["logic", "nodes"]:
+        if key in runs[0]:
+            result[key] = runs[0][key]
+    if "message" in runs[0]:
+        result["message"] = runs[0]["message"]
+    if "params" in case:
+        result["params"] = case["params"]
+    return result
+
+
+def known_cases():
+    cases = {}
+    for schema_file, q1_file, q2_file, expected in KNOWN_PAIRS:
+        name = f"{q1_file.removeprefix('test/')}~{q2_file.removeprefix('test/')}"
+        cases[name] = {"schema": read(schema_file), "q1": read(q1_file), "q2": read(q2_file),
+                       "expected": expected}
+    return cases
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+# ---------------------------------------------------------------------------------------------
+# synthetic pairs
+#
+# tables T0..Tn, each with an INT key column c0 (never NULL) and `columns`-1 more columns whose
+# types are drawn from `types` and which are nullable with probability `nullable`. Query 1 joins
+# the tables in a chain on their keys, with the join types taken in turn from `join_types` (or
+# for outer_joins=n, n joins taking turns at LEFT/RIGHT/FULL), and
+# filters on a random AND/OR tree of comparisons and IS NULL tests of the given depth.
+# Query 2 is an equivalent rewrite the canonical fast path doesn't see through (see rewrite), or with mutate=True a copy where one constant
+# has been changed, which is usually (not always) a counterexample, so its verdict is not checked.
+
+SYNTHETIC_BASE = {"depth": 3, "joins": 1, "columns": 4, "types": ["INT", "REAL", "TEXT"],
+                  "nullable": 0.5, "join_types": ["INNER", "LEFT", "RIGHT", "FULL"], "mutate": False,
+                  "outer_joins": 0}
+
+# the default sweep: one dimension at a time, the others at SYNTHETIC_BASE
+SYNTHETIC_SWEEP = {
+    "depth": [1, 3, 5, 7],
+    "joins": [0, 1, 2, 3],
+    "columns": [4, 16, 64],
+    "types": [["INT"], ["REAL"], ["TEXT"], ["INT", "REAL", "TEXT"]],
+    "nullable": [0.0, 0.5, 1.0],
+    "mutate": [False, True],
+    "outer_joins": [5, 10],
+}
+
+
+def generate_pair(seed=0, **params):
+    params = {**SYNTHETIC_BASE, **params}
+    if params["outer_joins"]:
+        params["joins"], params["join_types"] = params["outer_joins"], ["LEFT", "RIGHT", "FULL"]
+    rng = random.Random(seed)
+    tables = []
+    for t in range(params["joins"] + 1):
+        columns = [("c0", "INT", False)]
+        for c in range(1, params["columns"]):
+            columns.append((f"c{c}", rng.choice(params["types"]), rng.random() < params["nullable"]))
+        tables.append((f"T{t}", columns))
+
+    schema_sql = "\n".join(
+        f"CREATE TABLE {name} (" + ", ".join(
+            f"{col} {sql_type(ctype)}" + ("" if nullable else " NOT NULL") for col, ctype, nullable in columns
+        ) + ");" for name, columns in tables)
+
+    from_sql = "T0"
+    for t in range(1, len(tables)):
+        join_type = params["join_types"][(t - 1) % len(params["join_types"])]
+        from_sql += f" {join_type} JOIN T{t} ON T{t - 1}.c0 = T{t}.c0"
+
+    if params["depth"] >= 3:
+        # an AND over an OR at the root, so there is always something for rewrite to distribute
+        depth = params["depth"] - 1
+        where = ("and", random_predicate(rng, tables, depth), random_predicate(rng, tables, depth, "or"))
+    else:
+        where = random_predicate(rng, tables, params["depth"])
+    q1_sql = f"SELECT T0.c0 FROM {from_sql} WHERE {to_sql(where)}"
+    if params["mutate"]:
+        q2_where = mutate(rng, where)
+    else:
+        q2_where = rewrite(where)
+    q2_sql = f"SELECT T0.c0 FROM {from_sql} WHERE {to_sql(q2_where)}"
+    return {"schema": schema_sql, "q1": q1_sql, "q2": q2_sql,
+            "expected": None if params["mutate"] else "equivalent"}
+
+
+def sql_type(ctype):
+    return {"INT": "INT", "REAL": "FLOAT", "TEXT": "TEXT"}[ctype]
+
+
+# predicate trees: ("and"|"or", l, r) | ("cmp", column, type, op, value) | ("is_null", column)
+def random_predicate(rng, tables, depth, op=None):
+    if depth <= 1:
+        name, columns = rng.choice(tables)
+        col, ctype, nullable = rng.choice(columns)
+        column = f"{name}.{col}"
+        if nullable and rng.random() < 0.2:
+            return ("is_null", column)
+        if ctype == "INT":
+            return ("cmp", column, ctype, rng.choice([">", "<", "=", ">=", "<="]), rng.randint(0, 20))
+        if ctype == "REAL":
+            return ("cmp", column, ctype, rng.choice([">", "<"]), round(rng.uniform(0, 20), 1))
+        return ("cmp", column, ctype, "=", f"v{rng.randint(0, 5)}")
+    op = op or rng.choice(["and", "or"])
+    return (op, random_predicate(rng, tables, depth - 1), random_predicate(rng, tables, depth - 1))
+
+
+def to_sql(pred):
+    if pred[0] in ["and", "or"]:
+        return f"({to_sql(pred[1])} {pred[0].upper()} {to_sql(pred[2])})"
+    if pred[0] == "is_null":
+        return f"{pred[1]} IS NULL"
+    _, column, ctype, op, value = pred
+    return f"{column} {op} " + (f"'{value}'" if ctype == "TEXT" else str(value))
+
+
+# an equivalent predicate: AND is distributed over OR, a AND (b OR c) -> (a AND b) OR (a AND c),
+# and comparisons on INT columns are rewritten with their integer neighbours:
+# x > k -> x >= k + 1,  x < k -> x <= k - 1,  x = k -> x >= k AND x <= k
+def rewrite(pred):
+    if pred[0] == "and":
+        left, right = rewrite(pred[1]), rewrite(pred[2])
+        if right[0] == "or":
+            return ("or", ("and", left, right[1]), ("and", left, right[2]))
+        if left[0] == "or":
+            return ("or", ("and", left[1], right), ("and", left[2], right))
+        return ("and", left, right)
+    if pred[0] == "or":
+        return ("or", rewrite(pred[1]), rewrite(pred[2]))
+    if pred[0] == "cmp" and pred[2] == "INT":
+        _, column, ctype, op, value = pred
+        if op == ">":
+            return ("cmp", column, ctype, ">=", value + 1)
+        if op == "<":
+            return ("cmp", column, ctype, "<=", value - 1)
+        if op == "=":
+            return ("and", ("cmp", column, ctype, ">=", value), ("cmp", column, ctype, "<=", value))
+    return pred
+
+
+# the same predicate with the constant of one comparison changed
+def mutate(rng, pred):
+    if pred[0] in ["and", "or"]:
+        if rng.random() < 0.5:
+            return (pred[0], mutate(rng, pred[1]), pred[2])
+        return (pred[0], pred[1], mutate(rng, pred[2]))
+    if pred[0] == "cmp":
+        _, column, ctype, op, value = pred
+        return ("cmp", column, ctype, op, value + "x" if ctype == "TEXT" else value + 1)
+    return pred
+
+
+def synthetic_cases(seed=0):
+    cases = {}
+    for dimension, values in SYNTHETIC_SWEEP.items():
+        for value in values:
+            label = "+".join(value) if isinstance(value, list) else value
+            case = generate_pair(seed, **{dimension: value})
+            case["params"] = {dimension: value}
+            cases[f"synthetic/{dimension}={label}"] = case
+    return cases
+
+
+# ---------------------------------------------------------------------------------------------
+# join scaling
+#
+# inner join graphs over T0..Tn-1 shaped as a chain (every table joined to the previous one) or a
+# star (every table joined to T0), followed by a LEFT JOIN of one more table, Tn. Query 1 writes
+# the inner joins as JOIN ... ON in table order, query 2 lists the same tables shuffled as comma
+# joins with the join conditions in WHERE. The pairs are equivalent; the canonical fast path should
+# see that at every size (see joingraph.py), and without it the solver has to.
+
+JOIN_SCALING_SIZES = [2, 5, 10, 15, 20]
+
+
+def join_scaling_pair(shape, n, seed=0):
+    rng = random.Random(seed)
+    schema_sql = "\n".join(f"CREATE TABLE T{t} (id INT NOT NULL, fk INT, v INT);" for t in range(n + 1))
+    edges = [(t - 1 if shape == "chain" else 0, t) for t in range(1, n)]
+    conditions = [f"T{a}.id = T{b}.fk" for a, b in edges]
+    select = f"SELECT T0.id, T{n}.v FROM "
+    outer = f" LEFT JOIN T{n} ON T{n}.fk = T0.id WHERE T0.v > 3"
+
+    q1_sql = select + "T0" + "".join(f" JOIN T{b} ON {c}" for (_, b), c in zip(edges, conditions)) + outer
+    order = list(range(n))
+    rng.shuffle(order)
+    rng.shuffle(conditions)
+    q2_sql = select + ", ".join(f"T{t}" for t in order) + outer + "".join(f" AND {c}" for c in conditions)
+    return {"schema": schema_sql, "q1": q1_sql, "q2": q2_sql, "expected": "equivalent",
+            "params": {"shape": shape, "tables": n}}
+
+
+# every shape and size with and without the fast path: {"shape/n": {"fast_path": ..., "solver": ...}}
+def join_scaling(repeat=3, sizes=JOIN_SCALING_SIZES, seed=0):
+    null_functions()
+    results = {}
+    print(f"{'case':15} {'fast path':>24} {'solver':>24} {'nodes':>7}", file=sys.stderr)
+    for shape in ["chain", "star"]:
+        for n in sizes:
+            case = join_scaling_pair(shape, n, seed)
+            fast, solver = measure(case, repeat, True), measure(case, repeat, False)
+            results[f"{shape}/{n}"] = {"fast_path": fast, "solver": solver}
+            print(f"{shape + '/' + str(n):15} {fast['total'] * 1000:9.2f} ms "
+                  f"{'(canonical)' if fast.get('fast_path') else '(' + fast['verdict'] + ')':>12} "
+                  f"{solver['total'] * 1000:9.2f} ms {solver['verdict']:>12} {solver.get('nodes', '-'):>7}",
+                  file=sys.stderr)
+    return results
+
+
+# ---------------------------------------------------------------------------------------------
+# cold start
+
+# run in a fresh interpreter: imports main, runs it on the files given as arguments (if any) and
+# prints {"import": seconds, "total": seconds, "z3": whether z3 got loaded} as JSON
+COLD_START_SCRIPT = """
+import io, json, sys, time
+from contextlib import redirect_stdout
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+if len(sys.argv) > 1:
+    sys.argv = ["main.py"] + sys.argv[1:]
+    try:
+        with redirect_stdout(io.StringIO()):
+            main.main()
+    except main.EquivalenceError:
+        pass
+print(json.dumps({"import": imported - start, "total": time.perf_counter() - start, "z3": "z3" in sys.modules}))
+"""
+
+# name -> (schema file, query 1, query 2): SQL text, or a path to an existing file
+COLD_START_CASES = {
+    "import only": None,
+    "rejected: columns": ("test/create-table.sql", "SELECT id FROM Students", "SELECT name FROM Students"),
+    "rejected: tables": ("test/create-table.sql", "SELECT Students.id FROM Students",
+                         "SELECT Students.id FROM Students, Takes WHERE Students.id = Takes.sid"),
+    "rejected: GROUP BY": ("test/create-table.sql", "SELECT id FROM Students GROUP BY id", "SELECT id FROM Students"),
+    "solved": ("test/create-table.sql", "test/join/left_join3.sql", "test/join/right_join2.sql"),
+}
+
+
+# median over `repeat` fresh processes per case: {"import", "total", "process", "z3"} (seconds;
+# "process" includes the interpreter's own startup)
+def cold_start(repeat=5):
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, case in COLD_START_CASES.items():
+            argv = []
+            if case is not None:
+                for i, item in enumerate(case):
+                    if not item.endswith(".sql"):
+                        path = os.path.join(tmp, f"q{i}.sql")
+                        with open(path, "w") as f:
+                            f.write(item)
+                        item = path
+                    argv.append(item)
+            runs = []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                out = subprocess.run([sys.executable, "-c", COLD_START_SCRIPT] + argv, cwd=here,
+                                     capture_output=True, text=True, check=True).stdout
+                run = json.loads(out.strip().splitlines()[-1])
+                run["process"] = time.perf_counter() - start
+                runs.append(run)
+            result = {key: statistics.median(run[key] for run in runs) for key in ["import", "total", "process"]}
+            result["z3"] = any(run["z3"] for run in runs)
+            results[name] = result
+            print(f"{name:25} import {result['import'] * 1000:8.2f} ms  verdict {result['total'] * 1000:8.2f} ms  "
+                  f"process {result['process'] * 1000:8.2f} ms  z3 {'loaded' if result['z3'] else 'not loaded'}",
+                  file=sys.stderr)
+    return results
+
+
+# ---------------------------------------------------------------------------------------------
+# baseline comparison
+
+# a case regressed when its total time grew by more than `threshold` (relative) and by more than
+# `min_delta` seconds, the latter so that sub-millisecond noise doesn't fail the gate.
+# A verdict that differs from the expected one is always reported
+def compare(results, baseline, threshold, min_delta):
+    problems = []
+    for name, result in results["cases"].items():
+        if result["expected"] is not None and result["verdict"] != result["expected"]:
+            problems.append(f"{name}: verdict {result['verdict']}, expected {result['expected']}")
+        base = baseline.get("cases", {}).get(name)
+        if base is None:
+            continue
+        limit = max(base["total"] * (1 + threshold), base["total"] + min_delta)
+        if result["total"] > limit:
+            problems.append(f"{name}: {result['total']:.4f}s vs baseline {base['total']:.4f}s "
+                            f"(+{(result['total'] / base['total'] - 1) * 100:.0f}%)")
+    return problems
+
+
+# settings: encoder/solver modes, DEFAULT_MODES by default
+def run(suite="all", repeat=3, fast_path=True, seed=0, only=None, settings=None):
+    settings = {**DEFAULT_MODES, **(settings or {})}
+    cases = {}
+    if suite in ["known", "all"]:
+        cases.update(known_cases())
+    if suite in ["synthetic", "all"]:
+        cases.update(synthetic_cases(seed))
+    if only:
+        cases = {name: case for name, case in cases.items() if only in name}
+
+    null_functions()  # declared once, not part of the first case
+    modes.NULL_MODE, modes.JOIN_MODE, logic.LOGIC = settings["null_mode"], settings["join_mode"], settings["logic"]
+    modes.INPUT_MODE, modes.STRING_MODE = settings["input_mode"], settings["string_mode"]
+    results = {"version": BENCHMARK_VERSION, "repeat": repeat, "fast_path": fast_path, **settings, "cases": {}}
+    for name, case in cases.items():
+        result = measure(case, repeat, fast_path)
+        results["cases"][name] = result
+        print(f"{name:45} {result['verdict']:15} {result['total'] * 1000:9.2f} ms  "
+              + " ".join(f"{p}={result['phases'][p] * 1000:.2f}" for p in PHASES), file=sys.stderr)
+    return results
+
+
+# encode+solve time (and formula size, when the case got to the solver) per case under each mode,
+# relative to the first mode
+def compare_modes(runs):
+    first, *others = runs
+    print(f"{'case':45} " + " ".join(f"{mode:>12}" for mode in runs) + "  verdicts", file=sys.stderr)
+    totals = dict.fromkeys(runs, 0.0)
+    nodes = dict.fromkeys(runs, 0)
+    for name in runs[first]["cases"]:
+        cases = {mode: runs[mode]["cases"][name] for mode in runs}
+        times = {mode: case["phases"]["encode"] + case["phases"]["solve"] for mode, case in cases.items()}
+        for mode in runs:
+            totals[mode] += times[mode]
+        verdicts = {case["verdict"] for case in cases.values()}
+        for mode, case in cases.items():
+            nodes[mode] += case.get("nodes", 0)
+        print(f"{name:45} " + " ".join(f"{times[mode] * 1000:9.2f} ms" for mode in runs)
+              + "  nodes " + "/".join(str(case.get("nodes", "-")) for case in cases.values())
+              + ("  same" if len(verdicts) == 1 else "  DIFFER: " + ", ".join(c["verdict"] for c in cases.values())),
+              file=sys.stderr)
+    print(f"{'total':45} " + " ".join(f"{totals[mode] * 1000:9.2f} ms" for mode in runs)
+          + "  nodes " + "/".join(str(nodes[mode]) for mode in runs), file=sys.stderr)
+    for mode in others:
+        if totals[first]:
+            print(f"{mode} vs {first}: {totals[mode] / totals[first]:.2f}x time", file=sys.stderr)
+        if nodes[first]:
+            print(f"{mode} vs {first}: {nodes[mode] / nodes[first]:.2f}x nodes", file=sys.stderr)
+
+
+def parse_args(argv):
+    ap = argparse.ArgumentParser(usage="python benchmark.py [options]")
+    ap.add_argument("--suite", choices=["known", "synthetic", "all"], default="all")
+    ap.add_argument("--only", metavar="TEXT", help="only run the cases whose name contains TEXT")
+    ap.add_argument("--repeat", type=int, default=3, help="runs per case, the median time is kept")
+    ap.add_argument("--seed", type=int, default=0, help="seed of the synthetic generator")
+    ap.add_argument("--no-fast-path", action="store_true",
+                    help="always encode and solve, skip the canonical fast path and the falsifier")
+    ap.add_argument("--null-encoding", choices=modes.NULL_MODES, default="uf", help="NULL encoding of the encoder")
+    ap.add_argument("--join-encoding", choices=modes.JOIN_MODES, default="uf", help="outer join encoding of the encoder")
+    ap.add_argument("--compare-null-encodings", action="store_true",
+                    help="run the suite under every NULL encoding and compare encode+solve times")
+    ap.add_argument("--compare-join-encodings", action="store_true",
+                    help="run the suite under every outer join encoding and compare encode+solve times")
+    ap.add_argument("--input-encoding", choices=modes.INPUT_MODES, default="separate",
+                    help="input variables of the encoder")
+    ap.add_argument("--compare-input-encodings", action="store_true",
+                    help="run the suite with separate and with shared input variables and compare encode+solve "
+                         "times and formula sizes")
+    ap.add_argument("--string-encoding", choices=modes.STRING_MODES, default="strings",
+                    help="TEXT column encoding of the encoder")
+    ap.add_argument("--compare-string-encodings", action="store_true",
+                    help="run the suite with z3 strings and with integer ranks for TEXT columns and compare "
+                         "encode+solve times")
+    ap.add_argument("--logic", default="auto", help="solver logic: auto, none or an SMT-LIB logic (see logic.py)")
+    ap.add_argument("--compare-logics", action="store_true",
+                    help="run the suite with the detected logic and with the general solver and compare encode+solve times")
+    ap.add_argument("--cold-start", action="store_true",
+                    help="time fresh main.py processes: import time and time to verdict for rejected and solved pairs")
+    ap.add_argument("--join-scaling", action="store_true",
+                    help="chain and star joins of 2 to 20 tables, written in different orders, with and without the fast path")
+    ap.add_argument("--output", metavar="JSON", help="write the results here")
+    ap.add_argument("--write-baseline", metavar="JSON", help="write the results as the new baseline")
+    ap.add_argument("--baseline", metavar="JSON", help="compare against this baseline, exit 1 on regressions")
+    ap.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown per case (default 0.25)")
+    ap.add_argument("--min-delta", type=float, default=0.005,
+                    help="slowdowns below this many seconds are never reported (default 0.005)")
+    return ap.parse_args(argv)
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+    if args.cold_start or args.join_scaling:
+        results = cold_start(args.repeat) if args.cold_start else join_scaling(args.repeat, seed=args.seed)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+        return
+    settings = {"null_mode": args.null_encoding, "join_mode": args.join_encoding, "input_mode": args.input_encoding,
+                "string_mode": args.string_encoding, "logic": args.logic}
+    compared = None
+    if args.compare_null_encodings:
+        compared = "null_mode", modes.NULL_MODES
+    elif args.compare_join_encodings:
+        compared = "join_mode", modes.JOIN_MODES
+    elif args.compare_input_encodings:
+        compared = "input_mode", modes.INPUT_MODES
+    elif args.compare_string_encodings:
+        compared = "string_mode", modes.STRING_MODES
+    elif args.compare_logics:
+        compared = "logic", ["none", "auto"]
+    if compared:
+        key, values = compared
+        runs = {value: run(args.suite, args.repeat, not args.no_fast_path, args.seed, args.only, {**settings, key: value})
+                for value in values}
+        compare_modes(runs)
+        if args.output:
+            with open(args.output, "w") as f:
+                json.dump(runs, f, indent=2)
+        return
+    results = run(args.suite, args.repeat, not args.no_fast_path, args.seed, args.only, settings)
+
+    for path in [args.output, args.write_baseline]:
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    problems = compare(results, baseline, args.threshold, args.min_delta)
+    for problem in problems:
+        print(f"REGRESSION {problem}", file=sys.stderr)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import math
+import sqlite3
+import time
+
+# on-disk cache of verdicts, so pairs that were already verified (e.g. on a previous CI run)
+# skip encode() and s.check() entirely.
+#
+# key = hash(schema fingerprint, canonical SQL of both queries in sorted order), so
+#   - swapping q1 and q2 hits the same entry (the stored q1/q2 results are flipped back on read)
+#   - any change to the schema, including NOT NULL attributes, changes the key. When a pair is
+#     re-verified under a new schema, the entries for the old schema are dropped.
+# eviction is LRU by last use, bounded by max_entries and max_age (seconds).
+
+# bump this whenever the encoding changes in a way that can change verdicts
+CACHE_VERSION = 1
+
+
+# the encoding modes that differ from the defaults (modes.encoding_options) are part of it, since
+# the modes can disagree on a verdict; with the defaults existing entries stay valid
+def schema_fingerprint(schema, not_null, encoding=None):
+    normalized = {
+        "schema": {table: dict(cols) for table, cols in schema.items()},
+        "not_null": {table: sorted(cols) for table, cols in not_null.items()},
+    }
+    if encoding:
+        normalized["encoding"] = encoding
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+
+
+def canonical_sql(ast):
+    # sqlglot regenerates the query from the AST, so whitespace, keyword case and comments don't matter
+    return ast.sql(comments=False)
+
+
+class VerdictCache:
+    def __init__(self, path, max_entries=100000, max_age=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self.db = sqlite3.connect(path, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            " key TEXT PRIMARY KEY, pair TEXT NOT NULL, schema_hash TEXT NOT NULL,"
+            " verdict TEXT NOT NULL, counterexample TEXT,"
+            " created REAL NOT NULL, last_used REAL NOT NULL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS verdicts_last_used ON verdicts (last_used)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS verdicts_pair ON verdicts (pair)")
+        self.db.commit()
+
+    # returns (key, pair hash, swapped) for a pair; swapped tells whether q2 sorts before q1
+    def make_key(self, schema_hash, q1_ast, q2_ast):
+        pair, swapped = self.pair_key(q1_ast, q2_ast)
+        key = hashlib.sha256(f"{CACHE_VERSION}\0{schema_hash}\0{pair}".encode()).hexdigest()
+        return key, pair, swapped
+
+    def pair_key(self, q1_ast, q2_ast):
+        sql1, sql2 = canonical_sql(q1_ast), canonical_sql(q2_ast)
+        swapped = sql2 < sql1
+        first, second = (sql2, sql1) if swapped else (sql1, sql2)
+        return hashlib.sha256(f"{first}\0{second}".encode()).hexdigest(), swapped
+
+    def get(self, schema_hash, q1_ast, q2_ast):
+        key, _, swapped = self.make_key(schema_hash, q1_ast, q2_ast)
+        # an entry older than max_age is as good as evicted, even if no put has removed it yet
+        oldest = -math.inf if self.max_age is None else time.time() - self.max_age
+        row = self.db.execute("SELECT verdict, counterexample FROM verdicts WHERE key = ? AND last_used >= ?",
+                              (key, oldest)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.db.execute("UPDATE verdicts SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.db.commit()
+
+        result = {"verdict": row[0], "cached": True}
+        if row[1] is not None:
+            result["counterexample"] = unflip(json.loads(row[1]), swapped)
+        return result
+
+    def put(self, schema_hash, q1_ast, q2_ast, result):
+        # only definite answers are worth keeping, errors and timeouts are re-run
+        if result["verdict"] not in ["equivalent", "counterexample"]:
+            return
+        key, pair, swapped = self.make_key(schema_hash, q1_ast, q2_ast)
+        cex = result.get("counterexample")
+        cex = json.dumps(unflip(cex, swapped)) if cex is not None else None
+        now = time.time()
+
+        # the same pair verified under another schema: the old verdicts are stale
+        cur = self.db.execute("DELETE FROM verdicts WHERE pair = ? AND schema_hash != ?", (pair, schema_hash))
+        self.invalidations += cur.rowcount
+        self.db.execute(
+            "INSERT OR REPLACE INTO verdicts (key, pair, schema_hash, verdict, counterexample, created, last_used)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)", (key, pair, schema_hash, result["verdict"], cex, now, now))
+        self.evict(now)
+        self.db.commit()
+
+    def evict(self, now=None):
+        now = time.time() if now is None else now
+        if self.max_age is not None:
+            cur = self.db.execute("DELETE FROM verdicts WHERE last_used < ?", (now - self.max_age,))
+            self.evictions += cur.rowcount
+        if self.max_entries is not None:
+            cur = self.db.execute(
+                "DELETE FROM verdicts WHERE key IN (SELECT key FROM verdicts ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,))
+            self.evictions += cur.rowcount
+
+    def stats(self):
+        entries = self.db.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "invalidations": self.invalidations, "entries": entries}
+
+    def close(self):
+        self.db.close()
+
+
+# counterexamples are stored in canonical pair order, flip q1/q2 when the pair was swapped
+def unflip(cex, swapped):
+    if not swapped:
+        return cex
+    cex = dict(cex)
+    if "database" in cex:  # found by the falsifier
+        cex["q1_rows"], cex["q2_rows"] = cex["q2_rows"], cex["q1_rows"]
+    else:
+        cex["q1_result"], cex["q2_result"] = cex["q2_result"], cex["q1_result"]
+    return cex
@@ -0,0 +1,264 @@
+from fractions import Fraction
+from sqlglot import expressions as exp
+from joingraph import join_steps, liftable
+
+# solver-free fast path: bring both queries into a canonical form and compare them syntactically.
+# The canonical form
+#   - resolves aliases to the real table names
+#   - flattens AND/OR and sorts (and dedups) their operands, removes double negation and pushes
+#     NOT into comparisons (NOT a < b  ->  a >= b, which also holds under three-valued logic)
+#   - rewrites arithmetic comparisons as a normalized linear form  c1*x1 + ... + k  (<|<=|=)  0,
+#     so "a < b" / "b > a" / "a - b < 0" and "price - 3.0 = 120" / "price - 41 = 41 * 2" coincide
+#   - sorts the tables of every block of inner joins and moves their ON conditions into the WHERE
+#     conjunction, unless a later RIGHT/FULL JOIN can null-extend them (see joingraph.py)
+# If the two canonical forms are identical the queries are equivalent, otherwise nothing is concluded
+# and the pair goes to the solver as usual.
+
+# how often the fast path was tried / answered, see fast_path_stats()
+stats = {"checked": 0, "hits": 0}
+
+
+def fast_path_stats():
+    return dict(stats)
+
+
+# true if q1 and q2 have the same canonical form. Expects queries that passed sanity_check
+def canonically_equivalent(schema, q1_ast, q2_ast, q1_alias_map, q2_alias_map):
+    stats["checked"] += 1
+    c1 = canonicalize(schema, q1_ast, q1_alias_map)
+    c2 = canonicalize(schema, q2_ast, q2_alias_map)
+    if c1 is None or c2 is None or c1 != c2:
+        return False
+    stats["hits"] += 1
+    return True
+
+
+class NotCanonical(Exception):
+    pass
+
+
+# canonical form of a whole query as a nested tuple, None if it uses something we don't canonicalize
+def canonicalize(schema, ast, alias_map):
+    try:
+        return canonical_query(schema, ast, alias_map)
+    except NotCanonical:
+        return None
+
+
+def canonical_query(schema, ast, alias_map):
+    projections = []
+    for expr in ast.expressions:
+        if isinstance(expr, exp.Star):
+            for table in alias_map.values():
+                projections += [f"{table}.{col}" for col in schema[table]]
+        elif isinstance(expr, exp.Alias):
+            projections.append(f"{expr.alias}={canonical_expr(expr.this, alias_map)}")
+        else:
+            projections.append(canonical_expr(expr, alias_map))
+
+    from_clause = ast.args.get("from") or ast.args.get("from_")
+    if from_clause is None or not isinstance(from_clause.this, exp.Table):
+        raise NotCanonical()
+    first_table = resolve_table(from_clause.this, alias_map)
+
+    joins = ast.args.get("joins") or []
+    conjuncts = []
+    where = ast.args.get("where")
+    if where is not None:
+        conjuncts += flatten(where.this, exp.And)
+
+    for join in joins:
+        # USING and NATURAL joins compare columns the ON clause doesn't name
+        if join.args.get("using") or "NATURAL" in [join.args.get("method"), join.args.get("kind")]:
+            raise NotCanonical()
+        if not isinstance(join.this, exp.Table):
+            raise NotCanonical()
+    # columns are canonicalized by table, which can't tell the aliases of a self-join apart
+    tables = [first_table] + [resolve_table(join.this, alias_map) for join in joins]
+    if len(set(tables)) != len(tables):
+        raise NotCanonical()
+    steps = join_steps(first_table, [(resolve_table(join.this, alias_map), join.side, join.args.get("on"))
+                                     for join in joins])
+    join_list = []
+    for i, (kind, tables, on) in enumerate(steps):
+        if kind != "inner":
+            on_canon = canonical_condition(on, schema, alias_map) if on is not None else None
+            join_list.append((kind.upper(), tables, on_canon))
+            continue
+        # within a block of inner joins neither the order of the tables nor whether a condition
+        # sits in ON or in WHERE matters, as long as no later RIGHT/FULL JOIN can null-extend them
+        on_conjuncts = [c for cond in on for c in flatten(cond, exp.And)]
+        if liftable(steps, i):
+            conjuncts += on_conjuncts
+            on_canon = ()
+        else:
+            on_canon = set()
+            for c in on_conjuncts:
+                on_canon |= canonical_operands(c, schema, alias_map, True)
+            on_canon = tuple(sorted(on_canon))
+        join_list.append(("INNER", tuple(sorted(tables)), on_canon))
+
+    where_canon = set()
+    for c in conjuncts:
+        where_canon |= canonical_operands(c, schema, alias_map, True)
+    where_canon = tuple(sorted(where_canon))
+    limit = ast.args.get("limit")
+    offset = ast.args.get("offset")
+    return (tuple(projections), tuple(join_list), where_canon,
+            limit.sql() if limit else None, offset.sql() if offset else None)
+
+
+def resolve_table(table_expr, alias_map):
+    return alias_map.get(table_expr.alias_or_name, table_expr.name)
+
+
+def flatten(expr, kind):
+    expr = unparen(expr)
+    if isinstance(expr, kind):
+        return flatten(expr.this, kind) + flatten(expr.expression, kind)
+    return [expr]
+
+
+def unparen(expr):
+    while isinstance(expr, exp.Paren):
+        expr = expr.this
+    return expr
+
+
+# ---------------------------------------------------------------------------------------------
+# conditions
+
+COMPARISONS = {exp.GT: "gt", exp.LT: "lt", exp.GTE: "gte", exp.LTE: "lte", exp.EQ: "eq", exp.NEQ: "neq"}
+NEGATED = {"gt": "lte", "lt": "gte", "gte": "lt", "lte": "gt", "eq": "neq", "neq": "eq"}
+# a > b is b < a, a >= b is b <= a
+FLIPPED = {"gt": "lt", "gte": "lte"}
+
+
+def canonical_condition(expr, schema, alias_map, negate=False):
+    expr = unparen(expr)
+
+    if isinstance(expr, exp.Not):
+        return canonical_condition(expr.this, schema, alias_map, not negate)
+
+    if isinstance(expr, (exp.And, exp.Or)):
+        # De Morgan holds in three-valued logic as well
+        is_and = isinstance(expr, exp.And) != negate
+        operands = sorted(canonical_operands(expr, schema, alias_map, is_and, negate))
+        if len(operands) == 1:
+            return operands[0]
+        return ("AND(" if is_and else "OR(") + ", ".join(operands) + ")"
+
+    if type(expr) in COMPARISONS:
+        op = COMPARISONS[type(expr)]
+        if negate:
+            op = NEGATED[op]
+        return canonical_comparison(op, expr.this, expr.expression, schema, alias_map)
+
+    if isinstance(expr, exp.Is) and isinstance(expr.expression, exp.Null):
+        return ("NOTNULL(" if negate else "ISNULL(") + canonical_expr(expr.this, alias_map) + ")"
+
+    raise NotCanonical()
+
+
+# the canonical operands of a flattened AND (is_and) or OR, looking through NOT, e.g. the
+# conjuncts of "a AND NOT (b OR c)" are {a, NOT b, NOT c}
+def canonical_operands(expr, schema, alias_map, is_and, negate=False):
+    expr = unparen(expr)
+    if isinstance(expr, exp.Not):
+        return canonical_operands(expr.this, schema, alias_map, is_and, not negate)
+    if isinstance(expr, (exp.And, exp.Or)) and (isinstance(expr, exp.And) != negate) == is_and:
+        return (canonical_operands(expr.this, schema, alias_map, is_and, negate) |
+                canonical_operands(expr.expression, schema, alias_map, is_and, negate))
+    return {canonical_condition(expr, schema, alias_map, negate)}
+
+
+def canonical_comparison(op, left, right, schema, alias_map):
+    if op in FLIPPED:
+        op, left, right = FLIPPED[op], right, left
+
+    lhs, rhs = linear(left, schema, alias_map), linear(right, schema, alias_map)
+    if lhs is None or rhs is None:
+        # not linear arithmetic (e.g. strings or products of columns): only orient the operands
+        a, b = canonical_expr(left, alias_map), canonical_expr(right, alias_map)
+        if op in ["eq", "neq"] and b < a:
+            a, b = b, a
+        return f"{op}({a}, {b})"
+
+    # lhs - rhs (op) 0
+    coeffs = dict(lhs[0])
+    for col, c in rhs[0].items():
+        coeffs[col] = coeffs.get(col, 0) - c
+    const = lhs[1] - rhs[1]
+    refs = lhs[2] | rhs[2]  # a NULL in any referenced column makes the comparison unknown
+
+    terms = sorted((col, c) for col, c in coeffs.items() if c != 0)
+    if terms:
+        # scale so the first coefficient is 1 (or -1 for < and <=, where the sign can't be flipped)
+        scale = abs(terms[0][1]) if op in ["lt", "lte"] else terms[0][1]
+        terms = [(col, c / scale) for col, c in terms]
+        const = const / scale
+    terms_str = " + ".join(f"{c}*{col}" for col, c in terms)
+    return f"{op}({terms_str} + {const}, 0 | {','.join(sorted(refs))})"
+
+
+# ---------------------------------------------------------------------------------------------
+# expressions
+
+# linear form of an arithmetic expression: ({column: coefficient}, constant, referenced columns)
+# or None when the expression is not linear arithmetic over numeric columns
+def linear(expr, schema, alias_map):
+    expr = unparen(expr)
+    if isinstance(expr, exp.Column):
+        table = alias_map.get(expr.table, expr.table)
+        if schema[table][expr.name] == "STRING":
+            return None
+        col = canonical_expr(expr, alias_map)
+        return {col: Fraction(1)}, Fraction(0), {col}
+    if isinstance(expr, exp.Literal):
+        if expr.is_string:
+            return None
+        return {}, Fraction(expr.this), set()
+    if isinstance(expr, exp.Neg):
+        inner = linear(expr.this, schema, alias_map)
+        return None if inner is None else scale_linear(inner, -1)
+    if isinstance(expr, (exp.Add, exp.Sub)):
+        left, right = linear(expr.this, schema, alias_map), linear(expr.expression, schema, alias_map)
+        if left is None or right is None:
+            return None
+        sign = 1 if isinstance(expr, exp.Add) else -1
+        coeffs = dict(left[0])
+        for col, c in right[0].items():
+            coeffs[col] = coeffs.get(col, 0) + sign * c
+        return coeffs, left[1] + sign * right[1], left[2] | right[2]
+    if isinstance(expr, exp.Mul):
+        left, right = linear(expr.this, schema, alias_map), linear(expr.expression, schema, alias_map)
+        if left is None or right is None:
+            return None
+        if not left[0]:
+            return scale_linear(right, left[1], left[2])
+        if not right[0]:
+            return scale_linear(left, right[1], right[2])
+    return None
+
+
+def scale_linear(form, factor, extra_refs=frozenset()):
+    coeffs, const, refs = form
+    return {col: c * factor for col, c in coeffs.items()}, const * factor, refs | extra_refs
+
+
+def canonical_expr(expr, alias_map):
+    expr = unparen(expr)
+    if isinstance(expr, exp.Column):
+        table = alias_map.get(expr.table, expr.table)
+        return f"{table}.{expr.name}"
+    if isinstance(expr, exp.Literal):
+        return repr(expr.this) if expr.is_string else str(Fraction(expr.this))
+    if isinstance(expr, (exp.Add, exp.Mul)):
+        # commutative: flatten and sort the operands
+        parts = sorted(canonical_expr(p, alias_map) for p in flatten(expr, type(expr)))
+        return f"{expr.key}(" + ", ".join(parts) + ")"
+    if isinstance(expr, exp.Sub):
+        return f"sub({canonical_expr(expr.this, alias_map)}, {canonical_expr(expr.expression, alias_map)})"
+    if isinstance(expr, exp.Neg):
+        return f"neg({canonical_expr(expr.this, alias_map)})"
+    raise NotCanonical()
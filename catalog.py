@@ -0,0 +1,174 @@
+import hashlib
+import os
+import pickle
+from collections.abc import Mapping
+import sqlglot
+from sqlglot import expressions as exp
+from exceptions import ParseError, SchemaError
+
+# compiled schema catalog: the CREATE TABLE file is parsed once with sqlglot and kept as compact
+# per-table column arrays. The compiled catalog is pickled next to the DDL file
+# (create-table.sql -> create-table.sql.catalog) behind a text header with a format version and the
+# hash of the DDL, so later runs load it instead of parsing again, and any edit to the DDL is picked
+# up. The header is checked before anything is unpickled: a stale or foreign file is never loaded.
+#
+# SchemaCatalog is a read-only mapping table -> TableSchema, and TableSchema a mapping
+# column -> type, so it reads like nested dicts:
+#   catalog["Students"]["id"] == "INT",  catalog.not_null == {"Students": ["id"], ...}
+
+CATALOG_VERSION = 2
+CACHE_MAGIC = b"equisql-catalog"
+
+# sqlglot type -> the types the encoder knows about
+SQL_DATA_TYPES = {
+    "INT": "INT", "BIGINT": "INT", "SMALLINT": "INT", "TINYINT": "INT", "MEDIUMINT": "INT",
+    "TEXT": "STRING", "VARCHAR": "STRING", "CHAR": "STRING", "NVARCHAR": "STRING", "NCHAR": "STRING",
+    "FLOAT": "REAL", "DOUBLE": "REAL", "DECIMAL": "REAL",
+}
+
+
+class TableSchema(Mapping):
+    __slots__ = ("name", "columns", "types", "nullable", "index")
+
+    def __init__(self, name, columns, types, nullable):
+        self.name = name
+        self.columns = tuple(columns)
+        self.types = tuple(types)
+        self.nullable = tuple(nullable)
+        self.index = {col: i for i, col in enumerate(self.columns)}
+
+    # column -> type
+    def __getitem__(self, column):
+        return self.types[self.index[column]]
+
+    def __contains__(self, column):
+        return column in self.index
+
+    def __iter__(self):
+        return iter(self.columns)
+
+    def __len__(self):
+        return len(self.columns)
+
+    def is_nullable(self, column):
+        return self.nullable[self.index[column]]
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+    def __getstate__(self):
+        return (self.name, self.columns, self.types, self.nullable)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+
+class SchemaCatalog(Mapping):
+    def __init__(self, tables, ddl_hash):
+        self.tables = {t.name: t for t in tables}
+        self.ddl_hash = ddl_hash
+        # table -> columns declared NOT NULL or PRIMARY KEY
+        self.not_null = {t.name: [c for c, n in zip(t.columns, t.nullable) if not n] for t in tables}
+
+    def __getitem__(self, table):
+        return self.tables[table]
+
+    def __contains__(self, table):
+        return table in self.tables
+
+    def __iter__(self):
+        return iter(self.tables)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def __repr__(self):
+        return repr(self.tables)
+
+
+def load_catalog(ddl_path, use_cache=True):
+    with open(ddl_path, "rb") as f:
+        ddl = f.read()
+    ddl_hash = hashlib.sha256(ddl).hexdigest()
+    cache_path = ddl_path + ".catalog"
+
+    if use_cache:
+        catalog = read_cache(cache_path, ddl_hash)
+        if catalog is not None:
+            return catalog
+
+    catalog = parse_catalog_sql(ddl.decode(), ddl_hash)
+    if use_cache:
+        write_cache(cache_path, catalog)
+    return catalog
+
+
+# the header line of a cache file: magic, format version and DDL hash
+def cache_header(ddl_hash):
+    return b"%s %d %s\n" % (CACHE_MAGIC, CATALOG_VERSION, ddl_hash.encode())
+
+
+def read_cache(cache_path, ddl_hash):
+    header = cache_header(ddl_hash)
+    try:
+        with open(cache_path, "rb") as f:
+            if f.readline(len(header) + 1) != header:
+                return None
+            tables = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, ValueError, TypeError, AttributeError):
+        return None
+    return SchemaCatalog(tables, ddl_hash)
+
+
+def write_cache(cache_path, catalog):
+    try:
+        tmp = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(cache_header(catalog.ddl_hash))
+            pickle.dump(list(catalog.tables.values()), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_path)
+    except OSError:
+        pass  # read-only location, the catalog just isn't cached
+
+
+def parse_catalog_sql(ddl, ddl_hash=None):
+    if ddl_hash is None:
+        ddl_hash = hashlib.sha256(ddl.encode()).hexdigest()
+    try:
+        statements = sqlglot.parse(ddl)
+    except sqlglot.errors.ParseError as e:
+        raise ParseError(str(e.errors)) from e
+
+    tables = []
+    for stmt in statements:
+        if not isinstance(stmt, exp.Create) or str(stmt.args.get("kind")).upper() != "TABLE":
+            continue
+        if not isinstance(stmt.this, exp.Schema):
+            continue
+        tables.append(compile_table(stmt.this))
+    return SchemaCatalog(tables, ddl_hash)
+
+
+def compile_table(schema_expr):
+    name = schema_expr.this.name
+    columns, types, not_null = [], [], set()
+
+    for item in schema_expr.expressions:
+        if isinstance(item, exp.ColumnDef):
+            kind = item.args.get("kind")
+            ctype = kind.this.name if kind is not None else None
+            if ctype not in SQL_DATA_TYPES:
+                raise SchemaError(f"Type {kind.sql() if kind is not None else None} is not supported")
+            columns.append(item.name)
+            types.append(SQL_DATA_TYPES[ctype])
+            for constraint in item.args.get("constraints") or []:
+                ckind = constraint.args.get("kind")
+                if isinstance(ckind, exp.PrimaryKeyColumnConstraint) or (
+                        isinstance(ckind, exp.NotNullColumnConstraint) and not ckind.args.get("allow_null")):
+                    not_null.add(item.name)
+        elif isinstance(item, exp.PrimaryKey):
+            # table level PRIMARY KEY (a, b)
+            for col in item.expressions:
+                not_null.add(col.name)
+
+    return TableSchema(name, columns, types, [col not in not_null for col in columns])
@@ -0,0 +1,177 @@
+import hashlib
+import itertools
+import json
+import random
+import sqlite3
+import sys
+import time
+from collections import Counter
+import logic
+from canonical import canonically_equivalent
+from encoder import Encoder
+from exceptions import EquivalenceError
+from falsifier import MAX_ROWS, create_tables, databases, load, real_arithmetic, value_pools
+from intervals import decide as decide_intervals
+from ir import lower_query
+from parser import iter_queries, report_error
+from sanity_checker import sanity_check, signature
+from z3 import unknown, unsat
+
+# clustering a query log into equivalence classes (main.py --cluster LOG). Comparing every pair
+# takes N(N-1)/2 solver calls; instead
+#   1. queries are partitioned by the invariants sanity_check compares (projected columns, tables,
+#      LIMIT/OFFSET): queries in different partitions are never equivalent
+#   2. within a partition every query is run with sqlite3 on the same sampled databases (built
+#      like the falsifier's, see falsifier.py) and the multisets of rows it returns are hashed
+#      into its fingerprint. Queries with different fingerprints differ on one of the databases,
+#      so they aren't equivalent either
+#   3. a query is only compared with one representative per class of its fingerprint bucket
+#      (canonical fast path first, then the interval pre-solver, then the solver) and joins the first class it is equivalent
+#      to; the classes are kept in a union-find structure
+# a query without a fingerprint (sqlite rejects it, or LIMIT/OFFSET without ORDER BY makes the
+# rows it keeps arbitrary) is compared with the representatives of its whole partition.
+
+FINGERPRINT_DATABASES = 32
+
+
+# queries: (query_id, sqlglot AST) pairs, as iter_queries yields them. returns (classes, stats):
+#   classes: [{"class": n, "representative": query_id, "members": [query_id, ...]}, ...] in log order
+#   stats:   counts of queries, partitions, buckets and classes, and how many of the N(N-1)/2
+#            pairs went to the solver ("solver_calls") or didn't ("avoided")
+# queries that fail sanity_check on their own are passed to on_error(query_id, message) and
+# left out of the classes; a comparison the encoder rejects (e.g. a != it doesn't support) is
+# reported the same way and counts as not equivalent
+def cluster(schema, queries, timeout=None, n_databases=FINGERPRINT_DATABASES, seed=0, on_error=None):
+    if on_error is None:
+        on_error = report_error
+    start = time.perf_counter()
+    stats = {"queries": 0, "errors": 0, "partitions": 0, "buckets": 0, "classes": 0,
+             "canonical": 0, "intervals": 0, "solver_calls": 0, "unknown": 0, "comparison_errors": 0}
+
+    members, partitions = [], {}  # members: (query_id, ast, ir); signature -> indexes into members
+    for query_id, ast in queries:
+        stats["queries"] += 1
+        try:
+            ir = lower_query(ast)
+            sanity_check(schema, ir, ir)
+            key = signature(schema, ir)
+        except EquivalenceError as e:
+            stats["errors"] += 1
+            on_error(query_id, str(e))
+            continue
+        partitions.setdefault(key, []).append(len(members))
+        members.append((query_id, ast, ir))
+
+    parent = list(range(len(members)))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    buckets = set()
+    for n, indexes in enumerate(partitions.values()):
+        prints = fingerprints(schema, [members[i] for i in indexes], n_databases, seed)
+        representatives = []  # (fingerprint, member index) of every class in the partition so far
+        for i, fingerprint in zip(indexes, prints):
+            buckets.add((n, fingerprint))
+            for other_print, rep in representatives:
+                if None not in (fingerprint, other_print) and fingerprint != other_print:
+                    continue
+                try:
+                    merged = equivalent(schema, members[rep], members[i], timeout, stats)
+                except EquivalenceError as e:
+                    stats["comparison_errors"] += 1
+                    on_error(members[i][0], f"compared with {members[rep][0]}: {e}")
+                    merged = False
+                if merged:
+                    parent[find(i)] = find(rep)
+                    break
+            else:
+                representatives.append((fingerprint, i))
+
+    classes = {}
+    for i, (query_id, _, _) in enumerate(members):
+        classes.setdefault(find(i), []).append(query_id)
+    result = [{"class": n, "representative": members[root][0], "members": ids}
+              for n, (root, ids) in enumerate(sorted(classes.items()))]
+
+    n = len(members)
+    stats.update(partitions=len(partitions), buckets=len(buckets), classes=len(result), pairs=n * (n - 1) // 2)
+    stats["avoided"] = stats["pairs"] - stats["solver_calls"]
+    stats["elapsed"] = round(time.perf_counter() - start, 6)
+    return result, stats
+
+
+# one fingerprint (hex digest, or None) per member of a partition. Queries with arithmetic on REAL
+# values get None: sqlite computes it in floating point, so equivalent ones could differ there
+def fingerprints(schema, members, n_databases, seed):
+    ir = members[0][2]
+    if n_databases <= 0 or ir.limit is not None or ir.offset is not None:
+        return [None] * len(members)
+
+    tables = sorted(ir.tables())
+    try:
+        pools = value_pools(schema, tables, [member[2] for member in members])
+    except (OverflowError, ValueError):
+        return [None] * len(members)  # a literal too large for a float or an INTEGER
+    sqls = [ast.sql(dialect="sqlite") for _, ast, _ in members]
+    hashes = [hashlib.sha256() for _ in members]
+    failed = {i for i, member in enumerate(members) if real_arithmetic(schema, member[2])}
+    db = sqlite3.connect(":memory:")
+    try:
+        create_tables(db, schema, tables)
+        samples = databases(schema, tables, pools, random.Random(seed), MAX_ROWS)
+        for database in itertools.islice(samples, n_databases):
+            try:
+                load(db, schema, database)
+            except (sqlite3.Error, OverflowError, ValueError):
+                continue  # skipped for every member, so the fingerprints stay comparable
+            for i, sql in enumerate(sqls):
+                if i in failed:
+                    continue
+                try:
+                    rows = db.execute(sql).fetchall()
+                except sqlite3.Error:
+                    failed.add(i)
+                    continue
+                hashes[i].update(repr(sorted(Counter(rows).items(), key=repr)).encode())
+    finally:
+        db.close()
+    return [None if i in failed else h.hexdigest() for i, h in enumerate(hashes)]
+
+
+# is member b equivalent to member a; "unknown" (solver timeout) counts as not equivalent
+def equivalent(schema, a, b, timeout, stats):
+    (_, ast1, q1), (_, ast2, q2) = a, b
+    if canonically_equivalent(schema, ast1, ast2, q1.alias_map, q2.alias_map):
+        stats["canonical"] += 1
+        return True
+    verdict = decide_intervals(schema, q1, q2)
+    if verdict is not None:
+        stats["intervals"] += 1
+        return verdict["verdict"] == "equivalent"
+
+    stats["solver_calls"] += 1
+    enc = Encoder(schema)
+    s = enc.encode(q1, q2)
+    if timeout is not None:
+        s.set("timeout", int(timeout * 1000))
+    result, _, _ = logic.check(s, enc.solver_logic, timeout)
+    if result == unknown:
+        stats["unknown"] += 1
+    return result == unsat
+
+
+def cluster_log(schema, log_path, output_path="-", workers=None, timeout=None):
+    classes, stats = cluster(schema, iter_queries(log_path, workers), timeout)
+    fout = sys.stdout if output_path == "-" else open(output_path, "w")
+    try:
+        for cls in classes:
+            fout.write(json.dumps(cls) + "\n")
+    finally:
+        if fout is not sys.stdout:
+            fout.close()
+    print(f"{stats['queries']} queries in {stats['classes']} classes: {stats}", file=sys.stderr)
+    return classes, stats
@@ -0,0 +1,142 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import z3
+import logic
+from encoder import Encoder
+from ir import QueryIR, tree_columns
+from main import extract_counterexample
+
+# divide and conquer (main.py --decompose): the conjuncts of WHERE and of the inner join ON
+# conditions of both queries are grouped by the columns they share (connected components, so
+# a.x + b.y > 3 ties a.x and b.y together). With only inner joins every query is then
+#   q = A(x) AND B(y) AND ...   over disjoint sets of columns x, y, ...
+# and each component is checked as a pair of its own (own Encoder, own z3.Context, so they can
+# run in parallel threads):
+#   - every component equivalent: so are the queries
+#   - component A differs, say A1(x) AND NOT A2(x): q1 AND NOT q2 only needs a y with B1(y), so
+#     the counterexample is x plus a satisfying assignment of query 1's conjuncts in every other
+#     component (when one of those is unsatisfiable both queries are always empty and might well
+#     be equivalent, so that goes to the monolithic check)
+# outer joins tie their tables together, so queries with outer joins aren't split; neither are
+# queries with a single component. A component the solver can't decide (timeout) sends the pair
+# to the monolithic check as well, unless another component already gave a counterexample.
+
+# the predicate FALSE, the other side of the satisfiability checks
+FALSE = ("eq", ("lit", "INT", "0"), ("lit", "INT", "1"))
+
+
+# [(q1 part, q2 part)] per component, or None when the queries can't be split
+def split(q1, q2):
+    if any(join.on is not None and join.side for ir in [q1, q2] for join in ir.joins):
+        return None
+
+    conjuncts = [[], []]
+    for n, ir in enumerate([q1, q2]):
+        for tree in [join.on for join in ir.joins] + [ir.where]:
+            conjuncts[n] += flatten_and(tree)
+
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for tree in conjuncts[0] + conjuncts[1]:
+        columns = sorted(tree_columns(tree))
+        for column in columns[1:]:
+            parent[find(column)] = find(columns[0])
+
+    # component root (None for the conjuncts without columns) -> (q1 conjuncts, q2 conjuncts)
+    groups = {}
+    for n in [0, 1]:
+        for tree in conjuncts[n]:
+            columns = tree_columns(tree)
+            key = find(min(columns)) if columns else None
+            groups.setdefault(key, ([], []))[n].append(tree)
+    if len(groups) < 2:
+        return None
+    return [(restrict(q1, part1), restrict(q2, part2)) for part1, part2 in groups.values()]
+
+
+def flatten_and(tree):
+    if tree is None:
+        return []
+    if tree[0] == "and":
+        return flatten_and(tree[1]) + flatten_and(tree[2])
+    return [tree]
+
+
+# the query with only these conjuncts as its WHERE clause and no join conditions
+def restrict(ir, conjuncts):
+    part = QueryIR()
+    for slot in QueryIR.__slots__:
+        setattr(part, slot, getattr(ir, slot))
+    part.joins = []
+    part.where = functools.reduce(lambda left, right: ("and", left, right), conjuncts) if conjuncts else None
+    return part
+
+
+# the verdict dict (as main.solver_verdict) with "decomposed": {"components", "solved"}, or None
+# when the pair has to be checked as a whole
+def check(schema, q1, q2, threads=1, timeout=None):
+    parts = split(q1, q2)
+    if parts is None:
+        return None
+
+    contexts = []
+    outcomes = []  # (component index, result, counterexample)
+    if threads > 1:
+        pool = ThreadPoolExecutor(threads)
+        try:
+            futures = {pool.submit(solve, schema, p1, p2, timeout, contexts): i for i, (p1, p2) in enumerate(parts)}
+            for future in as_completed(futures):
+                outcomes.append((futures[future], *future.result()))
+                if outcomes[-1][1] == z3.sat:
+                    break  # this component is a counterexample already, stop the others
+        finally:
+            for ctx in list(contexts):
+                ctx.interrupt()
+            pool.shutdown(wait=True, cancel_futures=True)
+    else:
+        for i, (p1, p2) in enumerate(parts):
+            outcomes.append((i, *solve(schema, p1, p2, timeout, contexts)))
+            if outcomes[-1][1] == z3.sat:
+                break
+
+    stats = {"components": len(parts), "solved": len(outcomes)}
+    different = [outcome for outcome in outcomes if outcome[1] == z3.sat]
+    if not different:
+        if len(outcomes) == len(parts) and all(outcome[1] == z3.unsat for outcome in outcomes):
+            return {"verdict": "equivalent", "decomposed": stats}
+        return None
+
+    i, _, cex = different[0]
+    # the query that returns the tuple has to return it in every other component as well
+    side = 0 if cex["q1_result"] else 1
+    tables = cex["tables"]
+    for j, part in enumerate(parts):
+        if j == i or part[side].where is None:
+            continue
+        result, satisfied = solve(schema, part[side], restrict(part[side], [FALSE]), timeout, [])
+        if result != z3.sat:
+            return None
+        for table, values in satisfied["tables"].items():
+            tables.setdefault(table, {}).update(values)
+    cex["tables"] = {table: {col: values[col] for col in schema[table] if col in values}
+                     for table, values in tables.items()}
+    return {"verdict": "counterexample", "counterexample": cex, "decomposed": stats}
+
+
+# encodes and solves one component pair in a fresh context; returns (result, counterexample or None).
+# The counterexample is read here, in the solving thread, before check interrupts the contexts
+def solve(schema, q1, q2, timeout, contexts):
+    ctx = z3.Context()
+    contexts.append(ctx)
+    enc = Encoder(schema, ctx=ctx)
+    s = enc.encode(q1, q2)
+    if timeout is not None:
+        s.set("timeout", int(timeout * 1000))
+    result, s, _ = logic.check(s, enc.solver_logic, timeout)
+    return result, extract_counterexample(schema, s.model(), enc.declared, enc.string_ranks) if result == z3.sat else None
@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import time
+import logic
+import modes
+from cache import canonical_sql, schema_fingerprint
+
+# encoded pairs as self-contained SMT-LIB2 files (main.py --dump-smt2 DIR), for replay.py.
+# A file is the solver's to_smt2() (declarations, assertions, check-sat) after a header of
+# metadata comments, one "; key: JSON value" line each:
+#   format         "equisql-smt2 1"
+#   schema_hash    cache.schema_fingerprint of the schema and its NOT NULL columns
+#   q1, q2         both queries as sqlglot prints them (see cache.canonical_sql)
+#   options        the encoding modes and --logic the pair was encoded with
+#   solver_logic   the logic the solver was created for (null for the general solver)
+#   z3_version     the z3 that encoded it
+# followed by (set-logic ...) when there is a solver logic. The file is named after a hash of
+# the metadata without the z3 version, so the same pair under the same options is written once.
+
+FORMAT = "equisql-smt2 1"
+
+
+# writes the problem in `s` (as returned by encoder.encode) and returns its path
+def write_problem(directory, s, schema, not_null, q1_ast, q2_ast, solver_logic):
+    import z3
+    meta = {
+        "format": FORMAT,
+        "schema_hash": schema_fingerprint(schema, not_null),
+        "q1": canonical_sql(q1_ast),
+        "q2": canonical_sql(q2_ast),
+        "options": {"null_mode": modes.NULL_MODE, "join_mode": modes.JOIN_MODE, "input_mode": modes.INPUT_MODE,
+                    "string_mode": modes.STRING_MODE, "logic": logic.LOGIC},
+        "solver_logic": solver_logic,
+    }
+    name = hashlib.sha256(json.dumps(meta, sort_keys=True).encode()).hexdigest()[:16] + ".smt2"
+    meta["z3_version"] = z3.get_version_string()
+
+    header = "".join(f"; {key}: {json.dumps(value)}\n" for key, value in meta.items())
+    if solver_logic:
+        header += f"(set-logic {solver_logic})\n"
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, name)
+    # batch workers may dump concurrently: write to a private file and rename it into place
+    tmp = f"{path}.{os.getpid()}.{time.monotonic_ns()}"
+    with open(tmp, "w") as f:
+        f.write(header + s.to_smt2())
+    os.replace(tmp, path)
+    return path
+
+
+# (metadata dict, SMT-LIB2 text) of a dumped file
+def read_problem(path):
+    with open(path) as f:
+        text = f.read()
+    meta = {}
+    for line in text.splitlines():
+        if not line.startswith("; ") or ": " not in line[2:]:
+            break
+        key, value = line[2:].split(": ", 1)
+        meta[key] = json.loads(value)
+    if meta.get("format") != FORMAT:
+        raise ValueError(f"{path}: not an {FORMAT} file")
+    return meta, text
+
+
+# the .smt2 files under the given files and directories, sorted
+def problem_files(paths):
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                found += [os.path.join(root, name) for name in names if name.endswith(".smt2")]
+        else:
+            found.append(path)
+    return sorted(found)
@@ -1,395 +1,708 @@
-import sys
-from sqlglot import expressions as exp
 from z3 import *
+from exceptions import UnsupportedQueryError
+from ir import tree_columns
+from joingraph import join_steps, prefix_tables
+from logic import choose_logic, make_solver
+import modes
+from stringranks import string_ranks
+
+
+# the NullInt/NullString/NullReal functions in a z3 context
+def null_functions(ctx=None):
+    return [Function("NullInt", IntSort(ctx), BoolSort(ctx)), Function("NullString", StringSort(ctx), BoolSort(ctx)),
+            Function("NullReal", RealSort(ctx), BoolSort(ctx))]
+
+
+# ---------------------------------------------------------------------------------------------
+# module-level interface for the command line: one encoding at a time in z3's main context.
+# `current` is the Encoder of the last encode/encode_reference call (main.py reads its
+# pruning report, declared variables and solver_logic)
+
+current = None
+
+
+# q1 and q2 are the lowered queries (ir.QueryIR)
+def encode(schema, q1, q2, nf, nn, prune=True, null_mode=None, join_mode=None, logic=None, input_mode=None,
+           string_mode=None):
+    global current
+    current = Encoder(schema, nf, nn, null_mode, join_mode, logic, input_mode=input_mode, string_mode=string_mode)
+    return current.encode(q1, q2, prune)
+
+
+def encode_reference(schema, q1, nf, nn, null_mode=None, join_mode=None, input_mode=None):
+    global current
+    current = Encoder(schema, nf, nn, null_mode, join_mode, input_mode=input_mode)
+    return current.encode_reference(q1)
+
+
+def encode_candidate(schema, q2):
+    return current.encode_candidate(q2)
+
+
+# ---------------------------------------------------------------------------------------------
+# the state of one encoding: the solver, the variables declared so far and the modes. Every z3
+# term is created in `ctx`, so encoders with their own z3.Context can run in different threads
+# (see api.py); nothing here touches module state.
+#   nf: the null functions in ctx (created when not given), nn: table -> NOT NULL columns
+
+class Encoder:
+    def __init__(self, schema, nf=None, nn=None, null_mode=None, join_mode=None, logic=None, ctx=None,
+                 input_mode=None, string_mode=None):
+        self.schema = schema
+        self.ctx = ctx if ctx is not None else main_ctx()
+        self.null_funcs = nf if nf is not None else null_functions(self.ctx)
+        self.not_null = nn if nn is not None else schema.not_null
+        self.flags = (null_mode or modes.NULL_MODE) == "flags"
+        self.selectors = (join_mode or modes.JOIN_MODE) == "selectors"
+        self.shared = (input_mode or modes.INPUT_MODE) == "shared"
+        self.ranked = (string_mode or modes.STRING_MODE) == "ranks"
+        self.logic = logic
+        self.s = None
+        self.NULL = IntVal(-1, self.ctx)
+        self.declared = {} # z3 variable name -> (table, column, idx)
+        self.pruning = None
+        self.features = set() # theories the encoding uses, for logic.choose_logic
+        self.solver_logic = None
+        self.padded = {} # selectors mode: table -> Bool that is true when the table is null-extended
+        self.memo = {} # shared input mode: (kind, IR subtree, ..., padded tables) -> encoded term
+        self.string_ranks = None # ranks string mode: the stringranks.StringRanks TEXT columns are encoded with
+
+    # the returned solver is specialized to the logic the pair needs (see logic.py), which is left
+    # in solver_logic; logic="none" keeps the general solver
+    def encode(self, q1, q2, prune=True):
+        if self.ranked:
+            self.string_ranks = string_ranks(self.schema, q1, q2)
+        self.encode_reference(q1)
+        self.encode_candidate(q2)
+        self.solver_logic = choose_logic(self.features, self.logic)
+        if prune:
+            self.s, self.pruning = prune_solver(self.s, self.solver_logic)
+        elif self.solver_logic:
+            specialized = make_solver(self.solver_logic, self.ctx)
+            specialized.add(self.s.assertions())
+            self.s = specialized
+        return self.s
+
+    # steps 1-4 for query 1 only: declares the variables, adds the schema constraints and q1_result.
+    # Everything asserted here is shared by all the queries later compared against query 1, so in
+    # one-vs-many mode each candidate is added with encode_candidate between s.push() and s.pop()
+    def encode_reference(self, q1):
+        self.s = Solver(ctx=self.ctx)
+        self.q1_alias_map = q1.alias_map
+        self.q2_alias_map = q1.alias_map # sanity_check makes sure every query 2 references the same tables
+
+        # step 1: declare variables for each query
+        # (lazily -- a z3 constant is only created for a column once an encoding refers to it)
+        self.vars_q1 = self.declare_variables(idx="in" if self.shared else "q1")
+        self.vars = self.declare_variables(idx="null" if self.flags else "") # created these for IS (NOT) NULL
+
+        # step 4: encode constraints for query 1
+        cond_q1 = self.encode_query(q1, 1, self.vars_q1)
+        # print("encoding for query1:", cond_q1) # for debug use
+        self.cond_q1 = cond_q1
+
+        q1_result = Bool("q1_result", self.ctx)
+        self.s.add(q1_result == cond_q1)
+
+        # step 3 for the columns query 1 refers to
+        self.base_not_null = self.add_not_null_constraints(set())
+        return self.s
+
+    # step 4 for query 2 and step 5 -- ask: is it possible that some variable makes q1 XOR q2
+    def encode_candidate(self, q2):
+        self.q2_alias_map = q2.alias_map
+        vars_q1 = self.vars_q1
+        vars_q2 = vars_q1 if self.shared else self.declare_variables(idx="q2")
+
+        cond_q2 = self.encode_query(q2, 2, vars_q2)
+        # print("encoding for query2:", cond_q2) # for debug use
+
+        # step 2: enforce that input tuples are the same (shared input mode: they are the same variables)
+        # only columns both queries refer to need it, a column used by one query alone is unconstrained anyway
+        for table, columns in vars_q2.items():
+            if table == "row_identity" or self.shared:
+                continue
+            for col in columns:
+                if col in vars_q1[table]:
+                    self.s.add(vars_q1[table][col] == vars_q2[table][col])
+
+        # step 3 for the columns only query 2 refers to
+        self.add_not_null_constraints(self.base_not_null)
+
+        q1_result = Bool("q1_result", self.ctx)
+        q2_result = Bool("q2_result", self.ctx)
+        self.s.add(q2_result == cond_q2)
+        self.s.add(q1_result != q2_result)
+        if self.shared:
+            # a conjunct both results have has to hold for them to differ; when every conjunct is
+            # shared they can't differ at all and the goal is simply false
+            conjuncts_q1, conjuncts_q2 = conjuncts(self.cond_q1), conjuncts(cond_q2)
+            common = [c for key, c in conjuncts_q1.items() if key in conjuncts_q2]
+            if conjuncts_q1.keys() == conjuncts_q2.keys():
+                self.s.add(BoolVal(False, self.ctx))
+            elif common:
+                self.s.add(common)
+        return self.s
 
-
-def encode(schema, q1_ast, q2_ast, alias_map_1, alias_map_2, nf, nn):
-    # define and initialize global variables
-    global s, NULL, q1_alias_map, q2_alias_map, null_funcs, not_null, vars
-    s = Solver()
-    NULL = IntVal(-1)
-    q1_alias_map = alias_map_1
-    q2_alias_map = alias_map_2
-    null_funcs = nf
-    not_null = nn
-    
-    
-    # step 1: declare variables for each query 
-    vars_q1 = declare_variables(schema, idx="q1")
-    vars_q2 = declare_variables(schema, idx="q2")
-    vars = declare_variables(schema, idx="") # created these for IS (NOT) NULL
-
-
-    # step 2: enforce that input tuples are the same 
-    for table in schema:
-        if table in q1_alias_map.values() and table in q2_alias_map.values():
-            for col in schema[table]:
-                s.add(vars_q1[table][col] == vars_q2[table][col])
- 
     # step 3: add constraints that some attributes cannot be null
-    for table_name in not_null:
-        ls = not_null[table_name]
-        for col_name in ls :
-            if table_name in vars:
-                col_name, col_type = vars[table_name][col_name], schema[table_name][col_name]
-                s.add(Not(encode_is_null(col_name, col_type))) 
-                # need to make the first param has type z3.z3.SeqRef or z3.z3.ArithRef, not String    
-
-    # step 4: encode constraints for each query
-    cond_q1 = encode_query(schema, q1_ast, 1, vars_q1)
-    cond_q2 = encode_query(schema, q2_ast, 2, vars_q2)
-
-    # print("encoding for query1:", cond_q1) # for debug use
-    # print("encoding for query2:", cond_q2) # for debug use
-
-    # step 5: ask -- is it possible that some variable makes q1 XOR q2
-    q1_result = Bool("q1_result")
-    q2_result = Bool("q2_result")
-    s.add(q1_result == cond_q1)
-    s.add(q2_result == cond_q2)
-    s.add(q1_result != q2_result)
-   
-    return s
-
-
-# for each table in both queries, declare Z3 variables for its columns
-# returns a map, which maps dict[table][column] -> Z3 variable
-def declare_variables(schema, idx):
-    global q1_alias_map, q2_alias_map
-    if (idx == 1):
-        alias_map = q1_alias_map
-    else:
-        alias_map = q2_alias_map
-        
-    variables = {}
-    variables["row_identity"] = {}
-
-    # synthetic row identity
-    for table in alias_map.values():        
-        variables["row_identity"][table] = Int(f"{table}_row")
-
-    for table in alias_map.values():
-        variables[table] = {}
-        for column, col_type in schema[table].items():
-            var_name = f"{table}_{idx}_{column}"
-            if col_type == "INT":
-                variables[table][column] = Int(var_name)
-            elif col_type =="STRING":
-                variables[table][column] = String(var_name)
-            else: #col_type == "REAL"
-                variables[table][column] = Real(var_name)
-    
-    return variables
-
-
-
-def encode_query(schema, ast, idx, variables):
-    # Check if WHERE clause filters on the "other side" of outer joins
-    # This effectively converts outer joins to inner joins
-    where = ast.args.get("where")
-    if where:
-        # Extract tables referenced in WHERE clause
-        where_tables = extract_tables_from_condition(where.this, idx)
-        # Modify join encoding if WHERE filters on other side
-        cond_join = encode_join(schema, ast, idx, variables, where_tables)
-        # cond_join = encode_join(schema, ast, idx, variables, None)
-    else:
-        cond_join = encode_join(schema, ast, idx, variables, set())
-    cond_where = encode_where(schema, ast, idx, variables)
-    return And(cond_join, cond_where)
-
-# Extract tables referenced in a condition expression
-def extract_tables_from_condition(expr, idx):
-    # it looks like we skip conditions in where
-    # A left join B, and B exists in where
-    # A right join B, and A exists in where
-    # A full join B, and either A or B exists in where
-
-    # questions:
-    # 1.if you see "A.id IS NULL", will that be treated as inner join? -- no
-    # 2.if you see "A.id IS NOT NULL" will that be treated as inner join? -- yes
-
-    global q1_alias_map, q2_alias_map
-    if (idx == 1):
-        alias_map = q1_alias_map
-    else:
-        alias_map = q2_alias_map
-
-    tables = set()
-
-    if isinstance(expr, exp.Column):
-        table = alias_map.get(str(expr.table), str(expr.table))
-        tables.add(table)
-    elif isinstance(expr, exp.Condition):
-        key = expr.key.lower()
-        if key in ["gt", "lt", "gte", "lte", "eq", "is"]:
-            left = expr.args.get("this")
-            right = expr.args.get("expression")
-            if left:
-                tables.update(extract_tables_from_condition(left, idx))
-            if right:
-                tables.update(extract_tables_from_condition(right, idx))
-        elif key in ["and", "or"]:
-            tables.update(extract_tables_from_condition(expr.args["this"], idx))
-            tables.update(extract_tables_from_condition(expr.args["expression"], idx))
-        elif key == "not":
-            tables.update(extract_tables_from_condition(expr.args["this"], idx))
-
-    return tables
-
-
-def encode_join(schema, ast, idx, variables, where_tables=None):
-    global q1_alias_map, q2_alias_map
-    if (idx == 1):
-        alias_map = q1_alias_map
-    else:
-        alias_map = q2_alias_map
+    # only for the null-check variables some encoding refers to, skipping the ones in `done`.
+    # returns the (table, column) pairs constrained so far
+    def add_not_null_constraints(self, done):
+        done = set(done)
+        for table_name in self.not_null:
+            ls = self.not_null[table_name]
+            for col_name in ls :
+                if table_name in self.vars and col_name in self.vars[table_name] and (table_name, col_name) not in done:
+                    col_var, col_type = self.vars[table_name][col_name], self.schema[table_name][col_name]
+                    self.s.add(Not(col_var) if self.flags else Not(self.encode_is_null(col_var, col_type)))
+                    # need to make the first param has type z3.z3.SeqRef or z3.z3.ArithRef, not String    
+                    done.add((table_name, col_name))
+        return done
+
+
+    # for each table in both queries, declare Z3 variables for its columns
+    # returns a map, which maps dict[table][column] -> Z3 variable
+    # the per-table maps create their variables on first access (see LazyColumns)
+    def declare_variables(self, idx):
+        if (idx == "q1"):
+            alias_map = self.q1_alias_map
+        else:
+            alias_map = self.q2_alias_map
 
-    if where_tables is None:
-        where_tables = set()
-    
-    encoding = BoolVal(True) 
-    joins = ast.args.get("joins")
-    # no (explicit) joins
-    if not joins or (len(joins) == 1 and (joins[0].args.get("on")) is None):
-        return encoding
+        variables = {}
+        variables["row_identity"] = {}
 
-    # Extract left table from FROM clause - handle different AST structures
-    from_clause = ast.args.get("from")
-    left_table_name = None
-
-    if from_clause is not None:
-        # Handle different structures: Table directly, or nested in args["this"]
-        if isinstance(from_clause, exp.Table):
-            left_table_name = from_clause.name
-        elif hasattr(from_clause, 'args') and from_clause.args.get("this"):
-            if isinstance(from_clause.args["this"], exp.Table):
-                left_table_name = from_clause.args["this"].name
-            else:
-                # Try to extract from nested structure
-                left_table_name = from_clause.args["this"].name if hasattr(from_clause.args["this"], 'name') else None
-
-    # If FROM is None or we couldn't extract the table, try to get it from the first table in alias_map
-    # This can happen when sqlglot structures explicit joins differently
-    if left_table_name is None:
-        # Get the first table from alias_map - this should be the leftmost table
-        tables_in_order = list(alias_map.keys())
-        if tables_in_order:
-            left_table_name = tables_in_order[0]
-        else:
-            exit("Could not determine left table for join")
+        # synthetic row identity
+        for table in alias_map.values():        
+            variables["row_identity"][table] = Int(f"{table}_row", self.ctx)
 
-    # left_table_name is the alias/table name as it appears in the query
-    # variables["row_identity"] is keyed by alias_map.keys() which are aliases/table names
+        for table in alias_map.values():
+            variables[table] = LazyColumns(self, table, idx)
 
+        return variables
 
-    for i in range(len(joins)) :
-        join = joins[i]
-        cond = join.args.get("on")
-        encoded_cond = encode_condition(schema, cond, idx, variables, join=True)
 
-        # Extract right table from join - handle Table expression
-        right_table_expr = join.args.get("this")
-        if isinstance(right_table_expr, exp.Table):
-            right_table_name = right_table_expr.name
-        else:
-            exit(f"Unexpected join table structure: {right_table_expr}")
-
-        # right_table_name is the alias/table name as it appears in the query
-        # Resolve to real table names for consistency (but use alias for accessing variables)
-        left_table_real = alias_map.get(left_table_name, left_table_name)
-        right_table_real = alias_map.get(right_table_name, right_table_name)
-
-        # Check if WHERE clause filters on the "other side" of an outer join
-        # This effectively converts the outer join to an inner join
-        should_be_inner = False
-        if join.side:
-            side = join.side.lower()
+    def encode_query(self, ir, idx, variables):
+        self.padded = {}
+        # Check if WHERE clause filters on the "other side" of outer joins
+        # This effectively converts outer joins to inner joins
+        # Extract tables referenced in WHERE clause
+        where_tables = self.extract_tables_from_condition(ir.where)
+        # Modify join encoding if WHERE filters on other side
+        cond_join = self.encode_join(ir, idx, variables, where_tables)
+        cond_where = self.encode_where(ir, idx, variables)
+        return And(cond_join, cond_where)
+
+    # Extract tables referenced in a condition expression
+    def extract_tables_from_condition(self, expr):
+        # it looks like we skip conditions in where
+        # A left join B, and B exists in where
+        # A right join B, and A exists in where
+        # A full join B, and either A or B exists in where
+
+        # questions:
+        # 1.if you see "A.id IS NULL", will that be treated as inner join? -- no
+        # 2.if you see "A.id IS NOT NULL" will that be treated as inner join? -- yes
+
+        # aliases are already resolved in the IR, so this is just the tables of the referenced columns
+        return {table for table, _ in tree_columns(expr)}
+
+
+    def encode_join(self, ir, idx, variables, where_tables=None):
+        if where_tables is None:
+            where_tables = set()
+        if self.selectors:
+            return self.encode_join_selectors(ir, idx, variables, where_tables)
+
+        encoding = BoolVal(True, self.ctx)
+        # comma / cross joins have no ON condition, their predicates live in WHERE
+        joins = [join for join in ir.joins if join.on is not None]
+        # no (explicit) joins
+        if not joins:
+            return encoding
+
+        # left table from the FROM clause, or the first table the query mentions
+        left_table_real = ir.from_table
+        if left_table_real is None:
+            if not ir.alias_map:
+                raise UnsupportedQueryError("Could not determine left table for join")
+            left_table_real = next(iter(ir.alias_map.values()))
+
+        # the joins as blocks of inner joins and outer join boundaries (see joingraph.py): the
+        # conditions of a block are encoded in a fixed order, and the left side of an outer join is
+        # represented by the row of the first of the tables joined before it in sorted order, so
+        # the same join graph written in another order or with comma joins encodes the same way
+        steps = join_steps(left_table_real, [(join.table, join.side, join.on) for join in ir.joins])
+        for i, (side, right, cond) in enumerate(steps):
+            if side == "inner":
+                for on in sorted(cond, key=repr):
+                    encoding = And(self.encode_inner_join(on, idx, variables), encoding)
+                continue
+            right_table_real = right
+            left_tables = prefix_tables(steps, i)
+
+            # Check if WHERE clause filters on the "other side" of an outer join
+            # This effectively converts the outer join to an inner join
+            should_be_inner = False
             if side == "left" and right_table_real in where_tables:
                 # LEFT JOIN with WHERE filtering on right table -> INNER JOIN
                 should_be_inner = True
-            elif side == "right" and left_table_real in where_tables:
+            elif side == "right" and any(table in where_tables for table in left_tables):
                 # RIGHT JOIN with WHERE filtering on left table -> INNER JOIN
                 should_be_inner = True
-            elif side == "full" and (left_table_real in where_tables or right_table_real in where_tables):
+            elif side == "full" and any(table in where_tables for table in left_tables + [right_table_real]):
                 # FULL JOIN with WHERE filtering on either side -> INNER JOIN
                 should_be_inner = True
 
-        left_row = variables["row_identity"][left_table_real]
-        right_row = variables["row_identity"][right_table_real]
-        
-        if (not join.side) or should_be_inner: # inner join (explicit or converted from outer)
-            # for inner loop, it doesn't matter if the condition is placed in ON or WHERE clause
-            # since we always use AND to connect them.
-
-            # for inner join, add constarint that left and right are not null
-            global vars
-            left, left_type = encode_expr(schema, idx, cond.args["this"], vars)
-            right, right_type = encode_expr(schema, idx, cond.args["expression"], vars)
-            temp = And(And(encoded_cond, (Not (encode_is_null(left, left_type)))), 
-                       (Not (encode_is_null(right, right_type))))
-        
-        else: # outer join
-            LeftJoin = Function("LeftJoin", IntSort(), IntSort(), BoolSort())
-            FullJoin = Function('FullJoin', IntSort(), IntSort(), BoolSort())
-
-            if (side == "left") :
-                temp = encode_left_join(encoded_cond, left_row, right_row, LeftJoin, schema)
-            elif (side == "right") :
-                temp = encode_left_join(encoded_cond, right_row, left_row, LeftJoin, schema)
-            elif (side == "full") :
-                temp = encode_full_join(encoded_cond, left_row, right_row, FullJoin)
-            else:
-                exit(f"unknown join type: {side.upper()} JOIN")
-
-        encoding = And(temp, encoding)
-
-    return encoding
-
-
-def encode_left_join(on_pred, left_row, right_row, LeftJoin, schema):
-    global NULL
-    return And(
-        (Not (encode_is_null(left_row, "INT"))), #left key is not null
-        Implies(on_pred, LeftJoin(left_row, right_row)),
-        Implies(Not(on_pred), LeftJoin(left_row, NULL)),
-        Implies(LeftJoin(left_row, right_row), on_pred)
-    )
-
-def encode_full_join(on_pred, left_row, right_row, FullJoin):
-    global NULL
-    return And(
-        Implies(on_pred, FullJoin(left_row, right_row)),
-        Implies(Not(on_pred), And(FullJoin(NULL, right_row), FullJoin(left_row, NULL))),
-        Implies(FullJoin(left_row, right_row), on_pred) 
-    )
-    
-
-# add constraints for simple WHERE clauses like 'R.age > 20' or 'T.id = 3'.
-def encode_where(schema, ast, idx, variables):
-    where = ast.args.get("where")
-    if not where:
-        return BoolVal(True)
-
-    expr = where.this
-    encoding = encode_condition(schema, expr, idx, variables)
-    return encoding
-
-
-def encode_condition(schema, expr, idx, variables, join=False):
-    global vars
-    key = expr.key.lower()
-
-    # for now, we're only handling simple comparisons: <, >, =, <=, >=
-    # and, or, not, (IS NULL / IS NOT NULL)
-    if isinstance(expr, exp.Condition):
-        if key in ["gt", "lt", "gte", "lte", "eq"]:
-            left, right = expr.args["this"], expr.args["expression"]
-            constraint = encode_comparison(schema, idx, left, right, key, variables)
-            if constraint is not None:
-                if (not join) :
-                    # add constraint saying that both sides cannot be null
-                    left, left_type = encode_expr(schema, idx, left, vars)
-                    right, right_type = encode_expr(schema, idx, right, vars)
-                    return And(And(constraint, (Not (encode_is_null(left, left_type)))), (Not (encode_is_null(right, right_type))))
-                
-                return constraint
+            if should_be_inner: # inner join (converted from outer)
+                encoding = And(self.encode_inner_join(cond, idx, variables), encoding)
+                continue
+
+            # outer join, the same boundary in both queries is built once (shared input mode)
+            left_row = variables["row_identity"][min(left_tables)]
+            right_row = variables["row_identity"][right_table_real]
+            temp = self.memoized(("outer", side, cond, min(left_tables), right_table_real),
+                                 lambda: self.encode_outer_join(side, cond, idx, variables, left_row, right_row))
+            encoding = And(temp, encoding)
+
+        return encoding
+
+
+    # an inner join condition: for inner joins it doesn't matter if the condition is placed in ON or
+    # WHERE, since we always use AND to connect them
+    def encode_inner_join(self, cond, idx, variables):
+        encoded_cond = self.encode_condition(cond, idx, variables, join=True)
+        # for inner join, add constarint that left and right are not null
+        # (compound ON conditions already carry the null checks of their comparisons, and
+        # in flags mode every comparison does)
+        if cond[0] in COMPARISONS and not self.flags:
+            return And(And(encoded_cond, self.encode_not_null(idx, cond[1])),
+                       self.encode_not_null(idx, cond[2]))
+        return encoded_cond
+
+
+    def encode_outer_join(self, side, cond, idx, variables, left_row, right_row):
+        encoded_cond = self.encode_condition(cond, idx, variables, join=True)
+        self.features.update(["functions", "INT"])
+        LeftJoin = Function("LeftJoin", IntSort(self.ctx), IntSort(self.ctx), BoolSort(self.ctx))
+        FullJoin = Function('FullJoin', IntSort(self.ctx), IntSort(self.ctx), BoolSort(self.ctx))
+
+        if (side == "left") :
+            return self.encode_left_join(encoded_cond, left_row, right_row, LeftJoin)
+        elif (side == "right") :
+            return self.encode_left_join(encoded_cond, right_row, left_row, LeftJoin)
+        elif (side == "full") :
+            return self.encode_full_join(encoded_cond, left_row, right_row, FullJoin)
+        raise UnsupportedQueryError(f"unknown join type: {side.upper()} JOIN")
+
+
+    def encode_left_join(self, on_pred, left_row, right_row, LeftJoin):
+        NULL = self.NULL
+        return And(
+            # left key is not null (rows have no null flag, so in flags mode they are never NULL)
+            BoolVal(True, self.ctx) if self.flags else Not(self.encode_is_null(left_row, "INT")),
+            Implies(on_pred, LeftJoin(left_row, right_row)),
+            Implies(Not(on_pred), LeftJoin(left_row, NULL)),
+            Implies(LeftJoin(left_row, right_row), on_pred)
+        )
+
+    def encode_full_join(self, on_pred, left_row, right_row, FullJoin):
+        NULL = self.NULL
+        return And(
+            Implies(on_pred, FullJoin(left_row, right_row)),
+            Implies(Not(on_pred), And(FullJoin(NULL, right_row), FullJoin(left_row, NULL))),
+            Implies(FullJoin(left_row, right_row), on_pred) 
+        )
+
+
+    # selectors mode: no functions over row identities. Every table has a Bool `{table}_present`,
+    # shared by both queries: together they say which output tuple is compared -- the present
+    # tables contribute their row, the others are null-extended. A query returns that tuple iff its
+    # joins produce exactly this presence pattern (and WHERE holds on it):
+    #   INNER JOIN R  ON must be TRUE, R is present -- unless a later RIGHT/FULL JOIN null-extends
+    #                 a table ON reads: then ON only has to hold when those tables are present
+    #   LEFT JOIN R   R is present iff ON is TRUE
+    #   RIGHT JOIN R  the tables joined before R stay present only if ON is TRUE, R is present
+    #   FULL JOIN R   if ON is TRUE both sides are present, otherwise one of them: R_present picks
+    #                 which of the two padded rows the tuple is
+    # ON and WHERE see the columns of a table that isn't present as NULL (see encode_padded).
+    # Outer joins converted by the WHERE check are encoded as inner joins, as in encode_join
+    def encode_join_selectors(self, ir, idx, variables, where_tables):
+        tables = list(dict.fromkeys(ir.alias_map.values()))
+        present = {table: Bool(f"{table}_present", self.ctx) for table in tables}
+        for table, var in present.items():
+            self.declared[str(var)] = (table, None, "present")
+
+        # which join is encoded how, and which tables it can null-extend
+        left_tables = [ir.from_table] if ir.from_table is not None else tables[:1]
+        plan, padded = [], self.padded
+        for join in ir.joins:
+            right_table = join.table
+            side = join.side
+            if join.on is None: # comma / cross join, its predicates live in WHERE
+                side = None
+            elif side == "left" and right_table in where_tables:
+                side = "" # LEFT JOIN with WHERE filtering on right table -> INNER JOIN
+            elif side == "right" and any(t in where_tables for t in left_tables):
+                side = ""
+            elif side == "full" and any(t in where_tables for t in left_tables + [right_table]):
+                side = ""
+            elif side not in ["", "left", "right", "full"]:
+                raise UnsupportedQueryError(f"unknown join type: {side.upper()} JOIN")
+            extended = {"left": [right_table], "right": left_tables, "full": left_tables + [right_table]}.get(side, [])
+            for table in extended:
+                padded[table] = Not(present[table])
+            plan.append((join, side, list(left_tables)))
+            left_tables.append(right_table)
+
+        encoding = []
+        reached = {table: BoolVal(True, self.ctx) for table in tables} # what the joins make of each table
+        for join, side, left in plan:
+            if side is None:
+                continue
+            # ON is TRUE: comparisons get their null checks, which include the padding
+            on_pred = self.encode_condition(join.on, idx, variables)
+            right_table = join.table
+            if side == "":
+                extended = [present[table] for table in sorted({t for t, _ in tree_columns(join.on)}) if table in padded]
+                encoding.append(Implies(And(extended), on_pred) if extended else on_pred)
+            elif side == "left":
+                reached[right_table] = on_pred
+            elif side == "right":
+                for table in left:
+                    reached[table] = And(reached[table], on_pred)
+            else: # side == "full"
+                reached[right_table] = Or(on_pred, present[right_table])
+                for table in left:
+                    reached[table] = And(reached[table], Or(on_pred, Not(present[right_table])))
+
+        for table in tables:
+            encoding.append(present[table] if is_true(reached[table]) else present[table] == reached[table])
+        return And(encoding)
+
+
+    # selectors mode: true when one of the tables an expression reads is null-extended
+    def encode_padded(self, expr):
+        padded = self.padded
+        conditions = [padded[table] for table in sorted({table for table, _ in tree_columns(expr)}) if table in padded]
+        if not conditions:
+            return BoolVal(False, self.ctx)
+        return conditions[0] if len(conditions) == 1 else Or(conditions)
+
+
+    # add constraints for simple WHERE clauses like 'R.age > 20' or 'T.id = 3'.
+    def encode_where(self, ir, idx, variables):
+        if ir.where is None:
+            return BoolVal(True, self.ctx)
+        return self.encode_condition(ir.where, idx, variables)
+
+
+    # shared input mode: both queries read the same variables, so a subtree encodes to the same term
+    # wherever it occurs (given the same padded tables) and is built once. `encode` builds the term
+    def memoized(self, key, encode):
+        if not self.shared:
+            return encode()
+        key += (frozenset(self.padded),)
+        if key not in self.memo:
+            self.memo[key] = encode()
+        return self.memo[key]
+
+
+    def encode_condition(self, expr, idx, variables, join=False):
+        return self.memoized(("condition", expr, join),
+                             lambda: self.encode_condition_tree(expr, idx, variables, join))
+
+    def encode_condition_tree(self, expr, idx, variables, join=False):
+        if self.flags:
+            # a row is kept (WHERE) or matched (ON) only if the condition is TRUE
+            return self.encode_condition_3vl(expr, idx, variables)[0]
+        key = expr[0]
+
+        # for now, we're only handling simple comparisons: <, >, =, <=, >=
+        # and, or, not, (IS NULL / IS NOT NULL)
+        if key in COMPARISONS:
+            left, right = expr[1], expr[2]
+            constraint = self.encode_comparison(idx, left, right, key, variables)
+            if (not join) :
+                # add constraint saying that both sides cannot be null
+                return And(And(constraint, self.encode_not_null(idx, left)), self.encode_not_null(idx, right))
+
+            return constraint
         elif key == "and":
-            return And(encode_condition(schema, expr.args["this"], idx, variables),
-                   encode_condition(schema, expr.args["expression"], idx, variables))
+            return And(self.encode_condition(expr[1], idx, variables),
+                   self.encode_condition(expr[2], idx, variables))
         elif key == "or":
-            return Or(encode_condition(schema, expr.args["this"], idx, variables),
-                   encode_condition(schema, expr.args["expression"], idx, variables))
+            return Or(self.encode_condition(expr[1], idx, variables),
+                   self.encode_condition(expr[2], idx, variables))
         elif key == "not":
-            return Not(encode_condition(schema, expr.args["this"], idx, variables))
-        elif key == "is":
-            name, type = encode_expr(schema, idx, expr.this, vars)
-            return encode_is_null(name, type)
-
-    exit(f"Unsupported type: {key}")
-
-
-
-# convert a simple comparison expression to a Z3 constraint
-def encode_comparison(schema, idx, left, right, op, variables):
-    var, _ = encode_expr(schema, idx, left, variables)
-    right_val, _ = encode_expr(schema, idx, right, variables)
-
-    if op == "gt":
-        return var > right_val
-    elif op == "lt":
-        return var < right_val
-    elif op == "gte":
-        return var >= right_val
-    elif op == "lte":
-        return var <= right_val
-    elif op == "eq":
-        return var == right_val
-    else:
-        return None
-
-# encode IS NULL conditions
-# tidi
-def encode_is_null(col_name, col_type="INT"):
-    # print(f"line330, col_name is {col_name}")
-    # col_name = str(col_name)
-    global null_funcs, vars
-    if col_type == "INT":
-        return null_funcs[0](col_name)
-    elif col_type =="STRING":
-        return null_funcs[1](col_name)
-    else: #col_type == "REAL"
-        return null_funcs[2](col_name)
-        
-
-def encode_expr(schema, idx, expr, variables):
-    global q1_alias_map, q2_alias_map
-    if (idx == 1): 
-        alias_map = q1_alias_map
-    elif (idx == 2):
-        alias_map = q2_alias_map
-    # literals
-    if isinstance(expr, exp.Literal):
-        if expr.is_int:
-            return IntVal(str(expr)), "INT"
-        if expr.is_number:
-            return RealVal(str(expr)), "REAL" #must use RealVal instead of Real
-        if expr.is_string:
-            return StringVal(expr.this), "STRING"
-        else:
-            exit(f"unknown type for {expr}")
+            return Not(self.encode_condition(expr[1], idx, variables))
+        elif key == "is_null":
+            name, type = self.encode_expr(idx, expr[1], self.vars)
+            if self.padded:
+                return Or(self.encode_is_null(name, type), self.encode_padded(expr[1]))
+            return self.encode_is_null(name, type)
+
+        raise UnsupportedQueryError(f"Unsupported type: {expr[1] if key == 'unsupported' else key}")
+
+
+
+    # convert a simple comparison expression to a Z3 constraint
+    def encode_comparison(self, idx, left, right, op, variables):
+        var, left_type = self.encode_expr(idx, left, variables)
+        right_val, right_type = self.encode_expr(idx, right, variables)
+        # checked here rather than left to z3, which only catches it when strings are z3 strings
+        if (left_type == "STRING") != (right_type == "STRING"):
+            raise UnsupportedQueryError(f"cannot compare {left_type} with {right_type}")
+
+        if op == "gt":
+            return var > right_val
+        elif op == "lt":
+            return var < right_val
+        elif op == "gte":
+            return var >= right_val
+        elif op == "lte":
+            return var <= right_val
+        else: # op == "eq"
+            return var == right_val
+
+    # an operand of a comparison is not null; literals never are, so they need no null check
+    # (applying the null functions to a literal would let the solver treat e.g. 9 as NULL)
+    def encode_not_null(self, idx, expr):
+        if expr[0] == "lit":
+            return BoolVal(True, self.ctx)
+        value, value_type = self.encode_expr(idx, expr, self.vars)
+        if self.padded:
+            return And(Not(self.encode_is_null(value, value_type)), Not(self.encode_padded(expr)))
+        return Not(self.encode_is_null(value, value_type))
+
+    # flags mode: a condition in three-valued logic as the pair (is TRUE, is FALSE);
+    # UNKNOWN is neither. A comparison is UNKNOWN when an operand is NULL, AND/OR/NOT follow Kleene
+    def encode_condition_3vl(self, expr, idx, variables):
+        return self.memoized(("3vl", expr), lambda: self.encode_condition_3vl_tree(expr, idx, variables))
+
+    def encode_condition_3vl_tree(self, expr, idx, variables):
+        key = expr[0]
+        if key in COMPARISONS:
+            cmp = self.encode_comparison(idx, expr[1], expr[2], key, variables)
+            known = Not(Or(self.encode_null_flag(expr[1]), self.encode_null_flag(expr[2])))
+            return And(known, cmp), And(known, Not(cmp))
+        elif key == "and":
+            l_true, l_false = self.encode_condition_3vl(expr[1], idx, variables)
+            r_true, r_false = self.encode_condition_3vl(expr[2], idx, variables)
+            return And(l_true, r_true), Or(l_false, r_false)
+        elif key == "or":
+            l_true, l_false = self.encode_condition_3vl(expr[1], idx, variables)
+            r_true, r_false = self.encode_condition_3vl(expr[2], idx, variables)
+            return Or(l_true, r_true), And(l_false, r_false)
+        elif key == "not":
+            is_true, is_false = self.encode_condition_3vl(expr[1], idx, variables)
+            return is_false, is_true
+        elif key == "is_null":
+            # IS NULL itself is never UNKNOWN
+            is_null = self.encode_null_flag(expr[1])
+            return is_null, Not(is_null)
+
+        raise UnsupportedQueryError(f"Unsupported type: {expr[1] if key == 'unsupported' else key}")
+
+
+    # flags mode: is an expression NULL -- a literal never is, a column is if its flag is set and
+    # arithmetic is if any operand is
+    def encode_null_flag(self, expr):
+        key = expr[0]
+        if key == "lit":
+            return BoolVal(False, self.ctx)
+        if key == "col":
+            if expr[1] in self.padded:
+                return Or(self.vars[expr[1]][expr[2]], self.padded[expr[1]])
+            return self.vars[expr[1]][expr[2]]
+        if key in ["add", "sub", "mul", "neg"]:
+            nulls = [self.encode_null_flag(operand) for operand in expr[1:]]
+            nulls = [n for n in nulls if not is_false(n)]
+            if not nulls:
+                return BoolVal(False, self.ctx)
+            return nulls[0] if len(nulls) == 1 else Or(nulls)
+
+        raise UnsupportedQueryError(f"encode_expr: could not resolve {expr[2] if key == 'unsupported' else expr}")
+
+
+    # encode IS NULL conditions
+    # tidi
+    def encode_is_null(self, col_name, col_type="INT"):
+        # print(f"line330, col_name is {col_name}")
+        # col_name = str(col_name)
+        null_funcs = self.null_funcs
+        self.features.add("functions")
+        if col_type == "INT":
+            return null_funcs[0](col_name)
+        elif col_type =="STRING" and self.string_ranks is not None:
+            return Function("NullStringRank", IntSort(self.ctx), BoolSort(self.ctx))(col_name)
+        elif col_type =="STRING":
+            return null_funcs[1](col_name)
+        else: #col_type == "REAL"
+            return null_funcs[2](col_name)
+
+
+    def encode_expr(self, idx, expr, variables):
+        key = expr[0]
+        # literals
+        if key == "lit":
+            _, lit_type, value = expr
+            if lit_type == "STRING" and self.string_ranks is not None:
+                return IntVal(self.string_ranks.rank(value), self.ctx), "STRING"
+            if lit_type != "INT": # an integer literal next to a real is just a real numeral
+                self.features.add(lit_type)
+            if lit_type == "INT":
+                return IntVal(value, self.ctx), "INT"
+            if lit_type == "REAL":
+                return RealVal(value, self.ctx), "REAL" #must use RealVal instead of Real
+            return StringVal(value, self.ctx), "STRING"
 
-    if isinstance(expr, exp.Condition):
-        key = expr.key.lower()
         # handle math ops
         if key in ["add", "sub", "mul"]:
-            left, right = expr.args["this"], expr.args["expression"]
-            left, left_type = encode_expr(schema, idx, left, variables)
-            right, right_type = encode_expr(schema, idx, right, variables)
-            
+            left, left_type = self.encode_expr(idx, expr[1], variables)
+            right, right_type = self.encode_expr(idx, expr[2], variables)
+
             if (left_type == "STRING" or right_type == "STRING"):
-                exit("cannot perform arithematic operation on String type")
-            elif ((left_type != "INT" and left_type != "REAL") and 
-                  (right_type != "INT" and right_type != "REAL") and (left_type != right_type)):
-                exit(f"type mistach between {left_type} and {right_type}")
+                raise UnsupportedQueryError("cannot perform arithematic operation on String type")
+            if key == "mul" and tree_columns(expr[1]) and tree_columns(expr[2]):
+                self.features.add("nonlinear")
 
             if key == "add":
                 return left + right, left_type
             elif key == "sub":
                 return left - right, left_type
-            elif key == "mul":
+            else: # key == "mul"
                 return left * right, left_type
-            else:
-                raise ValueError(f"Unsupported math operation {key}")
-   
-    if isinstance(expr, exp.Column):
-        table = alias_map[str(expr.table)]
-        column = str(expr.this)
-        return variables[table][column], schema[table][column]
-    
-    exit(f"encode_expr: could not resolve {expr}")
-
-
-def exit(err_message):
-    print(err_message)
-    sys.exit(1)
\ No newline at end of file
+
+        if key == "neg":
+            value, value_type = self.encode_expr(idx, expr[1], variables)
+            if value_type == "STRING":
+                raise UnsupportedQueryError("cannot perform arithematic operation on String type")
+            return -value, value_type
+
+        if key == "col":
+            # the IR already resolved the alias to the real table
+            _, table, column = expr
+            return variables[table][column], self.schema[table][column]
+
+        raise UnsupportedQueryError(f"encode_expr: could not resolve {expr[2] if key == 'unsupported' else expr}")
+
+
+# column -> Z3 variable for one table. Variables are created (and recorded in `declared`) when
+# they are first looked up, so `column in columns` tells whether an encoding referred to it
+class LazyColumns(dict):
+    def __init__(self, encoder, table, idx):
+        super().__init__()
+        self.encoder = encoder
+        self.table = table
+        self.idx = idx
+
+    def __missing__(self, column):
+        encoder = self.encoder
+        col_type = encoder.schema[self.table][column]
+        var_name = f"{self.table}_{self.idx}_{column}"
+        if self.idx == "null": # null flag of the column (flags mode)
+            var = Bool(var_name, encoder.ctx)
+        elif col_type == "INT":
+            encoder.features.add(col_type)
+            var = Int(var_name, encoder.ctx)
+        elif col_type =="STRING" and encoder.string_ranks is not None:
+            # the rank of the string (see stringranks.py), limited to the ranks some string has
+            ranks = encoder.string_ranks
+            encoder.features.add("INT")
+            var = Int(var_name, encoder.ctx)
+            encoder.s.add(var >= 1, var <= ranks.top, *[Or(var < low, var > high) for low, high in ranks.excluded()])
+        elif col_type =="STRING":
+            encoder.features.add(col_type)
+            var = String(var_name, encoder.ctx)
+        else: #col_type == "REAL"
+            encoder.features.add(col_type)
+            var = Real(var_name, encoder.ctx)
+        encoder.declared[var_name] = (self.table, column, self.idx)
+        self[column] = var
+        return var
+
+
+# ---------------------------------------------------------------------------------------------
+# cone of influence: only the assertions that share a symbol (directly or through other
+# assertions) with q1_result/q2_result can affect the answer. Uninterpreted functions count as
+# shared symbols, since NullInt(x) and NullInt(y) interact as soon as x = y.
+
+def prune_solver(solver, logic=None):
+    assertions = list(solver.assertions())
+    parent = {}
+
+    def find(x):
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    syms = [symbols(a) for a in assertions]
+    for ss in syms:
+        ss = list(ss)
+        for other in ss[1:]:
+            parent[find(other)] = find(ss[0])
+
+    roots = {find(name) for name in ["q1_result", "q2_result"] if name in parent}
+    kept = [a for a, ss in zip(assertions, syms) if not ss or find(next(iter(ss))) in roots]
+    dropped = [a for a, ss in zip(assertions, syms) if ss and find(next(iter(ss))) not in roots]
+
+    report = {"before": formula_size(assertions), "after": formula_size(kept)}
+    if dropped:
+        # the dropped part shares nothing with the kept one, so dropping it is only safe if it is
+        # satisfiable on its own (it normally is: schema constraints over otherwise unused columns)
+        check = Solver(ctx=solver.ctx)
+        check.add(dropped)
+        if check.check() != sat:
+            report["after"] = report["before"]
+            kept = assertions
+
+    # the solver is rebuilt anyway, so this is where it gets specialized to the pair's logic
+    pruned = make_solver(logic, solver.ctx)
+    pruned.add(kept)
+    return pruned, report
+
+
+# the conjuncts of a formula (nested Ands flattened) by z3 AST id; z3 hash-conses its terms, so
+# equal conjuncts built over the same variables have the same id
+def conjuncts(expr):
+    found, todo = {}, [expr]
+    while todo:
+        e = todo.pop()
+        if is_and(e):
+            todo.extend(e.children())
+        elif not is_true(e):
+            found[e.get_id()] = e
+    return found
+
+
+# names of the uninterpreted constants and functions in a formula
+def symbols(expr):
+    found, seen, todo = set(), set(), [expr]
+    while todo:
+        e = todo.pop()
+        if e.get_id() in seen:
+            continue
+        seen.add(e.get_id())
+        if is_app(e):
+            if e.decl().kind() == Z3_OP_UNINTERPRETED:
+                found.add(e.decl().name())
+            todo.extend(e.children())
+    return found
+
+
+# size of a list of assertions: how many there are and how many distinct AST nodes they contain
+def formula_size(assertions):
+    seen, todo = set(), list(assertions)
+    while todo:
+        e = todo.pop()
+        if e.get_id() in seen:
+            continue
+        seen.add(e.get_id())
+        if is_app(e):
+            todo.extend(e.children())
+    return {"assertions": len(assertions), "nodes": len(seen)}
+
+
+COMPARISONS = ["gt", "lt", "gte", "lte", "eq"]
@@ -0,0 +1,30 @@
+# the errors the checker reports. The command line prints the message and exits with status 1,
+# the library API (api.check_equivalence) raises them to the caller.
+
+class EquivalenceError(Exception):
+    pass
+
+
+# the schema or a query is not valid SQL, or a query file holds more than one statement
+class ParseError(EquivalenceError):
+    pass
+
+
+# the schema uses a column type the checker doesn't model
+class SchemaError(EquivalenceError):
+    pass
+
+
+# a query refers to a table or column the schema doesn't have
+class InvalidQueryError(EquivalenceError):
+    pass
+
+
+# a query uses SQL the encoding doesn't support (GROUP BY, subqueries, arithmetic on TEXT, ...)
+class UnsupportedQueryError(EquivalenceError):
+    pass
+
+
+# the queries can't be equivalent for structural reasons: different columns, tables or LIMIT
+class IncomparableQueriesError(EquivalenceError):
+    pass
@@ -0,0 +1,282 @@
+import itertools
+import random
+import sqlite3
+import time
+from collections import Counter
+from ir import tree_columns
+
+# differential falsifier, run before the SMT encoding: both queries are executed with sqlite3 on
+# small in-memory databases and their results are compared as multisets. Most non-equivalent
+# pairs differ on some tiny database, and finding it this way is much cheaper than encoding.
+#
+# the databases are built from value pools per column:
+#   - a few default values per type, plus the literals the queries compare the column with, +-1
+#   - for a column compared with arithmetic over other columns (a.x < b.y * 2), the values of that
+#     expression over the other columns' pools, +-1
+#   - columns compared with each other (join keys, a.x = b.y) share their pool, so generated
+#     rows both match and miss each other
+#   - NULL for nullable columns
+# first come boundary databases (one row per table walking through the pools, NULLs included,
+# empty tables), then random ones with up to max_rows rows per table, until the time budget is
+# used up or max_databases were tried. A difference is shrunk by dropping rows that aren't needed
+# to reproduce it.
+# Finding nothing proves nothing, the pair then goes to the solver as usual.
+
+DEFAULT_BUDGET = 0.1  # seconds
+# the pools are small, so after this many databases new ones mostly repeat earlier ones
+MAX_DATABASES = 500
+MAX_ROWS = 3
+NULL_RATE = 0.25
+
+SQLITE_TYPES = {"INT": "INTEGER", "REAL": "REAL", "STRING": "TEXT"}
+# sqlite INTEGERs are 64 bit, pool values outside this range are left out
+INT_RANGE = (-2 ** 63, 2 ** 63 - 1)
+DEFAULT_VALUES = {"INT": [0, 1, -1], "REAL": [0.0, 1.5, -1.0], "STRING": ["", "a"]}
+
+# how often the falsifier ran / found a counterexample
+stats = {"checked": 0, "hits": 0}
+
+
+def falsifier_stats():
+    return dict(stats)
+
+
+# returns a counterexample dict, or None if no difference was found within the budget:
+#   {"database": {table: [{col: value, ...}, ...]}, "q1_rows": [[...], ...], "q2_rows": [[...], ...]}
+# q1/q2 are the lowered queries (ir.QueryIR) of q1_ast/q2_ast, which must have passed sanity_check
+def falsify(schema, q1_ast, q2_ast, q1, q2, budget=DEFAULT_BUDGET, seed=0, max_rows=MAX_ROWS,
+            max_databases=MAX_DATABASES):
+    # without ORDER BY, which rows LIMIT/OFFSET keep is up to the database
+    if budget <= 0 or q1.limit is not None or q1.offset is not None:
+        return None
+    # sqlite computes with floats where the encoder has exact reals (0.1 * 3 != 0.3)
+    if real_arithmetic(schema, q1) or real_arithmetic(schema, q2):
+        return None
+    stats["checked"] += 1
+
+    tables = sorted(q1.tables() | q2.tables())
+    sql1, sql2 = q1_ast.sql(dialect="sqlite"), q2_ast.sql(dialect="sqlite")
+    db = sqlite3.connect(":memory:")
+    try:
+        create_tables(db, schema, tables)
+        try:
+            pools = value_pools(schema, tables, [q1, q2])
+        except (OverflowError, ValueError):
+            return None  # a literal too large for a float or an INTEGER
+        rng = random.Random(seed)
+        deadline = time.perf_counter() + budget
+        for database in itertools.islice(databases(schema, tables, pools, rng, max_rows), max_databases):
+            try:
+                diff = compare(db, schema, database, sql1, sql2)
+            except (sqlite3.Error, OverflowError, ValueError):
+                return None  # something sqlite doesn't run the way we encode it, leave it to the solver
+            if diff is not None:
+                stats["hits"] += 1
+                return shrink(db, schema, database, sql1, sql2, diff)
+            if time.perf_counter() > deadline:
+                return None
+    finally:
+        db.close()
+    return None
+
+
+def create_tables(db, schema, tables):
+    for table in tables:
+        columns = ", ".join(f'"{col}" {SQLITE_TYPES[schema[table][col]]}' for col in schema[table])
+        db.execute(f'CREATE TABLE "{table}" ({columns})')
+
+
+# replace the rows of the tables with those of the database
+def load(db, schema, database):
+    for table, rows in database.items():
+        db.execute(f'DELETE FROM "{table}"')
+        if rows:
+            marks = ", ".join("?" * len(schema[table]))
+            db.executemany(f'INSERT INTO "{table}" VALUES ({marks})', rows)
+
+
+# loads the database and runs both queries; returns (q1 rows, q2 rows) if the multisets differ
+def compare(db, schema, database, sql1, sql2):
+    load(db, schema, database)
+    rows1, rows2 = db.execute(sql1).fetchall(), db.execute(sql2).fetchall()
+    if Counter(rows1) != Counter(rows2):
+        return rows1, rows2
+    return None
+
+
+# greedily drop rows while the queries still disagree, then build the counterexample dict
+def shrink(db, schema, database, sql1, sql2, diff):
+    database = {table: list(rows) for table, rows in database.items()}
+    for table in database:
+        i = 0
+        while i < len(database[table]):
+            smaller = dict(database)
+            smaller[table] = database[table][:i] + database[table][i + 1:]
+            smaller_diff = compare(db, schema, smaller, sql1, sql2)
+            if smaller_diff is not None:
+                database, diff = smaller, smaller_diff
+            else:
+                i += 1
+    return {
+        "database": {table: [dict(zip(schema[table], row)) for row in rows] for table, rows in database.items()},
+        "q1_rows": [list(row) for row in sorted(diff[0], key=repr)],
+        "q2_rows": [list(row) for row in sorted(diff[1], key=repr)],
+    }
+
+
+# ---------------------------------------------------------------------------------------------
+# value pools
+
+# (table, column) -> list of candidate values (None = NULL for nullable columns)
+def value_pools(schema, tables, queries):
+    pools = {(t, c): set(DEFAULT_VALUES[schema[t][c]]) for t in tables for c in schema[t]}
+    groups = {key: {key} for key in pools}
+
+    found = [c for ir in queries for tree in [ir.where] + [join.on for join in ir.joins] for c in comparisons(tree)]
+    for op, left, right in found:
+        if left[0] == "col" and right[0] == "col":
+            merge(groups, (left[1], left[2]), (right[1], right[2]))
+        for col, lit in [(left, right), (right, left)]:
+            if col[0] == "col" and lit[0] == "lit" and (col[1], col[2]) in pools:
+                pools[(col[1], col[2])] |= boundary_values(schema[col[1]][col[2]], lit)
+
+    # second pass, now that the pools of the columns inside the expressions are known
+    arithmetic = {}
+    for op, left, right in found:
+        for col, expr in [(left, right), (right, left)]:
+            if col[0] == "col" and expr[0] in ["add", "sub", "mul", "neg"] and (col[1], col[2]) in pools:
+                col_type = schema[col[1]][col[2]]
+                for value in expression_values(expr, pools):
+                    if col_type == "INT":
+                        value = int(value)
+                    arithmetic.setdefault((col[1], col[2]), set()).update({value - 1, value, value + 1})
+    for key, values in arithmetic.items():
+        pools[key] |= values
+
+    # columns compared with each other draw from the same values
+    for key, group in groups.items():
+        shared = set()
+        for member in group:
+            if schema[member[0]][member[1]] == schema[key[0]][key[1]]:
+                shared |= pools[member]
+        pools[key] = shared
+
+    result = {}
+    for (table, col), values in pools.items():
+        if schema[table][col] == "INT":
+            values = {v for v in values if INT_RANGE[0] <= v <= INT_RANGE[1]}
+        values = sorted(values, key=repr)
+        if schema[table].is_nullable(col):
+            values.append(None)
+        result[(table, col)] = values
+    return result
+
+
+def merge(groups, a, b):
+    if a not in groups or b not in groups or groups[a] is groups[b]:
+        return
+    union = groups[a] | groups[b]
+    for key in union:
+        groups[key] = union
+
+
+# the literal and its neighbours, converted to the column's type
+def boundary_values(col_type, lit):
+    _, lit_type, text = lit
+    if col_type == "STRING":
+        return {text, text + "a", text[:-1]} if lit_type == "STRING" else set()
+    if lit_type == "STRING":
+        return set()
+    value = float(text) if col_type == "REAL" else int(float(text))
+    values = {value - 1, value, value + 1}
+    if col_type == "REAL":
+        values |= {value - 0.5, value + 0.5}
+    return values
+
+
+# values of an arithmetic expression over the first few combinations of its columns' pools
+def expression_values(expr, pools, limit=16):
+    columns = sorted(tree_columns(expr))
+    if any(col not in pools for col in columns):
+        return set()
+    choices = [sorted((v for v in pools[col] if isinstance(v, (int, float))), key=repr) for col in columns]
+    values = set()
+    for combination in itertools.islice(itertools.product(*choices), limit):
+        value = evaluate(expr, dict(zip(columns, combination)))
+        if value is not None:
+            values.add(value)
+    return values
+
+
+def evaluate(expr, env):
+    key = expr[0]
+    if key == "col":
+        return env.get((expr[1], expr[2]))
+    if key == "lit":
+        return None if expr[1] == "STRING" else float(expr[2]) if expr[1] == "REAL" else int(expr[2])
+    if key == "neg":
+        value = evaluate(expr[1], env)
+        return None if value is None else -value
+    if key in ["add", "sub", "mul"]:
+        left, right = evaluate(expr[1], env), evaluate(expr[2], env)
+        if left is None or right is None:
+            return None
+        return left + right if key == "add" else left - right if key == "sub" else left * right
+    return None
+
+
+# does the query do arithmetic on REAL columns or literals anywhere in its conditions
+def real_arithmetic(schema, ir):
+    def real(tree, in_arithmetic):
+        key = tree[0]
+        if key == "col":
+            return in_arithmetic and schema[tree[1]][tree[2]] == "REAL"
+        if key == "lit":
+            return in_arithmetic and tree[1] == "REAL"
+        if key == "unsupported":
+            return False
+        in_arithmetic = in_arithmetic or key in ["add", "sub", "mul", "neg"]
+        return any(real(child, in_arithmetic) for child in tree[1:])
+    return any(tree is not None and real(tree, False) for tree in [ir.where] + [join.on for join in ir.joins])
+
+
+# (op, left, right) for every comparison in a predicate tree
+def comparisons(tree):
+    if tree is None or tree[0] in ["col", "lit", "unsupported"]:
+        return []
+    if tree[0] in ["gt", "lt", "gte", "lte", "eq", "neq"]:
+        return [tree]
+    found = []
+    for child in tree[1:]:
+        if isinstance(child, tuple):
+            found += comparisons(child)
+    return found
+
+
+# ---------------------------------------------------------------------------------------------
+# databases: {table: [row tuple, ...]}
+
+def databases(schema, tables, pools, rng, max_rows):
+    # boundary databases: a single row per table walking through the pools
+    longest = max(len(pools[(t, c)]) for t in tables for c in schema[t])
+    for k in range(longest):
+        yield {t: [tuple(pools[(t, c)][k % len(pools[(t, c)])] for c in schema[t])] for t in tables}
+    # every table empty in turn, the others with one row
+    for empty in tables:
+        yield {t: [] if t == empty else [tuple(pools[(t, c)][0] for c in schema[t])] for t in tables}
+
+    # random databases
+    while True:
+        database = {}
+        for t in tables:
+            rows = []
+            for _ in range(rng.randint(0, max_rows)):
+                rows.append(tuple(random_value(rng, pools[(t, c)]) for c in schema[t]))
+            database[t] = rows
+        yield database
+
+
+def random_value(rng, pool):
+    if pool[-1] is None and rng.random() < NULL_RATE:
+        return None
+    return rng.choice(pool[:-1] if pool[-1] is None else pool)
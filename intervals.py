@@ -0,0 +1,207 @@
+import math
+from fractions import Fraction
+
+# solver-free pre-solver for single-table queries whose WHERE clauses only compare columns with
+# literals (gt/lt/gte/lte/eq) under AND/OR/NOT, plus IS [NOT] NULL (main.py runs it after the
+# canonical fast path, before the falsifier).
+#
+# Abstract domain: the literals a column is compared with cut its values into intervals -- the
+# literals themselves and the open intervals between and around them -- plus NULL (unless the
+# column is NOT NULL). Every comparison in either query is constant on each of those intervals,
+# so a predicate is determined by its value on one representative per interval:
+#   age > 20 OR age = 5     age: (-inf, 5) {5} (5, 20) {20} (20, +inf) NULL
+#                                 FALSE   TRUE FALSE  FALSE  TRUE       UNKNOWN
+# and the two queries are equivalent iff their WHERE clauses are TRUE on the same combinations of
+# intervals over all the columns they read (evaluated in three-valued logic, as SQL does: a row is
+# returned only if WHERE is TRUE). A combination where they differ is a counterexample tuple.
+# INT columns only get the intervals that contain an integer; TEXT columns are only cut by
+# equality (their literals plus one other string), ordering comparisons on strings are left to
+# the solver, and so are column-to-column comparisons, arithmetic, != and anything else.
+
+# give up (and leave the pair to the solver) above this many interval combinations
+MAX_COMBINATIONS = 4096
+
+# how often the pre-solver was tried / answered, see interval_stats()
+stats = {"checked": 0, "hits": 0}
+
+
+def interval_stats():
+    return dict(stats)
+
+
+class NotAbstract(Exception):
+    pass
+
+
+# the verdict dict for the pair, {"verdict": "equivalent"} or {"verdict": "counterexample",
+# "counterexample": {...}} as main.extract_counterexample builds it, or None when the queries are
+# outside the domain. Expects queries that passed sanity_check
+def decide(schema, q1, q2):
+    stats["checked"] += 1
+    try:
+        verdict = decide_abstract(schema, q1, q2)
+    except NotAbstract:
+        return None
+    stats["hits"] += 1
+    return verdict
+
+
+def decide_abstract(schema, q1, q2):
+    if q1.joins or q2.joins or len(set(q1.alias_map.values()) | set(q2.alias_map.values())) != 1:
+        raise NotAbstract()
+    if q1.projections != q2.projections:
+        raise NotAbstract()
+    table = next(iter(q1.alias_map.values()))
+
+    literals = {}  # column -> literal values it is compared with
+    for ir in [q1, q2]:
+        collect_literals(ir.where, schema, literals)
+    columns = sorted(literals, key=list(schema[table]).index)
+    points = [representatives(schema[table][col], literals[col], col not in schema.not_null.get(table, []))
+              for col in columns]
+
+    total = 1
+    for values in points:
+        total *= len(values)
+    if total > MAX_COMBINATIONS:
+        raise NotAbstract()
+
+    for combination in product(points):
+        row = dict(zip(columns, combination))
+        r1, r2 = evaluate(q1.where, row) is True, evaluate(q2.where, row) is True
+        if r1 != r2:
+            if q1.limit == 0 or q1.offset:
+                raise NotAbstract()  # a one-row table can't show the difference
+            return {"verdict": "counterexample",
+                    "counterexample": {"tables": {table: {col: show(schema[table][col], row[col]) for col in columns}},
+                                       "q1_result": r1, "q2_result": r2}}
+    return {"verdict": "equivalent"}
+
+
+def product(points):
+    combinations = [()]
+    for values in points:
+        combinations = [c + (v,) for c in combinations for v in values]
+    return combinations
+
+
+# column name -> set of the literals it is compared with in the tree, raising NotAbstract for
+# anything outside the domain
+def collect_literals(tree, schema, literals):
+    if tree is None:
+        return
+    key = tree[0]
+    if key in ["and", "or"]:
+        collect_literals(tree[1], schema, literals)
+        collect_literals(tree[2], schema, literals)
+    elif key == "not":
+        collect_literals(tree[1], schema, literals)
+    elif key == "is_null":
+        if tree[1][0] != "col":
+            raise NotAbstract()
+        literals.setdefault(tree[1][2], set())
+    elif key in COMPARISONS:
+        column, literal, _ = comparison(tree)
+        col_type = schema[column[1]][column[2]]
+        if (col_type == "STRING") != (literal[1] == "STRING"):
+            raise NotAbstract()
+        if col_type == "STRING" and key != "eq":
+            raise NotAbstract()
+        literals.setdefault(column[2], set()).add(value(literal))
+    else:
+        raise NotAbstract()
+
+
+# (column, literal, op as seen from the column) of a column-vs-literal comparison
+def comparison(tree):
+    op, left, right = tree
+    if left[0] == "col" and right[0] == "lit":
+        return left, right, op
+    if left[0] == "lit" and right[0] == "col":
+        return right, left, FLIPPED.get(op, op)
+    raise NotAbstract()
+
+
+def value(literal):
+    _, lit_type, text = literal
+    return text if lit_type == "STRING" else Fraction(text)
+
+
+# one value per interval the literals cut the column's domain into, and None for NULL
+def representatives(col_type, literals, nullable):
+    if col_type == "STRING":
+        other = "other"
+        while other in literals:
+            other += "_"
+        points = sorted(literals) + [other]
+    else:
+        bounds = sorted(literals)
+        points = []
+        for low, high in zip([None] + bounds, bounds + [None]):
+            inside = between(low, high, col_type == "INT")
+            if inside is not None:
+                points.append(inside)
+            if high is not None and (col_type != "INT" or high.denominator == 1):
+                points.append(high)
+    return points + [None] if nullable else points
+
+
+# a value strictly between low and high (None: unbounded), an integer if `integer`; None if empty
+def between(low, high, integer):
+    if low is None and high is None:
+        return Fraction(0)
+    if low is None:
+        return Fraction(math.ceil(high) - 1) if integer else high - 1
+    if high is None:
+        return Fraction(math.floor(low) + 1) if integer else low + 1
+    if integer:
+        candidate = Fraction(math.floor(low) + 1)
+        return candidate if candidate < high else None
+    return (low + high) / 2
+
+
+# the predicate in three-valued logic: True, False or None (UNKNOWN)
+def evaluate(tree, row):
+    if tree is None:
+        return True
+    key = tree[0]
+    if key == "and":
+        left, right = evaluate(tree[1], row), evaluate(tree[2], row)
+        if left is False or right is False:
+            return False
+        return None if left is None or right is None else True
+    if key == "or":
+        left, right = evaluate(tree[1], row), evaluate(tree[2], row)
+        if left is True or right is True:
+            return True
+        return None if left is None or right is None else False
+    if key == "not":
+        inner = evaluate(tree[1], row)
+        return None if inner is None else not inner
+    if key == "is_null":
+        return row[tree[1][2]] is None
+    column, literal, op = comparison(tree)
+    x = row[column[2]]
+    if x is None:
+        return None
+    return COMPARE[op](x, value(literal))
+
+
+# a counterexample value as the solver's counterexamples show it
+def show(col_type, x):
+    if x is None:
+        return "NULL"
+    if col_type == "STRING":
+        return f'"{x}"'
+    return str(x)
+
+
+COMPARISONS = ["gt", "lt", "gte", "lte", "eq"]
+FLIPPED = {"gt": "lt", "lt": "gt", "gte": "lte", "lte": "gte"}
+COMPARE = {
+    "gt": lambda x, y: x > y,
+    "lt": lambda x, y: x < y,
+    "gte": lambda x, y: x >= y,
+    "lte": lambda x, y: x <= y,
+    "eq": lambda x, y: x == y,
+}
@@ -0,0 +1,180 @@
+from sqlglot import expressions as exp
+
+# compact intermediate representation of a query, built in a single visitor pass over the
+# sqlglot AST and shared by sanity_check and the encoder (and picklable, so it can be cached
+# or sent to worker processes).
+#
+# predicates and expressions are nested tuples:
+#   ("col", table, column)            table is the real table name (aliases are resolved)
+#   ("lit", "INT"|"REAL"|"STRING", text)
+#   ("add"|"sub"|"mul", left, right), ("neg", e)
+#   ("gt"|"lt"|"gte"|"lte"|"eq"|"neq", left, right)
+#   ("and"|"or", left, right), ("not", e), ("is_null", e)
+#   ("unsupported", key, sql)         anything else, reported when it is encoded
+
+
+class Join:
+    __slots__ = ("table", "alias", "side", "on")
+
+    def __init__(self, table, alias, side, on):
+        self.table = table  # real table name
+        self.alias = alias  # name used in the query
+        self.side = side    # "left" | "right" | "full", "" for inner joins
+        self.on = on        # predicate tree, None for comma / cross joins
+
+    def __repr__(self):
+        return f"Join({self.side or 'inner'} {self.table}, on={self.on})"
+
+
+class QueryIR:
+    __slots__ = ("alias_map", "columns", "from_table", "joins", "where", "projections",
+                 "limit", "offset", "unsupported")
+
+    def __init__(self):
+        self.alias_map = {}     # alias (or table name) -> real table name, in order of appearance
+        self.columns = []       # (alias as written, real table, column) for every column reference
+        self.from_table = None  # real name of the FROM table
+        self.joins = []         # [Join]
+        self.where = None       # predicate tree
+        self.projections = []   # ("column", name, tree) | ("alias", name, tree) | ("star",) | ("other", sql)
+        self.limit = None
+        self.offset = None
+        self.unsupported = []   # names of SQL features the verifier doesn't handle
+
+    def tables(self):
+        return set(self.alias_map.values())
+
+    def __repr__(self):
+        return f"QueryIR(tables={self.alias_map}, joins={self.joins}, where={self.where})"
+
+
+# the features sanity_check rejects, by node type
+UNSUPPORTED = [
+    (exp.Group, "GROUP BY"),
+    (exp.Having, "HAVING"),
+    (exp.Union, "UNION / INTERSECT / EXCEPT"),
+    (exp.Intersect, "UNION / INTERSECT / EXCEPT"),
+    (exp.Except, "UNION / INTERSECT / EXCEPT"),
+    (exp.Subquery, "Subqueries (EXISTS/IN/SELECT in WHERE)"),
+    (exp.Order, "ORDER BY"),
+]
+
+UNSUPPORTED_TYPES = tuple(kind for kind, _ in UNSUPPORTED)
+
+BINARY = {
+    exp.Add: "add", exp.Sub: "sub", exp.Mul: "mul",
+    exp.GT: "gt", exp.LT: "lt", exp.GTE: "gte", exp.LTE: "lte", exp.EQ: "eq", exp.NEQ: "neq",
+    exp.And: "and", exp.Or: "or",
+}
+
+
+def lower_query(ast):
+    ir = QueryIR()
+    limit = offset = None
+
+    # the single walk over the whole tree: tables, columns, limit/offset and unsupported features
+    for node in ast.walk():
+        if isinstance(node, exp.Table):
+            alias = node.args.get("alias")
+            ir.alias_map[alias.name if alias else node.name] = node.name
+        elif isinstance(node, exp.Column):
+            ir.columns.append(node)
+        elif isinstance(node, exp.Limit):
+            limit = limit or node
+        elif isinstance(node, exp.Offset):
+            offset = offset or node
+        elif isinstance(node, exp.Func) and not isinstance(node, (exp.And, exp.Or)):
+            add_unsupported(ir, "Aggregation functions")
+        elif isinstance(node, UNSUPPORTED_TYPES):
+            for kind, feature in UNSUPPORTED:
+                if isinstance(node, kind):
+                    add_unsupported(ir, feature)
+    if ast.args.get("distinct"):
+        add_unsupported(ir, "DISTINCT")
+
+    ir.columns = [(col.table, ir.alias_map.get(col.table, col.table), col.name) for col in ir.columns]
+    if limit is not None:
+        ir.limit = literal_int(limit.expression)
+    if offset is not None:
+        ir.offset = literal_int(offset.expression)
+
+    if not isinstance(ast, exp.Select):
+        return ir
+
+    from_clause = ast.args.get("from") or ast.args.get("from_")
+    if from_clause is not None and isinstance(from_clause.this, exp.Table):
+        ir.from_table = from_clause.this.name
+
+    for join in ast.args.get("joins") or []:
+        table = join.this
+        if not isinstance(table, exp.Table):
+            add_unsupported(ir, "Subqueries (EXISTS/IN/SELECT in WHERE)")
+            continue
+        on = join.args.get("on")
+        ir.joins.append(Join(table.name, table.alias_or_name, (join.side or "").lower(),
+                             lower_expr(on, ir.alias_map) if on is not None else None))
+
+    where = ast.args.get("where")
+    if where is not None:
+        ir.where = lower_expr(where.this, ir.alias_map)
+
+    for expr in ast.expressions:
+        if isinstance(expr, exp.Column):
+            ir.projections.append(("column", expr.name, lower_expr(expr, ir.alias_map)))
+        elif isinstance(expr, exp.Alias):
+            ir.projections.append(("alias", expr.alias or str(expr.this), lower_expr(expr.this, ir.alias_map)))
+        elif isinstance(expr, exp.Star):
+            ir.projections.append(("star",))
+        else:
+            ir.projections.append(("other", expr.sql()))
+    return ir
+
+
+def add_unsupported(ir, feature):
+    if feature not in ir.unsupported:
+        ir.unsupported.append(feature)
+
+
+def literal_int(expr):
+    try:
+        return int(str(expr))
+    except ValueError:
+        return str(expr)
+
+
+def lower_expr(expr, alias_map):
+    while isinstance(expr, exp.Paren):
+        expr = expr.this
+
+    op = BINARY.get(type(expr))
+    if op is not None:
+        return (op, lower_expr(expr.this, alias_map), lower_expr(expr.expression, alias_map))
+    if isinstance(expr, exp.Column):
+        return ("col", alias_map.get(expr.table, expr.table), expr.name)
+    if isinstance(expr, exp.Literal):
+        if expr.is_int:
+            return ("lit", "INT", expr.this)
+        if expr.is_number:
+            return ("lit", "REAL", expr.this)
+        return ("lit", "STRING", expr.this)
+    if isinstance(expr, exp.Not):
+        return ("not", lower_expr(expr.this, alias_map))
+    if isinstance(expr, exp.Neg):
+        return ("neg", lower_expr(expr.this, alias_map))
+    if isinstance(expr, exp.Is) and isinstance(expr.expression, exp.Null):
+        return ("is_null", lower_expr(expr.this, alias_map))
+    return ("unsupported", expr.key, expr.sql())
+
+
+# (table, column) pairs referenced in a predicate tree
+def tree_columns(tree):
+    if tree is None:
+        return set()
+    if tree[0] == "col":
+        return {(tree[1], tree[2])}
+    if tree[0] in ["lit", "unsupported"]:
+        return set()
+    found = set()
+    for child in tree[1:]:
+        found |= tree_columns(child)
+    return found
@@ -0,0 +1,42 @@
+# the FROM clause as a join graph: the tables joined left to right, split into blocks of inner
+# joins (whose tables can be reordered freely, their ON conditions are just conjoined) and the
+# outer joins between them, which are the only places where the order matters:
+#   A JOIN B ON p, C LEFT JOIN D ON q JOIN E ON r
+#   -> [("inner", [A, B, C], [p]), ("left", D, q), ("inner", [E], [r])]
+# a RIGHT JOIN of a single table is turned around: A RIGHT JOIN B ON p -> B LEFT JOIN A ON p.
+# The conditions are whatever the caller passes in (IR trees for the encoder, sqlglot nodes for the
+# canonical fast path); nothing here looks into them.
+
+
+# joins: (table, side, on) per join in query order, side "" for inner and comma joins, on None for
+# comma / cross joins. Returns the steps as above; every inner block's tables are in query order
+def join_steps(from_table, joins):
+    steps = [("inner", [from_table], [])]
+    for table, side, on in joins:
+        side = (side or "").lower()
+        if not side:
+            if steps[-1][0] != "inner":
+                steps.append(("inner", [], []))
+            steps[-1][1].append(table)
+            if on is not None:
+                steps[-1][2].append(on)
+        elif side == "right" and len(steps) == 1 and len(steps[0][1]) == 1 and not steps[0][2]:
+            steps = [("inner", [table], []), ("left", steps[0][1][0], on)]
+        else:
+            steps.append((side, table, on))
+    return steps
+
+
+# the tables joined before step i
+def prefix_tables(steps, i):
+    tables = []
+    for step in steps[:i]:
+        tables += step[1] if step[0] == "inner" else [step[1]]
+    return tables
+
+
+# can the conditions of the inner block at step i be moved to WHERE: a condition on the tables
+# joined so far commutes with every later LEFT JOIN (it only reads the preserved side), but a
+# RIGHT or FULL JOIN may null-extend those tables
+def liftable(steps, i):
+    return all(step[0] in ["inner", "left"] for step in steps[i + 1:])
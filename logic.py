@@ -0,0 +1,76 @@
+# logic detection: the encoder records which theories a pair uses while it encodes it
+# (encoder.features), and the solver is created for that SMT-LIB logic (SolverFor("QF_LIA")
+# etc.) instead of the general Solver(), which skips the setup for theories that aren't there.
+# If the specialized solver answers unknown for any reason other than the timeout, the general
+# solver is asked instead.
+#
+# features (a set):
+#   "INT" / "REAL" / "STRING"   column variables or literals of that type
+#   "nonlinear"                 a product of two expressions that both contain columns
+#   "functions"                 uninterpreted functions (NullInt..., LeftJoin/FullJoin)
+#
+# main.py --logic auto (default) picks the logic from the features, --logic none keeps the
+# general solver, --logic QF_LIA (etc.) forces one. The chosen logic is reported per pair
+# ("logic" in the verdict, --stats and the metrics hooks).
+# z3 is only imported once a solver is made, so choosing the logic doesn't load it.
+
+LOGIC = "auto"
+
+
+# the logic to solve a pair with the given features in, or None for the general solver
+def choose_logic(features, logic=None):
+    logic = logic or LOGIC
+    if logic == "none":
+        return None
+    if logic != "auto":
+        return logic
+    return detect_logic(features)
+
+
+def detect_logic(features):
+    ints, reals, strings = "INT" in features, "REAL" in features, "STRING" in features
+    nonlinear, functions = "nonlinear" in features, "functions" in features
+    if strings:
+        # z3's string solver reasons about lengths with integer arithmetic anyway
+        if functions or reals or nonlinear:
+            return None
+        return "QF_SLIA" if ints else "QF_S"
+
+    if ints and reals:
+        arith = "NIRA" if nonlinear else "LIRA"
+    elif reals:
+        arith = "NRA" if nonlinear else "LRA"
+    elif ints:
+        arith = "NIA" if nonlinear else "LIA"
+    else:
+        return None  # propositional only, nothing to specialize
+
+    if functions:
+        if arith not in ["LIA", "LRA", "NIA"]:
+            return None  # no specialized solver for these with functions
+        return "QF_UF" + arith
+    if arith == "NIRA":
+        return None
+    return "QF_" + arith
+
+
+def make_solver(logic, ctx=None):
+    from z3 import Solver, SolverFor
+    return SolverFor(logic, ctx=ctx) if logic else Solver(ctx=ctx)
+
+
+# s.check(), falling back to a general solver over the same assertions if s was specialized to
+# `logic` and gave up. returns (result, solver that produced it, info) where info is
+#   {"logic": "QF_LIA" | None, "fallback": bool}, after a fallback also "reason" (why s gave up)
+def check(s, logic, timeout=None):
+    from z3 import Solver, unknown
+    info = {"logic": logic, "fallback": False}
+    result = s.check()
+    if logic and result == unknown and s.reason_unknown() not in ["timeout", "canceled"]:
+        info["fallback"], info["reason"] = True, s.reason_unknown()
+        general = Solver(ctx=s.ctx)
+        if timeout is not None:
+            general.set("timeout", int(timeout * 1000))
+        general.add(s.assertions())
+        return general.check(), general, info
+    return result, s, info
@@ -1,63 +1,605 @@
+import argparse
+import hashlib
+import itertools
+import json
+import multiprocessing
 import sys
-from sqlglot import expressions as exp
-from parser import parse_schema, parse_query
-from encoder import encode
+import time
+from collections import deque
+from parser import iter_queries, parse_query, parse_query_sql
+from catalog import load_catalog, parse_catalog_sql
+import logic
+import modes
+from exceptions import EquivalenceError
 from sanity_checker import sanity_check
-from z3 import *
+from ir import lower_query
+from canonical import canonically_equivalent, fast_path_stats
+from cache import VerdictCache, schema_fingerprint
+from falsifier import DEFAULT_BUDGET as FALSIFY_BUDGET, falsifier_stats, falsify
+from intervals import decide as decide_intervals, interval_stats
+from metrics import Recorder, has_hooks
+from stringranks import show as show_string
+from portfolio import CONFIGS as PORTFOLIO_CONFIGS, model_values, solve as solve_portfolio
+
+# z3 is loaded by the first encoding, not at startup (encoder.py and cluster.py are imported where they
+# are used): a pair that fails parsing or sanity_check is rejected without initializing it.
+# benchmark.py --cold-start measures the difference
+
+
+def parse_args(argv):
+    ap = argparse.ArgumentParser(usage="python main.py create-table.sql query1.sql query2.sql [options]")
+    ap.add_argument("schema_file", nargs="?")
+    ap.add_argument("q1_file", nargs="?")
+    ap.add_argument("q2_file", nargs="?")
+    ap.add_argument("--candidates", nargs="+", metavar="QUERY",
+                    help="compare query1 against each of these queries, reusing the encoding of query1")
+    ap.add_argument("--candidates-log", metavar="LOG",
+                    help="like --candidates, with the queries read from a .sql file of many statements or a JSONL log")
+    ap.add_argument("--compare", action="store_true",
+                    help="with --candidates, also run every pair independently and report the speedup")
+    ap.add_argument("--cluster", metavar="LOG",
+                    help="group the queries of a .sql / JSONL log into equivalence classes (JSONL to --output)")
+    ap.add_argument("--batch", metavar="JSONL",
+                    help='verify a stream of {"schema", "q1", "q2"} records from this file ("-" for stdin)')
+    ap.add_argument("--output", metavar="JSONL", default="-",
+                    help="where batch results / clusters are written (default stdout)")
+    ap.add_argument("--workers", type=int, default=None,
+                    help="number of batch / log parsing worker processes (default: all cores for --batch, "
+                         "logs are parsed in-process)")
+    ap.add_argument("--timeout", type=float, default=None, help="solver timeout per pair in seconds, reported as unknown")
+    ap.add_argument("--portfolio", nargs="?", const=",".join(PORTFOLIO_CONFIGS), metavar="NAMES",
+                    help="race several solver configurations in parallel and take the first answer "
+                         f"(comma separated subset of: {', '.join(PORTFOLIO_CONFIGS)}; default all)")
+    ap.add_argument("--portfolio-log", metavar="JSONL", help="append which portfolio configuration won to this file")
+    ap.add_argument("--cache", metavar="PATH", help="SQLite file used to cache verdicts across runs")
+    ap.add_argument("--cache-max-entries", type=int, default=100000, help="LRU bound on the number of cached verdicts")
+    ap.add_argument("--cache-max-age", type=float, default=None, help="drop cached verdicts unused for this many seconds")
+    ap.add_argument("--falsify-budget", type=float, default=FALSIFY_BUDGET, metavar="SECONDS",
+                    help="time spent looking for a counterexample by running both queries on small sqlite "
+                         f"databases before encoding (default {FALSIFY_BUDGET}, 0 to skip)")
+    ap.add_argument("--null-encoding", choices=modes.NULL_MODES, default=modes.NULL_MODE,
+                    help="encode NULL with uninterpreted functions (uf) or boolean null flags in three-valued logic (flags)")
+    ap.add_argument("--join-encoding", choices=modes.JOIN_MODES, default=modes.JOIN_MODE,
+                    help="encode outer joins with uninterpreted functions (uf) or boolean match selectors (selectors)")
+    ap.add_argument("--input-encoding", choices=modes.INPUT_MODES, default=modes.INPUT_MODE,
+                    help="give each query its own input variables, asserted equal (separate), or let both read "
+                         "the same ones, encoding common subtrees once (shared)")
+    ap.add_argument("--string-encoding", choices=modes.STRING_MODES, default=modes.STRING_MODE,
+                    help="encode TEXT columns as z3 strings (strings) or, when the queries only compare them, as "
+                         "integer ranks among their literals (ranks)")
+    ap.add_argument("--logic", default=logic.LOGIC, metavar="LOGIC",
+                    help="solver logic: auto (detected from the encoding, default), none (general solver) or "
+                         "an SMT-LIB logic such as QF_LIA")
+    ap.add_argument("--decompose", nargs="?", type=int, const=1, default=None, metavar="THREADS",
+                    help="check independent groups of WHERE conditions as separate pairs, in THREADS threads "
+                         "(default 1), before the check of the whole pair")
+    ap.add_argument("--stats", nargs="?", const="-", metavar="FILE",
+                    help="write phase times, formula size and z3 statistics as JSON to FILE (default stderr)")
+    ap.add_argument("--dump-smt2", metavar="DIR",
+                    help="write every encoded pair to DIR as an .smt2 file with its metadata, for replay.py")
+    ap.add_argument("-v", "--verbose", action="count", default=0,
+                    help="also print the schema, alias maps and the encoded formula (debug output)")
+    ap.add_argument("-q", "--quiet", action="store_true", help="only print the result")
+    args = ap.parse_args(argv)
+    if args.logic not in ["auto", "none"]:
+        from z3 import SolverFor, Z3Exception
+        try:
+            SolverFor(args.logic)
+        except Z3Exception:
+            ap.error(f"unknown logic {args.logic}")
+    if args.portfolio:
+        args.portfolio = args.portfolio.split(",")
+        for name in args.portfolio:
+            if name not in PORTFOLIO_CONFIGS:
+                ap.error(f"unknown portfolio configuration {name}")
+    if args.cluster:
+        if args.schema_file is None or args.q1_file is not None:
+            ap.error("expected create-table.sql --cluster queries.sql")
+    elif args.candidates or args.candidates_log:
+        if None in (args.schema_file, args.q1_file) or args.q2_file is not None:
+            ap.error("expected create-table.sql query1.sql --candidates query2.sql ...")
+    elif not args.batch and None in (args.schema_file, args.q1_file, args.q2_file):
+        ap.error("expected create-table.sql query1.sql query2.sql (or --batch / --candidates)")
+    if args.batch and (args.stats or args.portfolio):
+        ap.error("--stats and --portfolio are not supported with --batch")
+    return args
 
 
 def main():
-    if len(sys.argv) != 4:
-        exit("Usage: python main.py create-table.sql query1.sql query2.sql")
-    schema_file, q1_file, q2_file = sys.argv[1], sys.argv[2], sys.argv[3]
+    global VERBOSITY, DUMP_DIR
+    args = parse_args(sys.argv[1:])
+    VERBOSITY = 0 if args.quiet else 1 + args.verbose
+    DUMP_DIR = args.dump_smt2 # before --batch starts its workers too
+    modes.NULL_MODE = args.null_encoding # before --batch starts its workers, so they inherit them
+    modes.JOIN_MODE = args.join_encoding
+    modes.INPUT_MODE = args.input_encoding
+    modes.STRING_MODE = args.string_encoding
+    logic.LOGIC = args.logic
+    if args.batch:
+        return batch(args.batch, args.output, args.workers, args.timeout,
+                     args.cache, args.cache_max_entries, args.cache_max_age, falsify_budget=args.falsify_budget)
+    if args.cluster:
+        from cluster import cluster_log
+        return cluster_log(load_catalog(args.schema_file), args.cluster, args.output, args.workers, args.timeout)
+    if args.candidates or args.candidates_log:
+        return one_vs_many(args.schema_file, args.q1_file, args.candidates or [], args.timeout, args.compare,
+                           args.candidates_log, args.workers, args.falsify_budget)
+    schema_file, q1_file, q2_file = args.schema_file, args.q1_file, args.q2_file
 
-    # parse the create table queries to get schema 
-    global schema, not_null, null_funcs
-    schema, not_null = parse_schema(schema_file) #e.g. Students: {'id': 'INT', 'name': 'STRING', 'age': 'INT'}
+    # phase timers, formula size and solver statistics for --stats and the metrics hooks
+    rec = Recorder()
 
-    print(f"schema: {schema}") # for debug use 
-    print(f"not null attributes: {not_null}") # for debug use 
+    # parse the create table queries to get schema (or load the compiled catalog cached next to it)
+    global schema, not_null
+    with rec.phase("schema"):
+        schema = load_catalog(schema_file) #e.g. Students: {'id': 'INT', 'name': 'STRING', 'age': 'INT'}
+        not_null = schema.not_null
 
-    # new added
-    null_funcs = [Function("NullInt", IntSort(), BoolSort()), Function("NullString", StringSort(), BoolSort()),
-                   Function("NullReal", RealSort(), BoolSort())]
+    log(DEBUG, lambda: f"schema: {schema}")
+    log(DEBUG, lambda: f"not null attributes: {not_null}")
 
     # parse each query
-    q1_ast = parse_query(q1_file)
-    q2_ast = parse_query(q2_file)
+    with rec.phase("parse"):
+        q1_ast = parse_query(q1_file)
+        q2_ast = parse_query(q2_file)
     # print_ast(schema, q1_ast, q2_ast) # for debug use
 
-    q1_alias_map = build_alias_map(q1_ast)
-    q2_alias_map = build_alias_map(q2_ast)
-    print("q1_alias_map =", q1_alias_map) # for debug use
-    print("q2_alias_map =", q2_alias_map) # for debug use
+    # one pass over each AST builds the IR that sanity_check and the encoder share
+    with rec.phase("lower"):
+        q1, q2 = lower_query(q1_ast), lower_query(q2_ast)
+    log(DEBUG, lambda: f"q1_alias_map = {q1.alias_map}")
+    log(DEBUG, lambda: f"q2_alias_map = {q2.alias_map}")
+
+    try:
+        verdict = "error"  # unless check_parsed returns: sanity_check/encode raise on unsupported queries
+        verdict = check_parsed(args, rec, q1_ast, q2_ast, q1, q2)["verdict"]
+    finally:
+        report = rec.emit(verdict)
+        if args.stats:
+            write_stats(args.stats, report)
+
+
+# cache lookup, sanity_check, fast path, encode and solve for main(), printing as it goes
+def check_parsed(args, rec, q1_ast, q2_ast, q1, q2):
+    # a cached verdict means the pair already passed the checks below under this exact schema
+    cache = None
+    if args.cache:
+        with rec.phase("cache"):
+            cache = VerdictCache(args.cache, args.cache_max_entries, args.cache_max_age)
+            schema_hash = schema_fingerprint(schema, not_null, modes.encoding_options())
+            cached = cache.get(schema_hash, q1_ast, q2_ast)
+        log(INFO, lambda: f"cache: {cache.stats()}")
+        if cached is not None:
+            print_verdict(cached)
+            return cached
 
     # perform some cheap checks over the queries 
-    sanity_check(schema, q1_ast, q2_ast, q1_alias_map, q2_alias_map)
-
-    s = encode(schema, q1_ast, q2_ast, q1_alias_map, q2_alias_map, null_funcs, not_null)
-    print(f"assertions: \n{s.assertions()}") # for debug use
-    print(f"\nresult: {s.check()}")
-    if s.check() == sat :
-        # print(s.model())
-        print_counterexample(schema, s.model())
-    else :
-        print("Query 1 and 2 are equivalent")
+    with rec.phase("sanity"):
+        sanity_check(schema, q1, q2)
+
+    # queries that only differ in aliases, operand order etc. don't need the solver
+    with rec.phase("canonical"):
+        equivalent = canonically_equivalent(schema, q1_ast, q2_ast, q1.alias_map, q2.alias_map)
+    if equivalent:
+        result = {"verdict": "equivalent", "fast_path": "canonical"}
+        print_verdict(result)
+        return result
+
+    # single-table comparisons with literals are decided on intervals, see intervals.py
+    with rec.phase("intervals"):
+        result = decide_intervals(schema, q1, q2)
+    if result is not None:
+        result["fast_path"] = "intervals"
+        print_verdict(result)
+        return result
+
+    # most non-equivalent pairs already differ on a tiny database
+    with rec.phase("falsify"):
+        cex = falsify(schema, q1_ast, q2_ast, q1, q2, args.falsify_budget)
+    if cex is not None:
+        result = {"verdict": "counterexample", "counterexample": cex, "fast_path": "falsifier"}
+        print_verdict(result)
+        if cache is not None:
+            cache.put(schema_hash, q1_ast, q2_ast, result)
+        return result
+
+    # conditions on disjoint columns can be checked one group at a time, see decompose.py
+    if args.decompose:
+        with rec.phase("decompose"):
+            from decompose import check as check_decomposed
+            result = check_decomposed(schema, q1, q2, args.decompose, args.timeout)
+        if result is not None:
+            rec.extra["decomposed"] = result["decomposed"]
+            log(INFO, lambda: f"decomposed into {result['decomposed']['components']} independent components, "
+                              f"{result['decomposed']['solved']} solved")
+            print_verdict(result)
+            if cache is not None:
+                cache.put(schema_hash, q1_ast, q2_ast, result)
+            return result
+
+    with rec.phase("encode"):
+        import encoder
+        s = encoder.encode(schema, q1, q2, null_functions(), not_null)
+    if DUMP_DIR:
+        path = dump_problem(s, schema, not_null, q1_ast, q2_ast, encoder.current.solver_logic)
+        log(INFO, lambda: f"problem written to {path}")
+    if args.timeout is not None:
+        s.set("timeout", int(args.timeout * 1000))
+    log(DEBUG, lambda: f"assertions: \n{s.assertions()}")
+    pruning = encoder.current.pruning
+    if pruning:
+        log(INFO, lambda: f"formula size: {pruning['before']} -> {pruning['after']} after pruning")
+        rec.extra["pruning"] = pruning
+    if args.stats or has_hooks():
+        rec.record_formula(s.assertions())
+
+    if args.portfolio:
+        with rec.phase("solve"):
+            result = solve_with_portfolio(schema, s, args.portfolio, args.timeout, args.portfolio_log)
+        rec.extra["portfolio"] = {"winner": result.get("solver"), **result["portfolio"]}
+        log(INFO, lambda: f"portfolio winner: {result.get('solver')} after {result['portfolio']['elapsed']}s")
+        print_verdict(result)
+    else:
+        with rec.phase("solve"):
+            check, s, info = logic.check(s, encoder.current.solver_logic, args.timeout)
+        rec.record_solver(s)
+        rec.extra["logic"] = info
+        log(INFO, lambda: f"logic: {info['logic'] or 'general'}"
+                          + (f" (fell back to the general solver: {info['reason']})" if info["fallback"] else ""))
+        print(f"\nresult: {check}")
+        from z3 import sat, unsat
+        if check == sat :
+            # print(s.model())
+            with rec.phase("model"):
+                result = {"verdict": "counterexample", "counterexample": extract_counterexample(schema, s.model())}
+            print_counterexample(result["counterexample"])
+        elif check == unsat :
+            result = {"verdict": "equivalent"}
+            print("Query 1 and 2 are equivalent")
+        else :
+            result = {"verdict": "unknown"}
+            print(f"could not decide within the timeout ({s.reason_unknown()})")
+
+    if cache is not None:
+        cache.put(schema_hash, q1_ast, q2_ast, result)
+    return result
+
+
+# output levels of the command line: QUIET (-q) only prints results, INFO (default) adds what the
+# pipeline did (cache, pruning, logic, ...), DEBUG (-v) the parsed schema, alias maps and formula
+QUIET, INFO, DEBUG = 0, 1, 2
+VERBOSITY = INFO
+
+
+# print message() if the verbosity is at least `level`. message is a function, so the text (e.g. a
+# pretty-printed formula, which is expensive for big ones) is only built when it is printed
+def log(level, message):
+    if VERBOSITY >= level:
+        print(message())
 
 
-def build_alias_map(ast):
-    alias_map = {}
-    for tbl in ast.find_all(exp.Table):
-        real = tbl.name  # real table name as string
+# --dump-smt2 DIR: the directory every encoded pair is written to (see dump.py), None for no dumps
+DUMP_DIR = None
 
-        alias_expr = tbl.args.get("alias")
-        if alias_expr:
-            alias = alias_expr.name  # alias string
-            alias_map[alias] = real
+def dump_problem(s, schema, not_null, q1_ast, q2_ast, solver_logic):
+    from dump import write_problem
+    return write_problem(DUMP_DIR, s, schema, not_null, q1_ast, q2_ast, solver_logic)
+
+
+# --stats output: "-" is stderr (stdout carries the human readable output), anything else a file
+def write_stats(path, report):
+    if path == "-":
+        print(json.dumps(report), file=sys.stderr)
+    else:
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+# the NullInt/NullString/NullReal functions (in z3's main context) only need to be declared once per process
+_null_funcs = None
+
+def null_functions():
+    global _null_funcs
+    if _null_funcs is None:
+        import encoder
+        _null_funcs = encoder.null_functions()
+    return _null_funcs
+
+
+# run the whole pipeline on an already parsed pair and return a verdict dict instead of printing it, e.g.
+# {"verdict": "counterexample", "counterexample": {"tables": {...}, "q1_result": True, "q2_result": False}}
+# sanity_check/encode report problems by raising an EquivalenceError (see exceptions.py), which is
+# turned into an "error" verdict. This encodes in z3's main context, so only call it from one thread
+# at a time (e.g. in a pool worker); api.check_equivalence is the thread-safe entry point
+# The metrics report (see metrics.py) goes to the registered hooks, and with stats=True also into
+# the verdict under "stats"
+def verify(schema, not_null, q1_ast, q2_ast, cache=None, timeout=None, portfolio=None, stats=False,
+           falsify_budget=FALSIFY_BUDGET):
+    rec = Recorder()
+    verdict = verify_recorded(rec, schema, not_null, q1_ast, q2_ast, cache, timeout, portfolio, stats,
+                              falsify_budget)
+    if stats or has_hooks():
+        report = rec.emit(verdict["verdict"])
+        if stats:
+            verdict = {**verdict, "stats": report}
+    return verdict
+
+
+def verify_recorded(rec, schema, not_null, q1_ast, q2_ast, cache, timeout, portfolio, detailed, falsify_budget):
+    if cache is not None:
+        with rec.phase("cache"):
+            schema_hash = schema_fingerprint(schema, not_null, modes.encoding_options())
+            cached = cache.get(schema_hash, q1_ast, q2_ast)
+        if cached is not None:
+            return cached
+
+    try:
+        with rec.phase("lower"):
+            q1, q2 = lower_query(q1_ast), lower_query(q2_ast)
+        with rec.phase("sanity"):
+            sanity_check(schema, q1, q2)
+        with rec.phase("canonical"):
+            equivalent = canonically_equivalent(schema, q1_ast, q2_ast, q1.alias_map, q2.alias_map)
+        if equivalent:
+            return {"verdict": "equivalent", "fast_path": "canonical"}
+        with rec.phase("intervals"):
+            verdict = decide_intervals(schema, q1, q2)
+        if verdict is not None:
+            return {**verdict, "fast_path": "intervals"}
+        with rec.phase("falsify"):
+            cex = falsify(schema, q1_ast, q2_ast, q1, q2, falsify_budget)
+        if cex is not None:
+            verdict = {"verdict": "counterexample", "counterexample": cex, "fast_path": "falsifier"}
         else:
-            alias_map[real] = real
+            with rec.phase("encode"):
+                import encoder
+                s = encoder.encode(schema, q1, q2, null_functions(), not_null)
+            if DUMP_DIR:
+                dump_problem(s, schema, not_null, q1_ast, q2_ast, encoder.current.solver_logic)
+            if detailed or has_hooks():
+                rec.record_formula(s.assertions())
+            with rec.phase("solve"):
+                if portfolio:
+                    verdict = solve_with_portfolio(schema, s, portfolio, timeout)
+                else:
+                    if timeout is not None:
+                        s.set("timeout", int(timeout * 1000))  # z3 gives up with unknown instead of hanging
+                    verdict, s = solver_verdict(schema, s, encoder.current.solver_logic, timeout)
+                    rec.record_solver(s)
+    except EquivalenceError as e:
+        return {"verdict": "error", "message": str(e)}
+
+    if cache is not None:
+        cache.put(schema_hash, q1_ast, q2_ast, verdict)  # only definite verdicts are stored
+    return verdict
+
+
+# returns the verdict dict, with the logic the pair was solved in, and the solver that decided it.
+# declared is the encoder's variable map (see extract_counterexample)
+def solver_verdict(schema, s, solver_logic=None, timeout=None, declared=None):
+    from z3 import sat, unsat
+    result, s, info = logic.check(s, solver_logic, timeout)
+    if result == sat:
+        verdict = {"verdict": "counterexample", "counterexample": extract_counterexample(schema, s.model(), declared)}
+    elif result == unsat:
+        verdict = {"verdict": "equivalent"}
+    else:
+        verdict = {"verdict": "unknown", "message": s.reason_unknown()}
+    verdict["logic"] = info["logic"] or "general"
+    if info["fallback"]:
+        verdict["logic_fallback"] = info["reason"]
+    return verdict, s
+
+
+# race the portfolio configurations on the encoded solver and turn the outcome into a verdict dict
+def solve_with_portfolio(schema, s, names, timeout=None, log_path=None):
+    outcome = solve_portfolio(s, names, timeout, log_path)
+    if outcome["result"] == "sat":
+        verdict = {"verdict": "counterexample", "counterexample": extract_counterexample(schema, outcome["values"])}
+    elif outcome["result"] == "unsat":
+        verdict = {"verdict": "equivalent"}
+    else:
+        verdict = {"verdict": "unknown"}
+    verdict["solver"] = outcome["winner"]
+    verdict["portfolio"] = {"elapsed": outcome["elapsed"], "configs": outcome["configs"]}
+    return verdict
+
 
-    return alias_map
+# ---------------------------------------------------------------------------------------------
+# one-vs-many mode: python main.py create-table.sql original.sql --candidates rewrite1.sql rewrite2.sql ...
+# the schema constraints and the encoding of the reference query are asserted once, every
+# candidate is then checked between push() and pop() so z3 keeps what it learned about the
+# reference side from one candidate to the next.
+
+def check_candidates(schema, not_null, ref_ast, candidates, timeout=None, falsify_budget=FALSIFY_BUDGET):
+    import encoder
+    ref = lower_query(ref_ast)
+    s = encoder.encode_reference(schema, ref, null_functions(), not_null)
+    if timeout is not None:
+        s.set("timeout", int(timeout * 1000))
+
+    # candidates are (name, ast) pairs, yields (name, verdict dict)
+    for name, ast in candidates:
+        s.push()
+        try:
+            candidate = lower_query(ast)
+            sanity_check(schema, ref, candidate)
+            cex = None
+            if canonically_equivalent(schema, ref_ast, ast, ref.alias_map, candidate.alias_map):
+                verdict = {"verdict": "equivalent", "fast_path": "canonical"}
+            elif (verdict := decide_intervals(schema, ref, candidate)) is not None:
+                verdict["fast_path"] = "intervals"
+            elif (cex := falsify(schema, ref_ast, ast, ref, candidate, falsify_budget)) is not None:
+                verdict = {"verdict": "counterexample", "counterexample": cex, "fast_path": "falsifier"}
+            else:
+                encoder.encode_candidate(schema, candidate)
+                verdict, _ = solver_verdict(schema, s)
+        except EquivalenceError as e:
+            verdict = {"verdict": "error", "message": str(e)}
+        finally:
+            s.pop()
+        yield name, verdict
+
+
+def one_vs_many(schema_file, ref_file, candidate_files, timeout=None, compare=False, candidate_log=None, workers=None,
+                falsify_budget=FALSIFY_BUDGET):
+    start = time.perf_counter()
+    schema = load_catalog(schema_file)
+    not_null = schema.not_null
+    ref_ast = parse_query(ref_file)
+    candidates = ((f, parse_query(f)) for f in candidate_files)
+    if candidate_log:
+        # statements that don't parse are reported on stderr and skipped
+        candidates = itertools.chain(candidates, iter_queries(candidate_log, workers))
+    if compare:
+        candidates = list(candidates)
+
+    counts = {}
+    for name, verdict in check_candidates(schema, not_null, ref_ast, candidates, timeout, falsify_budget):
+        counts[verdict["verdict"]] = counts.get(verdict["verdict"], 0) + 1
+        print(f"{name}: {verdict['verdict']}" + (f" -- {verdict['message']}" if "message" in verdict else ""))
+        if verdict["verdict"] == "counterexample":
+            print_counterexample(verdict["counterexample"])
+    incremental = time.perf_counter() - start
+    print(f"\n{sum(counts.values())} candidates: {counts} in {incremental:.4f}s")
+    log(INFO, lambda: f"canonical fast path: {fast_path_stats()}")
+    log(INFO, lambda: f"intervals: {interval_stats()}")
+    log(INFO, lambda: f"falsifier: {falsifier_stats()}")
+
+    if compare:
+        # the same work done pair by pair, each one parsing and encoding the reference again
+        start = time.perf_counter()
+        for _, ast in candidates:
+            schema = load_catalog(schema_file, use_cache=False)
+            not_null = schema.not_null
+            verify(schema, not_null, parse_query(ref_file), ast, timeout=timeout, falsify_budget=falsify_budget)
+        independent = time.perf_counter() - start
+        print(f"independent runs: {independent:.4f}s, speedup {independent / incremental:.2f}x")
+    return counts
+
+
+# schema DDL hash -> (catalog, not_null), so a long-running worker parses every schema once
+_schemas = {}
+
+def load_schema_sql(schema_sql):
+    key = hashlib.sha256(schema_sql.encode()).hexdigest()
+    if key not in _schemas:
+        catalog = parse_catalog_sql(schema_sql, key)
+        _schemas[key] = catalog, catalog.not_null
+    return _schemas[key]
+
+
+# verify a pair given as SQL text, like verify() this never exits but returns an "error" verdict
+def check_sql(schema_sql, q1_sql, q2_sql, cache=None, timeout=None, falsify_budget=FALSIFY_BUDGET):
+    start = time.perf_counter()
+    try:
+        schema, not_null = load_schema_sql(schema_sql)
+        q1_ast = parse_query_sql(q1_sql, "q1")
+        q2_ast = parse_query_sql(q2_sql, "q2")
+    except EquivalenceError as e:
+        return {"verdict": "error", "message": str(e)}
+
+    result = verify(schema, not_null, q1_ast, q2_ast, cache=cache, timeout=timeout, falsify_budget=falsify_budget)
+    result["elapsed"] = round(time.perf_counter() - start, 6)
+    return result
+
+
+# ---------------------------------------------------------------------------------------------
+# batch mode: python main.py --batch pairs.jsonl --output verdicts.jsonl --timeout 10
+# each input line is {"schema": "CREATE TABLE ...", "q1": "SELECT ...", "q2": "SELECT ..."}
+# ("schema_file" may replace "schema", any "id" field is copied to the output). Results are
+# written in input order, one JSON object per line, with the line number as "index".
+
+# per-worker state for batch mode
+_batch_cache = None
+
+def init_batch_worker(cache_path, cache_max_entries, cache_max_age):
+    global _batch_cache
+    null_functions()
+    if cache_path:
+        _batch_cache = VerdictCache(cache_path, cache_max_entries, cache_max_age)
+
+
+# the verdict of one input line; any failure, also one of the pipeline's, is an "error" verdict for
+# that record so the rest of the batch goes on
+def check_record(line, timeout, falsify_budget=FALSIFY_BUDGET):
+    try:
+        record = json.loads(line)
+        schema_sql = record.get("schema")
+        if schema_sql is None:
+            with open(record["schema_file"]) as f:
+                schema_sql = f.read()
+        q1_sql, q2_sql = record["q1"], record["q2"]
+    except (ValueError, KeyError, OSError, AttributeError) as e:
+        return {"verdict": "error", "message": f"bad record: {e!r}"}
+    try:
+        return check_sql(schema_sql, q1_sql, q2_sql, cache=_batch_cache, timeout=timeout,
+                         falsify_budget=falsify_budget)
+    except Exception as e:
+        return {"verdict": "error", "message": f"{type(e).__name__}: {e}"}
+
+
+def record_id(line):
+    try:
+        return json.loads(line).get("id")
+    except (ValueError, AttributeError):
+        return None
+
+
+def batch(input_path, output_path="-", workers=None, timeout=None,
+          cache_path=None, cache_max_entries=100000, cache_max_age=None, max_pending=None,
+          falsify_budget=FALSIFY_BUDGET):
+    workers = workers or multiprocessing.cpu_count()
+    # at most max_pending records are read ahead of the output, so memory stays bounded
+    # no matter how long the input is
+    max_pending = max_pending or 4 * workers
+    # the solver timeout should fire first, this only guards against a stuck worker
+    wait = None if timeout is None else timeout + 30
+
+    fin = sys.stdin if input_path == "-" else open(input_path)
+    fout = sys.stdout if output_path == "-" else open(output_path, "w")
+    pool = multiprocessing.Pool(workers, initializer=init_batch_worker,
+                                initargs=(cache_path, cache_max_entries, cache_max_age))
+    window = deque()
+    counts = {}
+
+    def flush_one():
+        index, rid, task = window.popleft()
+        try:
+            result = task.get(wait)
+        except multiprocessing.TimeoutError:
+            result = {"verdict": "unknown", "message": f"no answer within {wait}s"}
+        except Exception as e:  # e.g. a result that can't be sent back from the worker
+            result = {"verdict": "error", "message": f"{type(e).__name__}: {e}"}
+        out = {"index": index}
+        if rid is not None:
+            out["id"] = rid
+        out.update(result)
+        fout.write(json.dumps(out) + "\n")
+        fout.flush()
+        counts[result["verdict"]] = counts.get(result["verdict"], 0) + 1
+        if result.get("fast_path"):
+            counts["fast_path"] = counts.get("fast_path", 0) + 1
+
+    try:
+        for index, line in enumerate(fin):
+            if not line.strip():
+                continue
+            window.append((index, record_id(line), pool.apply_async(check_record, (line, timeout, falsify_budget))))
+            if len(window) >= max_pending:
+                flush_one()
+        while window:
+            flush_one()
+    finally:
+        pool.close()
+        pool.join()
+        if fin is not sys.stdin:
+            fin.close()
+        if fout is not sys.stdout:
+            fout.close()
+
+    print(f"batch done: {counts}", file=sys.stderr)
+    return counts
 
 
 def print_ast(schema, q1_ast, q2_ast) :
@@ -76,33 +618,64 @@ def print_ast(schema, q1_ast, q2_ast) :
     # print(repr(q2_ast))
 
 
-# print an input tuple and the different behaviors q1 and q2 have on it
-def print_counterexample(schema, model): 
-    q1_result = model.evaluate(Bool("q1_result"), model_completion=True)
-    q2_result = model.evaluate(Bool("q2_result"), model_completion=True)
+# collect the input tuple of a counterexample as plain python values:
+# {"tables": {table: {col: value}}, "q1_result": bool, "q2_result": bool}
+# model is either a z3 model or the {name: value} dict built by portfolio.model_values,
+# declared the variable map of the Encoder that built the formula and ranks its string_ranks, which
+# turn the ranks of TEXT columns back into strings (default: both of encoder.current)
+def extract_counterexample(schema, model, declared=None, ranks=None):
+    values = model if isinstance(model, dict) else model_values(model)
+    q1_result = values["q1_result"] == "True"
+    q2_result = values["q2_result"] == "True"
 
-    # group values by table and query index
-    tuples = {}
-    for d in model.decls():
-        name = d.name()
-        val = model[d]
-
-        if name.lower() in ["q1_result", "q2_result"]:
+    # group values by table, using the query 1 (or shared input) variable of a column when there is one.
+    # declared maps every column variable back to its table and column
+    if declared is None:
+        import encoder
+        declared, ranks = encoder.current.declared, encoder.current.string_ranks
+    tuples, nulls = {}, set()
+    for name, val in values.items():
+        if name not in declared:
             continue
+        table, col, idx = declared[name]
+        if idx == "null":
+            if val == "True": # null flag (flags mode)
+                nulls.add((table, col))
+        elif idx == "present":
+            if val == "False": # null-extended by an outer join (selectors join mode)
+                nulls |= {(table, c) for c in schema[table]}
+        elif idx in ["q1", "in"] or (idx == "q2" and col not in tuples.get(table, {})):
+            if ranks is not None and schema[table][col] == "STRING":
+                val = show_string(ranks.string(int(val)))
+            tuples.setdefault(table, {})[col] = val # we only keep one entry per table.column
 
-        parts = name.split("_")
-        if len(parts) < 3:
-            continue
+    for table, col in sorted(nulls, key=lambda key: (key[0], list(schema[key[0]]).index(key[1]))):
+        tuples.setdefault(table, {})[col] = "NULL"
 
-        table = parts[0]
-        col = "_".join(parts[2:])  # skip Q1/Q2 middle part
+    tables = {table: cols for table, cols in tuples.items() if table in schema.keys()}
+    return {"tables": tables, "q1_result": q1_result, "q2_result": q2_result}
 
-        tuples.setdefault(table, {})[col] = val # we only keep one entry per table.column
 
-    for table, cols in tuples.items():
-        if table in schema.keys():
-            attrs_str = ", ".join(f"{k}={v}" for k, v in cols.items())
-            print(f"Table {table}: ({attrs_str})")
+def print_verdict(result):
+    how = " (cached)" if result.get("cached") else ""
+    if result.get("fast_path"):
+        how = f" ({result['fast_path']} fast path, solver not called)"
+    print(f"\nresult: {result['verdict']}{how}")
+    if result["verdict"] == "counterexample":
+        print_counterexample(result["counterexample"])
+    elif result["verdict"] == "equivalent":
+        print("Query 1 and 2 are equivalent")
+
+
+# print an input tuple and the different behaviors q1 and q2 have on it
+def print_counterexample(cex):
+    if "database" in cex:
+        return print_database_counterexample(cex)
+    q1_result, q2_result = cex["q1_result"], cex["q2_result"]
+
+    for table, cols in cex["tables"].items():
+        attrs_str = ", ".join(f"{k}={v}" for k, v in cols.items())
+        print(f"Table {table}: ({attrs_str})")
 
 
     print("Interpretation:")
@@ -114,5 +687,21 @@ def print_counterexample(schema, model):
         print("  -> No difference in outputs (Whoops???).")
 
 
+# a database found by the falsifier (several rows per table, NULL for None) and both query results
+def print_database_counterexample(cex):
+    for table, rows in cex["database"].items():
+        print(f"Table {table}: {len(rows)} row(s)")
+        for row in rows:
+            print("  (" + ", ".join(f"{k}={'NULL' if v is None else repr(v)}" for k, v in row.items()) + ")")
+
+    print("Interpretation:")
+    print(f"  -> Query 1 returns {len(cex['q1_rows'])} row(s): {[tuple(r) for r in cex['q1_rows']]}")
+    print(f"  -> Query 2 returns {len(cex['q2_rows'])} row(s): {[tuple(r) for r in cex['q2_rows']]}")
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    try:
+        main()
+    except EquivalenceError as e:
+        print(e)
+        sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,99 @@
+import sys
+import time
+from contextlib import contextmanager
+
+# instrumentation: phase timers, formula size metrics and z3's solver statistics for one
+# verification, reported as a JSON-serializable dict like
+#   {"phases": {"parse": 0.0012, ..., "solve": 0.0009}, "total": 0.011, "verdict": "equivalent",
+#    "formula": {"assertions": 13, "nodes": 203, "constants": 18, "functions": 3},
+#    "solver": {"conflicts": 2, "decisions": 15, "memory": 19.4, ...}}
+# main.py --stats writes it as JSON. Every report is also passed to the hooks registered with
+# add_hook, e.g. to forward it to a metrics pipeline:
+#   metrics.add_hook(lambda report: statsd.timing("equisql.solve", report["phases"].get("solve", 0)))
+# hooks are per process, so with --batch or server.py they have to be registered in the workers.
+
+_hooks = []
+
+
+def add_hook(hook):
+    _hooks.append(hook)
+
+
+def remove_hook(hook):
+    _hooks.remove(hook)
+
+
+def has_hooks():
+    return bool(_hooks)
+
+
+class Recorder:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.formula = None
+        self.solver = None
+        self.extra = {}
+
+    # with recorder.phase("encode"): ...   -- times add up if a phase is entered more than once
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def record_formula(self, assertions):
+        self.formula = formula_metrics(assertions)
+
+    def record_solver(self, s):
+        self.solver = solver_statistics(s)
+
+    def report(self, verdict=None):
+        report = {"phases": {name: round(t, 6) for name, t in self.phases.items()},
+                  "total": round(time.perf_counter() - self.start, 6)}
+        if verdict is not None:
+            report["verdict"] = verdict
+        if self.formula is not None:
+            report["formula"] = self.formula
+        if self.solver is not None:
+            report["solver"] = self.solver
+        report.update(self.extra)
+        return report
+
+    # build the report and pass it to the hooks; a failing hook is reported, it doesn't fail the check
+    def emit(self, verdict=None):
+        report = self.report(verdict)
+        for hook in list(_hooks):
+            try:
+                hook(report)
+            except Exception as e:
+                print(f"metrics hook {hook!r} failed: {e!r}", file=sys.stderr)
+        return report
+
+
+# assertion count, distinct AST nodes, uninterpreted constants and functions of a formula
+def formula_metrics(assertions):
+    from z3 import Z3_OP_UNINTERPRETED, is_app
+    assertions = list(assertions)
+    seen, constants, functions = set(), set(), set()
+    todo = list(assertions)
+    while todo:
+        e = todo.pop()
+        if e.get_id() in seen:
+            continue
+        seen.add(e.get_id())
+        if is_app(e):
+            decl = e.decl()
+            if decl.kind() == Z3_OP_UNINTERPRETED:
+                (constants if decl.arity() == 0 else functions).add(decl.name())
+            todo.extend(e.children())
+    return {"assertions": len(assertions), "nodes": len(seen),
+            "constants": len(constants), "functions": len(functions)}
+
+
+# z3's statistics of the last check (conflicts, decisions, memory, ...) as a plain dict
+def solver_statistics(s):
+    stats = s.statistics()
+    return {key: stats.get_key_value(key) for key in stats.keys()}
@@ -0,0 +1,46 @@
+# the encoder's modes for this run. They live apart from encoder.py so that the command line can
+# read and set them without importing z3 (see main.py)
+
+# how NULL is encoded, per run (main.py --null-encoding):
+#   "uf"    -- the null functions NullInt/NullString/NullReal (nf) applied to the column terms
+#   "flags" -- a Bool null flag per referenced column, NULL propagated through arithmetic and
+#              comparisons in three-valued logic (see Encoder.encode_condition_3vl). No
+#              uninterpreted functions, so the formula stays in QF_LIA/QF_LRA unless it involves
+#              outer joins or strings; nf is not used
+NULL_MODES = ["uf", "flags"]
+NULL_MODE = "uf"
+
+# how outer joins are encoded, per run (main.py --join-encoding):
+#   "uf"        -- the LeftJoin/FullJoin functions over row identities, with IntVal(-1) as the
+#                  missing row
+#   "selectors" -- a Bool per table selecting whether the compared tuple has its row or is
+#                  null-extended there; the columns of a null-extended table are NULL in ON and
+#                  WHERE (see Encoder.encode_join_selectors). No uninterpreted functions
+JOIN_MODES = ["uf", "selectors"]
+JOIN_MODE = "uf"
+
+# how the input tuple is encoded, per run (main.py --input-encoding):
+#   "separate" -- every query gets its own variables ({table}_q1_{col}, {table}_q2_{col}), and the
+#                 columns both refer to are asserted equal
+#   "shared"   -- one set of variables ({table}_in_{col}) read by both queries. Identical
+#                 subtrees then encode to the same z3 term and are encoded only once, and the
+#                 conjuncts both queries have are factored out of q1_result != q2_result (see
+#                 Encoder.encode_candidate)
+INPUT_MODES = ["separate", "shared"]
+INPUT_MODE = "separate"
+
+# how TEXT columns are encoded, per run (main.py --string-encoding):
+#   "strings" -- z3 String variables and StringVal literals (the sequence solver)
+#   "ranks"   -- Int variables holding the rank of the string among the pair's literals, when the
+#                queries only compare strings (see stringranks.py); queries that do anything else
+#                with them, and candidates in one-vs-many mode, whose literals aren't known when
+#                the reference is encoded, keep "strings"
+STRING_MODES = ["strings", "ranks"]
+STRING_MODE = "strings"
+
+
+# the encoding modes of this run that differ from the defaults, e.g. for cache keys
+def encoding_options():
+    return {name: mode for name, mode, default in [("null_mode", NULL_MODE, "uf"), ("join_mode", JOIN_MODE, "uf"),
+                                                   ("input_mode", INPUT_MODE, "separate"),
+                                                   ("string_mode", STRING_MODE, "strings")] if mode != default}
@@ -1,60 +1,166 @@
+import json
+import multiprocessing
+import os
+import re
 import sys
+from collections import deque
 import sqlglot
-from sqlglot import errors, parse_one
-
-
-# parse schema manually
-def parse_schema(schema_path):
-    with open(schema_path) as f:
-        schema_sql = f.read()
-    schema = {}
-    not_null = {}
-    lines = schema_sql.split(";")
-   
-    sql_data_types = { 
-        "INT": "INT", 
-        "INTEGER": "INT", 
-        "TEXT": "STRING",
-        "REAL": "REAL"
-    }
-    for stmt in lines:
-        stmt = stmt.strip()
-        if stmt.lower().startswith("create table"):
-            name = stmt.split()[2]
-            cols = stmt[stmt.find("(")+1 : stmt.find(")")].split(",")
-            schema[name] = {}
-            not_null[name] = []
-            for c in cols:
-                ls = c.strip().split()
-                cname, ctype = ls[0:2]
-                ctype = ctype.upper()
-
-                if (len(ls) == 4):
-                    if ((ls[2].upper() == "NOT" and ls[3].upper() == "NULL") or 
-                        (ls[2].upper() == "PRIMARY" and ls[3].upper() == "KEY")) :
-                        not_null[name].append(cname)
-                
-                if (ctype not in sql_data_types): 
-                    print("Type", ctype, "is not supported")
-                    sys.exit(1)
-                schema[name][cname] = sql_data_types[ctype]
-    return schema, not_null
+from sqlglot import errors
+from exceptions import ParseError
 
 
 # use sqlglot to parse queries
 def parse_query(query_path):
     with open(query_path) as f: 
         query_sql = f.read()
-    
+    return parse_query_sql(query_sql, query_path)
+
+
+# same as parse_query, but takes the query text as a string
+def parse_query_sql(query_sql, source="query"):
+    # parse once: sqlglot.parse returns every statement in the text (None for empty ones)
+    try:
+        statements = [stmt for stmt in sqlglot.parse(query_sql) if stmt is not None]
+    except sqlglot.errors.ParseError as e:
+        raise ParseError(str(e.errors)) from e
+
+    if len(statements) != 1: 
+        raise ParseError(f"There should be exactly one query in {source}")
+
+    return statements[0]
+
+
+# ---------------------------------------------------------------------------------------------
+# bulk ingestion of query logs: a .sql file with many statements separated by ";" or a JSONL
+# file with one {"id": ..., "sql": ...} record per line. The file is read as a stream and
+# iter_queries yields (query_id, ast) pairs as statements are parsed, each exactly once.
+# A statement that doesn't parse is reported through on_error(query_id, message) and skipped,
+# so one bad query doesn't stop the rest of the log.
+#   query_id: the "id" (or "query_id") field of a JSONL record, otherwise "<file>:<line>" of the
+#             line the statement starts on
+
+# below this size the log is parsed in-process, starting a pool isn't worth it
+PARALLEL_MIN_BYTES = 1 << 20
+# the pool is only used when workers are asked for explicitly: the ASTs are pickled back to the
+# parent, which costs more than parsing them (40k statements, 4.9 MB: 24 s in-process, 65 s with
+# 4 workers on one core), so it needs enough cores to pay off
+# statements sent to a worker at a time
+CHUNK_SIZE = 64
+
+
+def iter_queries(path, workers=1, on_error=None):
+    if on_error is None:
+        on_error = report_error
+    statements = read_statements(path)
+
+    if workers is None:
+        workers = 1
+    parallel = (workers > 1 and os.path.getsize(path) >= PARALLEL_MIN_BYTES
+                and not multiprocessing.current_process().daemon)
+    if parallel:
+        results = parse_parallel(statements, workers)
+    else:
+        results = (parse_statement(item) for item in statements)
+
+    for query_id, ast, error in results:
+        if error is not None:
+            on_error(query_id, error)
+        elif ast is not None:
+            yield query_id, ast
+
+
+def report_error(query_id, message):
+    print(f"query {query_id}: {message}", file=sys.stderr)
+
+
+# (query_id, sql) for every statement in the log, or (query_id, None, error) for broken records
+def read_statements(path):
+    name = os.path.basename(path)
+    with open(path) as f:
+        if path.endswith(".jsonl"):
+            for line_no, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                    query_id = record.get("id", record.get("query_id", f"{name}:{line_no}"))
+                    yield query_id, record.get("sql", record.get("query"))
+                except (ValueError, AttributeError) as e:
+                    yield f"{name}:{line_no}", None, f"bad record: {e!r}"
+        else:
+            for line_no, sql in split_statements(f):
+                yield f"{name}:{line_no}", sql
+
+
+# split a stream of lines into (first line number, statement) at the semicolons that are not
+# inside a string, a quoted identifier or a comment
+STATEMENT_TOKENS = re.compile(r"'|\"|--|/\*|\*/|;")
+
+def split_statements(lines):
+    buffer, start, quote = [], None, None  # quote: the open ', ", /* or None
+    for line_no, line in enumerate(lines, 1):
+        pos = 0
+        for match in STATEMENT_TOKENS.finditer(line):
+            token = match.group()
+            if quote is not None:
+                if (token == quote) or (quote == "/*" and token == "*/"):
+                    quote = None
+                continue
+            if start is None and line[pos:match.start()].strip():
+                start = line_no
+            if token == "--":
+                break  # rest of the line is a comment
+            if token in ["'", "\"", "/*"]:
+                quote = token
+                if start is None:
+                    start = line_no
+            elif token == ";":
+                buffer.append(line[pos:match.start()])
+                if start is not None:
+                    yield start, "".join(buffer).lstrip()
+                buffer, start, pos = [], None, match.end()
+        rest = line[pos:]
+        if start is None and rest.strip() and not rest.strip().startswith("--"):
+            start = line_no
+        buffer.append(rest)
+    if start is not None and "".join(buffer).strip():
+        yield start, "".join(buffer).lstrip()
+
+
+# parse one (query_id, sql) item into (query_id, ast, error); ast is None for empty statements
+def parse_statement(item):
+    if len(item) == 3:
+        return item  # already an error
+    query_id, sql = item
+    if not isinstance(sql, str):
+        return query_id, None, "no sql in record"
     try:
-        ast = sqlglot.transpile(query_sql)
+        statements = [stmt for stmt in sqlglot.parse(sql) if stmt is not None]
     except sqlglot.errors.ParseError as e:
-        print(e.errors)
-        sys.exit(1)
+        return query_id, None, str(e.errors)
+    if len(statements) > 1:
+        return query_id, None, "There should be exactly one query in the record"
+    return query_id, statements[0] if statements else None, None
+
+
+def parse_chunk(chunk):
+    return [parse_statement(item) for item in chunk]
 
-    if len(ast) != 1: 
-        print("There should be exactly one query in", query_path)
-        sys.exit(1)
 
-    ast = parse_one(query_sql)
-    return ast
+# parse chunks of statements in a process pool, keeping the log order. At most 2 chunks per
+# worker are in flight, so the file is still read as a stream
+def parse_parallel(statements, workers):
+    with multiprocessing.Pool(workers) as pool:
+        window = deque()
+        chunk = []
+        for item in statements:
+            chunk.append(item)
+            if len(chunk) == CHUNK_SIZE:
+                window.append(pool.apply_async(parse_chunk, (chunk,)))
+                chunk = []
+                while len(window) >= 2 * workers:
+                    yield from window.popleft().get()
+        if chunk:
+            window.append(pool.apply_async(parse_chunk, (chunk,)))
+        while window:
+            yield from window.popleft().get()
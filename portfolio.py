@@ -0,0 +1,118 @@
+import json
+import multiprocessing
+import queue
+import time
+
+# portfolio solving: the encoded formula is serialized once (SMT-LIB2) and solved under several
+# solver/tactic configurations in parallel processes. The first sat/unsat answer wins and the
+# other processes are terminated. Which configuration won is returned (and can be appended to a
+# JSONL log with --portfolio-log) so the defaults can be tuned on real workloads.
+# z3 is imported by the functions that solve, so reading CONFIGS doesn't load it.
+
+# name -> how to build the solver; "logic" uses SolverFor, "tactics" chains tactics ending in smt,
+# "params" are passed to Solver.set (e.g. a different random seed)
+CONFIGS = {
+    "default": {},
+    "qf_lia": {"logic": "QF_LIA"},
+    "simplify-solve-eqs": {"tactics": ["simplify", "solve-eqs", "smt"]},
+    "propagate-values": {"tactics": ["simplify", "propagate-values", "solve-eqs", "elim-uncnstr", "smt"]},
+    "seed-1": {"params": {"random_seed": 1}},
+    "seed-2": {"params": {"random_seed": 2}},
+}
+
+
+def make_solver(config):
+    from z3 import Solver, SolverFor, Then
+    if "logic" in config:
+        s = SolverFor(config["logic"])
+    elif "tactics" in config:
+        s = Then(*config["tactics"]).solver()
+    else:
+        s = Solver()
+    for key, value in config.get("params", {}).items():
+        s.set(key, value)
+    return s
+
+
+# runs in a child process: rebuild the formula from SMT-LIB2 and report (name, result, values, elapsed)
+def run_config(name, config, smt2, timeout, results):
+    from z3 import Z3Exception, sat
+    start = time.perf_counter()
+    try:
+        s = make_solver(config)
+        if timeout is not None:
+            s.set("timeout", int(timeout * 1000))
+        s.from_string(smt2)
+        r = s.check()
+        values = model_values(s.model()) if r == sat else None
+        results.put((name, str(r), values, time.perf_counter() - start))
+    except Z3Exception as e:
+        results.put((name, f"error: {e}", None, time.perf_counter() - start))
+
+
+# the constants of a model as strings, plus q1_result/q2_result (which z3 may have eliminated)
+def model_values(model):
+    from z3 import Bool
+    values = {d.name(): str(model[d]) for d in model.decls() if d.arity() == 0}
+    for name in ["q1_result", "q2_result"]:
+        values[name] = str(model.evaluate(Bool(name, model.ctx), model_completion=True))
+    return values
+
+
+# race the configurations on solver s; returns a dict with
+#   result:  "sat" | "unsat" | "unknown"
+#   winner:  name of the configuration that answered first (None if none did)
+#   values:  model values for sat (see model_values)
+#   configs: per-configuration outcome of the ones that finished before the race ended
+def solve(s, names=None, timeout=None, log_path=None):
+    names = names or list(CONFIGS)
+    smt2 = s.sexpr()
+    start = time.perf_counter()
+
+    # processes cannot be started from a daemonic worker (e.g. batch/server pools),
+    # run the first configuration in place instead
+    if multiprocessing.current_process().daemon:
+        names = names[:1]
+        results = queue.Queue()
+        run_config(names[0], CONFIGS[names[0]], smt2, timeout, results)
+        procs = []
+    else:
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=run_config, args=(name, CONFIGS[name], smt2, timeout, results))
+                 for name in names]
+        for p in procs:
+            p.start()
+
+    outcome = {"result": "unknown", "winner": None, "values": None, "configs": {}}
+    # the solver timeout stops the children, the extra time only covers process start-up
+    deadline = None if timeout is None else start + timeout + 30
+    try:
+        pending = len(names)
+        while pending:
+            try:
+                name, result, values, elapsed = results.get(timeout=0.5)
+            except queue.Empty:
+                # every child is gone (e.g. crashed) or we are past the deadline
+                if not any(p.is_alive() for p in procs) and results.empty():
+                    break
+                if deadline is not None and time.perf_counter() > deadline:
+                    break
+                continue
+            pending -= 1
+            outcome["configs"][name] = {"result": result, "elapsed": round(elapsed, 6)}
+            if result in ["sat", "unsat"]:
+                outcome.update(result=result, winner=name, values=values)
+                break
+    finally:
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        for p in procs:
+            p.join()
+
+    outcome["elapsed"] = round(time.perf_counter() - start, 6)
+    if log_path:
+        entry = {k: outcome[k] for k in ["result", "winner", "elapsed", "configs"]}
+        with open(log_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+    return outcome
@@ -0,0 +1,163 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from dump import problem_files, read_problem
+
+# re-solves problems dumped with main.py --dump-smt2 (see dump.py) without the schemas or queries
+# they came from, under one or more configurations, and reports the timing distribution of each:
+#   python replay.py dumps/ --python /opt/z3-4.12/bin/python --python /opt/z3-4.13/bin/python
+#   python replay.py dumps/ --options smt.arith.solver=2 --options smt.arith.solver=6 --logic none
+# a configuration is a python interpreter (and so the z3 installed for it) with a set of z3
+# parameters; every --python is combined with every --options. Each one runs in its own process,
+# started with that interpreter on this file (--worker), which prints one JSON line per problem.
+# Problems are solved like main.py solves them (logic.check: the recorded solver logic, falling
+# back to the general solver on unknown), so the times are comparable with --stats.
+
+PERCENTILES = [50, 90, 99]
+
+
+# worker side: solve every problem `repeat` times in this process and print
+# {"file", "result", "time" (median seconds of check), "logic", "fallback"} per problem,
+# after a first line with the z3 version
+def worker(paths, options, solver_logic="recorded", timeout=None, repeat=1):
+    import z3
+    import logic
+    for key, value in options.items():
+        z3.set_param(key, value)
+    print(json.dumps({"z3": z3.get_version_string()}), flush=True)
+    for path in paths:
+        meta, text = read_problem(path)
+        chosen = meta.get("solver_logic") if solver_logic == "recorded" else None if solver_logic == "none" else solver_logic
+        times = []
+        for _ in range(repeat):
+            s = logic.make_solver(chosen)
+            s.from_string(text)
+            if timeout is not None:
+                s.set("timeout", int(timeout * 1000))
+            start = time.perf_counter()
+            result, s, info = logic.check(s, chosen, timeout)
+            times.append(time.perf_counter() - start)
+        print(json.dumps({"file": path, "result": str(result), "time": statistics.median(times),
+                          "logic": info["logic"] or "general", "fallback": info["fallback"]}), flush=True)
+
+
+# parameter values as z3 expects them: numbers and booleans parsed, anything else a string
+def parse_options(text):
+    options = {}
+    for item in filter(None, text.split(",")):
+        key, _, value = item.partition("=")
+        try:
+            options[key.strip()] = json.loads(value)
+        except ValueError:
+            options[key.strip()] = value.strip()
+    return options
+
+
+# runs one configuration in a worker process and returns {"z3", "problems": {file: result}};
+# exits with the worker's stderr if it fails
+def run_config(python, options, paths, solver_logic, timeout, repeat):
+    argv = [python, os.path.abspath(__file__), "--worker", "--options-json", json.dumps(options),
+            "--logic", solver_logic, "--repeat", str(repeat)]
+    if timeout is not None:
+        argv += ["--timeout", str(timeout)]
+    try:
+        proc = subprocess.run(argv + paths, capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)))
+    except OSError as e:
+        sys.exit(f"cannot run {python}: {e}")
+    if proc.returncode != 0:
+        sys.exit(f"worker {python} {json.dumps(options)} failed (exit code {proc.returncode}):\n{proc.stderr.rstrip()}")
+    lines = [json.loads(line) for line in proc.stdout.splitlines() if line.startswith("{")]
+    return {"z3": lines[0]["z3"], "problems": {line["file"]: line for line in lines[1:]}}
+
+
+# {"count", "total", "min", "p50", "p90", "p99", "max"} of a list of seconds
+def distribution(times):
+    times = sorted(times)
+    summary = {"count": len(times), "total": sum(times), "min": times[0], "max": times[-1]}
+    for p in PERCENTILES:
+        summary[f"p{p}"] = times[min(len(times) - 1, len(times) * p // 100)]
+    return {key: round(value, 6) if isinstance(value, float) else value for key, value in summary.items()}
+
+
+def report(configs):
+    names = list(configs)
+    for name, config in configs.items():
+        problems = config["problems"].values()
+        results = {}
+        for problem in problems:
+            results[problem["result"]] = results.get(problem["result"], 0) + 1
+        config["results"] = results
+        config["times"] = distribution([problem["time"] for problem in problems])
+        times = config["times"]
+        print(f"{name}  (z3 {config['z3']})  {results}", file=sys.stderr)
+        print("  " + "  ".join(f"{key}={times[key] * 1000:.2f}ms" for key in ["min", "p50", "p90", "p99", "max", "total"]),
+              file=sys.stderr)
+
+    # definite answers that differ between configurations, and the problems that got slower the most
+    first = names[0]
+    files = configs[first]["problems"]
+    disagreements = []
+    for path in files:
+        answers = {name: configs[name]["problems"][path]["result"] for name in names}
+        if len({answer for answer in answers.values() if answer != "unknown"}) > 1:
+            disagreements.append({"file": path, **answers})
+            print(f"DISAGREE {path}: {answers}", file=sys.stderr)
+    for name in names[1:]:
+        ratios = sorted(((configs[name]["problems"][path]["time"] / max(files[path]["time"], 1e-9), path)
+                         for path in files), reverse=True)
+        print(f"slowest vs {first} under {name}: "
+              + ", ".join(f"{os.path.basename(path)} {ratio:.1f}x" for ratio, path in ratios[:5]), file=sys.stderr)
+    return disagreements
+
+
+def parse_args(argv):
+    ap = argparse.ArgumentParser(usage="python replay.py DIR_OR_FILE [...] [options]")
+    ap.add_argument("paths", nargs="+", help=".smt2 files written by main.py --dump-smt2, or directories of them")
+    ap.add_argument("--python", action="append", metavar="PYTHON",
+                    help="interpreter to solve with, i.e. the z3 installed for it (repeatable, default this one)")
+    ap.add_argument("--options", action="append", metavar="KEY=VALUE,...",
+                    help="z3 parameters of a configuration, e.g. smt.arith.solver=2 (repeatable)")
+    ap.add_argument("--options-json", help=argparse.SUPPRESS)
+    ap.add_argument("--logic", default="recorded",
+                    help="recorded (the logic the pair was encoded for, default), none (general solver) or a logic")
+    ap.add_argument("--timeout", type=float, default=None, help="solver timeout per problem in seconds")
+    ap.add_argument("--repeat", type=int, default=1, help="solves per problem, the median time is kept")
+    ap.add_argument("--output", metavar="JSON", help="write every configuration's results here")
+    ap.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    return ap.parse_args(argv)
+
+
+def main():
+    args = parse_args(sys.argv[1:])
+    if args.worker:
+        return worker(args.paths, json.loads(args.options_json or "{}"), args.logic, args.timeout, args.repeat)
+
+    missing = [path for path in args.paths if not os.path.exists(path)]
+    if missing:
+        sys.exit(f"no such file or directory: {', '.join(missing)}")
+    paths = problem_files(args.paths)
+    if not paths:
+        print("no problems found", file=sys.stderr)
+        return
+    configs = {}
+    for python in args.python or [sys.executable]:
+        for text in args.options or [""]:
+            name = f"{python} {text}".strip()
+            configs[name] = run_config(python, parse_options(text), paths, args.logic, args.timeout, args.repeat)
+            configs[name]["options"] = text
+    print(f"{len(paths)} problems", file=sys.stderr)
+    disagreements = report(configs)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"configs": configs, "disagreements": disagreements}, f, indent=2)
+    if disagreements:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
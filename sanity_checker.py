@@ -1,6 +1,4 @@
-import sys
-from sqlglot import expressions as exp
-from z3 import *
+from exceptions import IncomparableQueriesError, InvalidQueryError, UnsupportedQueryError
 
 
 # perform some simple structural validation before logical reasoning --> fail fast if the inputs are incomparable
@@ -8,139 +6,77 @@ from z3 import *
 # 1.they project the same number of columns and names
 # 2.they reference existing tables/columns
 # 3.they reference the same set of tables
-# 4.they have the same LIMIT and OFFSET 
-def sanity_check(schema, q1_ast, q2_ast, q1_alias_map, q2_alias_map):
-    def extract_select_cols(ast, idx):
-        if (idx == 1):
-            alias_map = q1_alias_map
-        else :
-            alias_map = q2_alias_map
-        columns = []
-        for expr in ast.expressions: 
-            if expr.key == "column": 
-                col_name = expr.args.get("this")
-                if col_name:
-                    columns.append(str(col_name))
+# 4.they have the same LIMIT and OFFSET
+# q1 and q2 are the lowered queries (ir.QueryIR), so nothing here walks the sqlglot AST again
+def sanity_check(schema, q1, q2):
+    q1_cols = extract_select_cols(schema, q1)
+    q2_cols = extract_select_cols(schema, q2)
 
-            elif expr.key == "alias":
-                alias_id = expr.args.get("alias")
-                inner_expr = expr.args.get("this")
-                if alias_id:
-                    columns.append(str(alias_id))
-                else:
-                    columns.append(str(inner_expr))
-                
-            elif (expr.key== "star") :
-                for table in alias_map.values() :
-                    for col in schema[table]:
-                        columns.append(col)
-                
-            else: # something else
-                exit("not supported")
-    
-        return columns
-
-
-    q1_cols = extract_select_cols(q1_ast, 1)
-    q2_cols = extract_select_cols(q2_ast, 2)
-    
     if q1_cols != q2_cols: # same column names
         err_message = (
             f"Queries returns different columns: Query1: {q1_cols} "
             f"vs Query 2: {q2_cols}."
         )
-        exit(err_message)
+        raise IncomparableQueriesError(err_message)
 
     # check column exist in schema
-    i = 1
-    for ast in [q1_ast, q2_ast]:
-        # detech if queries contain operations that are not supported by our verifier 
-        detect_unsupported(ast, i)
+    for i, ir in [(1, q1), (2, q2)]:
+        # detech if queries contain operations that are not supported by our verifier
+        if ir.unsupported:
+            raise UnsupportedQueryError(f"query {i} contains operations that are not supported -- {ir.unsupported}")
 
-        for col in ast.find_all(exp.Column):
-            if (i == 1) :
-                table = q1_alias_map[col.table]
-            else :
-                table = q2_alias_map[col.table]
-                
-            name = col.name
+        for _, table, name in ir.columns:
             if table and table not in schema:
-                exit(f"Unknown table: {table}")
+                raise InvalidQueryError(f"Unknown table: {table}")
             elif table and name not in schema[table]:
-                exit(f"Unknown column: {table}.{name}")
+                raise InvalidQueryError(f"Unknown column: {table}.{name}")
             elif not table:
-                exit(f"Must specify the table for column {name}")
-        
-        i += 1
+                raise InvalidQueryError(f"Must specify the table for column {name}")
 
-    if set(q1_alias_map.values()) != set(q2_alias_map.values()): #order doesn't matter
+    if q1.tables() != q2.tables(): #order doesn't matter
         err_message = (
-            f"Queries do not reference the same set of tables: Query1: {q1_alias_map.values()} vs Query 2: {q2_alias_map.values()}."
+            f"Queries do not reference the same set of tables: Query1: {q1.alias_map.values()} vs Query 2: {q2.alias_map.values()}."
         )
-        exit(err_message)
+        raise IncomparableQueriesError(err_message)
+
 
-    
     # check if LIMIT and OFFSET matches
-    q1_offset, q1_limit, q2_offset, q2_limit = 0, 0, 0, 0
-    if list(q1_ast.find_all(exp.Limit)):
-        q1_offset = list(q1_ast.find_all(exp.Limit))[0]
-        q1_offset = int(str(q1_offset.expression))
-    if list(q2_ast.find_all(exp.Limit)):
-        q2_offset = list(q2_ast.find_all(exp.Limit))[0]
-        q2_offset = int(str(q2_offset.expression))
-    if list(q1_ast.find_all(exp.Offset)):
-        q1_offset = list(q1_ast.find_all(exp.Offset))[0]
-    if list(q2_ast.find_all(exp.Offset)):
-        q2_offset = list(q2_ast.find_all(exp.Offset))[0]
-    
+    q1_offset, q2_offset = q1.offset or 0, q2.offset or 0
     if (q1_offset != q2_offset):
         err_message = (
             f"query1 skips the first {q1_offset} rows from the beginning of the result set, "
             f"while query2 skips the first {q2_offset} rows."
         )
-        exit(err_message)
-    if (q1_limit != q2_limit) :
+        raise IncomparableQueriesError(err_message)
+    if (q1.limit != q2.limit) :
+        q1_limit = "all" if q1.limit is None else q1.limit
+        q2_limit = "all" if q2.limit is None else q2.limit
         err_message = (
-            f"query1 returns {q1_limit} rows at maximum while and query2 returns, while query2 skips the first {q2_limit}."
+            f"query1 returns {q1_limit} rows at maximum, while query2 returns {q2_limit} rows at maximum."
         )
-        exit(err_message)
-
-
-
-def detect_unsupported(ast, idx):
-    unsupported = []
-
-    # GROUP BY and HAVING
-    if list(ast.find_all(exp.Group)):
-        unsupported.append("GROUP BY")
-    if list(ast.find_all(exp.Having)):
-        unsupported.append("HAVING")
-
-    # Aggregation functions
-    for f in list(ast.find_all(exp.Func)):
-        if (f.key.lower() not in ["and", "or"]) :
-            unsupported.append("Aggregation functions")
+        raise IncomparableQueriesError(err_message)
 
-    # DISTINCT
-    if ast.args.get("distinct"):
-        unsupported.append("DISTINCT")
 
-    # UNION / INTERSECT / EXCEPT
-    if list(ast.find_all(exp.Union)):
-        unsupported.append("UNION / INTERSECT / EXCEPT")
+def extract_select_cols(schema, ir):
+    columns = []
+    for proj in ir.projections:
+        if proj[0] in ["column", "alias"]:
+            columns.append(proj[1])
 
-    # Subqueries / EXISTS / IN (with SELECT)
-    if list(ast.find_all(exp.Subquery)):
-        unsupported.append("Subqueries (EXISTS/IN/SELECT in WHERE)")
+        elif proj[0] == "star":
+            for table in ir.alias_map.values() :
+                if table not in schema:
+                    raise InvalidQueryError(f"Unknown table: {table}")
+                for col in schema[table]:
+                    columns.append(col)
 
-    # ORDER BY
-    if list(ast.find_all(exp.Order)):
-        unsupported.append("ORDER BY")
+        else: # something else
+            raise UnsupportedQueryError("not supported")
 
-    if len(unsupported) > 0: 
-        exit(f"query {idx} contains operations that are not supported -- {unsupported}")
+    return columns
 
 
-def exit(err_message):
-    print(err_message)
-    sys.exit(1)
\ No newline at end of file
+# the invariants sanity_check compares, for one query: two queries pass it only if their
+# signatures are equal (and each passes it on its own, see cluster.py)
+def signature(schema, ir):
+    return tuple(extract_select_cols(schema, ir)), frozenset(ir.tables()), ir.limit, ir.offset or 0
@@ -0,0 +1,192 @@
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import socketserver
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# long-running verifier: keeps z3/sqlglot imported, schemas parsed and the null functions declared
+# in a pool of warm worker processes, and answers query pairs over localhost HTTP or a Unix socket.
+#
+# protocol (JSON over HTTP):
+#   POST /check   {"schema": "CREATE TABLE ...", "q1": "SELECT ...", "q2": "SELECT ..."}
+#                 ("schema_file" can be used instead of "schema" to point at a DDL file on disk)
+#            ->   {"verdict": "equivalent" | "counterexample" | "unknown" | "error", ...}
+#   GET  /health  -> {"status": "ok", "workers": N, "pending": M}
+#
+# e.g.  python server.py --socket /tmp/equisql.sock
+#       curl --unix-socket /tmp/equisql.sock -d @pair.json http://localhost/check
+
+
+# ---------------------------------------------------------------------------------------------
+# worker side -- everything below runs inside the pool processes
+
+# per-worker connection to the shared verdict cache (if enabled)
+_cache = None
+
+
+def init_worker(cache_path=None):
+    # the parent handles SIGINT/SIGTERM and shuts the pool down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+
+    # pay for the heavy imports and the null function declarations once, not per request
+    global main
+    import main
+    main.null_functions()
+
+    global _cache
+    if cache_path:
+        from cache import VerdictCache
+        _cache = VerdictCache(cache_path)
+
+
+def check_pair(schema_sql, q1_sql, q2_sql, timeout):
+    # schemas are parsed once per worker and kept by main.load_schema_sql
+    return main.check_sql(schema_sql, q1_sql, q2_sql, cache=_cache, timeout=timeout)
+
+
+# ---------------------------------------------------------------------------------------------
+# server side
+
+class VerifierHandler(BaseHTTPRequestHandler):
+    server_version = "EquiSQL"
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self.reply(404, {"error": f"unknown path {self.path}"})
+        self.reply(200, {"status": "ok", "workers": self.server.workers, "pending": self.server.pending})
+
+    def do_POST(self):
+        if self.path != "/check":
+            return self.reply(404, {"error": f"unknown path {self.path}"})
+        if self.server.stopping.is_set():
+            return self.reply(503, {"error": "server is shutting down"})
+
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length))
+            if not isinstance(request, dict):
+                raise ValueError("expected a JSON object")
+            schema_sql = request.get("schema")
+            if schema_sql is None:
+                with open(request["schema_file"]) as f:
+                    schema_sql = f.read()
+            q1_sql, q2_sql = request["q1"], request["q2"]
+        except (ValueError, KeyError, OSError) as e:
+            return self.reply(400, {"error": f"bad request: {e!r}"})
+
+        # concurrency limit: at most max_pending pairs are queued or running at any time
+        if not self.server.slots.acquire(blocking=False):
+            return self.reply(503, {"error": "too many pending requests"})
+        try:
+            with self.server.lock:
+                self.server.pending += 1
+            timeout = self.server.pair_timeout
+            task = self.server.pool.apply_async(check_pair, (schema_sql, q1_sql, q2_sql, timeout))
+            status = 200
+            try:
+                # z3 gives up after `timeout` on its own, this only guards against a stuck worker
+                result = task.get(None if timeout is None else timeout + 30)
+            except multiprocessing.TimeoutError:
+                result = {"verdict": "unknown", "message": f"no answer within {timeout}s"}
+            except Exception as e:  # the pipeline failed on this pair, the worker itself is fine
+                result, status = {"verdict": "error", "message": f"{type(e).__name__}: {e}"}, 500
+        finally:
+            with self.server.lock:
+                self.server.pending -= 1
+            self.server.slots.release()
+
+        self.reply(status, result)
+
+    def reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            # client_address is an empty string on Unix sockets
+            sys.stderr.write(f"[{self.log_date_time_string()}] {format % args}\n")
+
+
+class TCPVerifierServer(ThreadingHTTPServer):
+    daemon_threads = False  # let in-flight requests finish on shutdown
+    block_on_close = True
+
+
+class UnixVerifierServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = False
+    block_on_close = True
+
+
+def make_server(args):
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        server = UnixVerifierServer(args.socket, VerifierHandler)
+        where = f"unix:{args.socket}"
+    else:
+        server = TCPVerifierServer((args.host, args.port), VerifierHandler)
+        where = f"http://{args.host}:{server.server_port}"
+
+    server.workers = args.workers
+    server.pending = 0
+    server.lock = threading.Lock()
+    server.slots = threading.BoundedSemaphore(args.max_pending)
+    server.pair_timeout = args.timeout
+    server.verbose = args.verbose
+    server.stopping = threading.Event()
+    server.pool = multiprocessing.Pool(args.workers, initializer=init_worker, initargs=(args.cache,))
+    return server, where
+
+
+def serve(args):
+    server, where = make_server(args)
+
+    # graceful shutdown: stop accepting, let running pairs finish, then stop the workers
+    def stop(signum, frame):
+        if not server.stopping.is_set():
+            server.stopping.set()
+            print("shutting down ...", file=sys.stderr)
+            threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    print(f"EquiSQL verifier listening on {where} with {args.workers} workers", file=sys.stderr)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()  # waits for handler threads
+        server.pool.close()
+        server.pool.join()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+def parse_args(argv):
+    ap = argparse.ArgumentParser(description="Long-running EquiSQL verifier")
+    ap.add_argument("--host", default="127.0.0.1", help="address to listen on (default 127.0.0.1)")
+    ap.add_argument("--port", type=int, default=8765, help="port to listen on (default 8765)")
+    ap.add_argument("--socket", help="listen on this Unix socket instead of TCP")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    ap.add_argument("--max-pending", type=int, default=None,
+                    help="maximum number of queued + running pairs before returning 503 (default 4 * workers)")
+    ap.add_argument("--timeout", type=float, default=None, help="solver timeout per pair in seconds, answered as unknown")
+    ap.add_argument("--cache", metavar="PATH", help="SQLite file shared by the workers to cache verdicts")
+    ap.add_argument("--verbose", action="store_true", help="log every request")
+    args = ap.parse_args(argv)
+    if args.max_pending is None:
+        args.max_pending = 4 * args.workers
+    return args
+
+
+if __name__ == "__main__":
+    serve(parse_args(sys.argv[1:]))
@@ -0,0 +1,104 @@
+# TEXT columns as integers (main.py --string-encoding ranks): when strings are only compared
+# (=, <, <=, >, >=) with each other and with literals, all that matters about a string is where it
+# falls among the literals, so every TEXT column can be an Int and the solver stays out of the
+# string theory. The n literals of the pair, sorted, get the ranks W, 2W, ..., nW, and the W - 1
+# ranks strictly between two of them (or below the first, above the last) stand for the other
+# strings between those literals:
+#   name = 'alice' OR name > 'bob'    W = 2 (one TEXT column)
+#   rank:   1     2        3      4     5
+#           < 'alice'  'alice'  between  'bob'  > 'bob'
+# W is one more than the number of TEXT columns the pair reads, so the columns always have enough
+# ranks to be all different inside one gap. Some gaps hold fewer strings than that ('a' < 'a\0'
+# have none in between, '' has nothing below it), and only that many of their ranks are allowed
+# (see excluded). Every assignment of allowed ranks is then realized by strings in the same order,
+# which is what string() builds for counterexamples.
+# Queries whose string operands are anything but columns and literals (LIKE, ||, functions --
+# whatever the IR doesn't know) keep the String encoding.
+
+
+class StringRanks:
+    def __init__(self, literals, columns):
+        self.literals = sorted(literals)
+        self.width = columns + 1
+        self.ranks = {text: (i + 1) * self.width for i, text in enumerate(self.literals)}
+        self.top = (len(self.literals) + 1) * self.width - 1  # the largest rank, the last one above every literal
+
+    def rank(self, text):
+        return self.ranks[text]
+
+    # the (low, high) ranges of ranks, both ends inclusive, no column may take. Ranks go from 1 to top
+    def excluded(self):
+        ranges = []
+        for gap in range(len(self.literals)):
+            size = self.gap_size(gap)
+            if size < self.width - 1:
+                ranges.append((gap * self.width + 1 + size, (gap + 1) * self.width - 1))
+        return ranges
+
+    # how many strings lie strictly between the literals around gap i (gap i is below literal i);
+    # only finite when the upper one is the lower one followed by NULs
+    def gap_size(self, gap):
+        low = self.literals[gap - 1] if gap > 0 else None
+        high = self.literals[gap]
+        base = "" if low is None else low
+        rest = high[len(base):]
+        if not high.startswith(base) or rest.strip("\0"):
+            return self.width
+        return len(rest) if low is None else len(rest) - 1
+
+    # a string with this rank: the literal, or the (rank - gap start)-th of increasing strings in its gap
+    def string(self, rank):
+        gap, slot = divmod(rank, self.width)
+        if slot == 0:
+            return self.literals[gap - 1]
+        low = self.literals[gap - 1] if gap > 0 else None
+        high = self.literals[gap] if gap < len(self.literals) else None
+        base = "" if low is None else low
+        digits = str(slot).zfill(len(str(self.width - 1)))
+        if high is None or not high.startswith(base):
+            return f"{base}_{digits}"
+        rest = high[len(base):]
+        if not rest.strip("\0"):
+            return base + "\0" * (slot if low is not None else slot - 1)
+        # the first non-NUL character of what follows base in high, lowered: smaller than high
+        nuls = len(rest) - len(rest.lstrip("\0"))
+        return base + rest[:nuls] + chr(ord(rest[nuls]) - 1) + "_" + digits
+
+
+# the ranks for a pair of lowered queries, or None when they use strings in ways ranks can't express
+def string_ranks(schema, q1, q2):
+    literals, columns = set(), set()
+    for ir in [q1, q2]:
+        if ir.unsupported:
+            return None
+        for tree in [ir.where] + [join.on for join in ir.joins]:
+            if not collect_strings(tree, schema, literals, columns):
+                return None
+    if not columns:
+        return None
+    return StringRanks(literals, len(columns))
+
+
+# adds the string literals and TEXT columns a condition uses; False if it uses strings otherwise
+def collect_strings(tree, schema, literals, columns):
+    if tree is None:
+        return True
+    key = tree[0]
+    if key == "unsupported":
+        return False
+    if key == "lit":
+        if tree[1] == "STRING":
+            literals.add(tree[2])
+        return True
+    if key == "col":
+        if schema[tree[1]][tree[2]] == "STRING":
+            columns.add((tree[1], tree[2]))
+        return True
+    if key in ["add", "sub", "mul", "neg"]:
+        return True  # the encoder rejects arithmetic on strings either way
+    return all(collect_strings(child, schema, literals, columns) for child in tree[1:])
+
+
+# a string as z3 prints String values: quoted, control characters as \u{hex}
+def show(text):
+    return '"' + "".join(c if c >= " " else f"\\u{{{ord(c):x}}}" for c in text) + '"'
@@ -0,0 +1,3 @@
+CREATE TABLE A (id int, x int, y int);
+CREATE TABLE B (id int, x int, y int);
+CREATE TABLE C (id int, x int, y int);
@@ -0,0 +1 @@
+SELECT C.id FROM A JOIN B ON A.id = B.id JOIN C ON C.id = A.id
@@ -0,0 +1 @@
+SELECT B.id FROM C RIGHT JOIN A ON C.id = A.id FULL JOIN B ON C.id = B.id WHERE B.y > 1
@@ -0,0 +1 @@
+SELECT B.id FROM A RIGHT JOIN B ON A.id = B.id JOIN C ON A.id = C.id WHERE B.y > 1